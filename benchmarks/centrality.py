@@ -0,0 +1,87 @@
+"""
+Compare the exact and the approximate betweenness test policies on generated contact networks.
+For each network size and number of sampled sources, report the runtime and how well the approximate
+ranking matches the exact one: overlap of the top ranked nodes (the ones that get tested) and Spearman correlation.
+
+Run from the repository root:
+    python -m benchmarks.centrality --families 100 500 1000 --samples 25 50 100 200
+"""
+import argparse, json, random, time
+
+import numpy as np
+
+from ctns.generator import generate_network
+from ctns.steps import step_edges
+
+from src import centrality
+
+
+def spearman(a, b):
+    """
+    Spearman rank correlation of two arrays
+    """
+
+    rank_a = np.argsort(np.argsort(a))
+    rank_b = np.argsort(np.argsort(b))
+    return float(np.corrcoef(rank_a, rank_b)[0, 1])
+
+
+def top_overlap(exact, approximate, top):
+    """
+    Fraction of the top nodes by exact betweenness that are also in the top nodes by approximate betweenness
+    """
+
+    nodes = np.arange(len(exact))
+    best_exact = set(nodes[np.lexsort((nodes, exact))[::-1]][:top].tolist())
+    best_approximate = set(nodes[np.lexsort((nodes, approximate))[::-1]][:top].tolist())
+    return len(best_exact & best_approximate) / top
+
+
+def timed(function, *args, **kwargs):
+    """
+    Call function with an empty centrality cache, return its result and runtime in seconds
+    """
+
+    centrality._betweenness.clear()
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description = "Exact vs approximate betweenness of the test policies")
+    parser.add_argument("--families", type = int, nargs = "+", default = [100, 500, 1000], help = "Network sizes, in families")
+    parser.add_argument("--samples", type = int, nargs = "+", default = [25, 50, 100, 200], help = "Sampled source nodes")
+    parser.add_argument("--top", type = int, default = 50, help = "Ranked nodes compared, e.g. the daily tests")
+    parser.add_argument("--seed", type = int, default = 0)
+    parser.add_argument("--json", help = "Also write the results to this file")
+    args = parser.parse_args()
+
+    results = list()
+    for n_of_families in args.families:
+        np.random.seed(args.seed)
+        random.seed(args.seed)
+        G = generate_network(n_of_families)
+        step_edges(G, 1)
+
+        exact, exact_time = timed(centrality.betweenness, G)
+        print("families", n_of_families, "nodes", G.vcount(), "edges", G.ecount(), "exact %.3fs" % exact_time)
+        for k in args.samples:
+            centrality.betweenness_samples = k
+            approximate, approximate_time = timed(centrality.betweenness, G, approximate = True)
+            result = dict(n_of_families = n_of_families, nodes = G.vcount(), edges = G.ecount(), samples = k,
+                          exact_seconds = exact_time, approximate_seconds = approximate_time,
+                          speedup = exact_time / approximate_time,
+                          top_overlap = top_overlap(exact, approximate, args.top),
+                          spearman = spearman(exact, approximate))
+            results.append(result)
+            print("  k %4d  %.3fs  speedup %6.1fx  top %d overlap %.2f  spearman %.3f"
+                  % (k, approximate_time, result["speedup"], args.top, result["top_overlap"], result["spearman"]))
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent = 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+Compare the codecs of the dump storage layer on real dumps: for each dump type and codec, report the write and read
+throughput (uncompressed megabytes per second, including pickling) and the compression ratio.
+
+Run from the repository root:
+    python -m benchmarks.dump_codecs --families 300 --steps 50 --dumps full light stream
+"""
+import argparse, json, os, sys, tempfile, time
+
+from src import storage
+from src.dumps import open_dump, dump_file, iter_days, load_series
+from src.simulation import simulate
+
+
+def simulated_nets(n_of_families, number_of_steps, seed):
+    """
+    Contact network of each day of a simulation, kept in memory so that only the dump writer is timed
+    """
+
+    nets = list()
+    with tempfile.TemporaryDirectory() as directory:
+        simulate(n_of_families = n_of_families, number_of_steps = number_of_steps, use_random_seed = True, seed = seed,
+                 dump_type = "light", path = os.path.join(directory, "run"), on_step = lambda index, net: nets.append(net.copy()),
+                 stats = dict())
+    return nets
+
+
+def read(path, dump_type):
+    """
+    Read the whole content of a dump
+    """
+
+    if dump_type in ["full", "stream"]:
+        return sum(1 for net in iter_days(path, dump_type))
+    return load_series(path, dump_type)
+
+
+def main():
+    parser = argparse.ArgumentParser(description = "Write and read throughput of each dump codec")
+    parser.add_argument("--families", type = int, default = 300)
+    parser.add_argument("--steps", type = int, default = 50)
+    parser.add_argument("--dumps", nargs = "+", default = ["full", "light", "stream"], choices = ["full", "light", "stream"])
+    parser.add_argument("--codecs", nargs = "+", default = storage.available_codecs(), choices = storage.available_codecs())
+    parser.add_argument("--repeat", type = int, default = 3, help = "Keep the best of repeated runs")
+    parser.add_argument("--seed", type = int, default = 0)
+    parser.add_argument("--json", help = "Also write the results to this file")
+    args = parser.parse_args()
+
+    nets = simulated_nets(args.families, args.steps, args.seed)
+    results = list()
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "run")
+        for dump_type in args.dumps:
+            raw_bytes = None
+            for codec in args.codecs:
+                storage.dump_codec = codec
+                write_seconds = read_seconds = float("inf")
+                for repeat in range(args.repeat):
+                    start = time.perf_counter()
+                    writer = open_dump(path, dump_type, dict())
+                    for net in nets:
+                        writer.append(net)
+                    writer.close()
+                    write_seconds = min(write_seconds, time.perf_counter() - start)
+
+                    start = time.perf_counter()
+                    read(path, dump_type)
+                    read_seconds = min(read_seconds, time.perf_counter() - start)
+
+                file_bytes = os.path.getsize(dump_file(path, dump_type))
+                raw_bytes = file_bytes if codec == "none" else raw_bytes
+                result = dict(dump_type = dump_type, codec = codec, level = storage.codec_levels.get(codec), file_bytes = file_bytes,
+                              write_seconds = write_seconds, read_seconds = read_seconds)
+                if raw_bytes is not None:
+                    result.update(ratio = raw_bytes / file_bytes,
+                                  write_mb_s = raw_bytes / write_seconds / 1e6, read_mb_s = raw_bytes / read_seconds / 1e6)
+                results.append(result)
+                print("%-7s %-5s %10d bytes  ratio %5.2f  write %7.3fs %8.1f MB/s  read %7.3fs %8.1f MB/s"
+                      % (dump_type, codec, file_bytes, result.get("ratio", float("nan")), write_seconds, result.get("write_mb_s", float("nan")),
+                         read_seconds, result.get("read_mb_s", float("nan"))), file = sys.stderr)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent = 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,265 @@
+"""
+Time each stage of the simulator pipeline over a grid of scenarios and flag regressions against a stored baseline.
+
+Stages, for each scenario of the grid:
+    simulate   the simulation without the dump writer
+    write      the dump writer (appending each day and closing the file)
+    read       loading the dump content
+    aggregate  the daily series from the loaded content
+    figures    the sim_results payload and the figures built from it
+
+Run from the repository root:
+    python -m benchmarks.pipeline run --families 100 500 --steps 50 --policies Random "Degree Centrality" --dumps light full --output new.json
+    python -m benchmarks.pipeline compare baseline.json new.json --threshold 0.2
+"""
+import argparse, itertools, json, os, pickle, platform, subprocess, sys, tempfile, time, tracemalloc
+from pathlib import Path
+
+from src import cache, centrality, simulation
+from src.aggregation import aggregate_nets, aggregate_columns, series_names
+from src.dumps import dump_types, dump_file, iter_days, read_columnar
+from src.figures import build_figures, read_payload, results_payload
+from src.storage import open_read
+from src.simulation import policies_test, simulate
+
+
+stages = ["simulate", "write", "read", "aggregate", "figures"]
+
+
+class TimedWriter:
+    """
+    Wrap a dump writer to measure the time spent writing the dump
+    """
+
+    def __init__(self, writer, timings):
+        self.writer = writer
+        self.timings = timings
+
+    def append(self, net):
+        start = time.perf_counter()
+        self.writer.append(net)
+        self.timings["write"] += time.perf_counter() - start
+
+    def repeat(self, days):
+        start = time.perf_counter()
+        self.writer.repeat(days)
+        self.timings["write"] += time.perf_counter() - start
+
+    def close(self):
+        start = time.perf_counter()
+        self.writer.close()
+        self.timings["write"] += time.perf_counter() - start
+
+
+def read_dump(path, dump_type):
+    """
+    Load the content of a dump, as needed by aggregate_dump
+    """
+
+    if dump_type == "columnar":
+        dump = read_columnar(dump_file(path, dump_type))
+        return {name: dump[name][:] for name in ["agent_status", "test_result", "quarantine"]}
+    if dump_type in ["full", "stream"]:
+        return list(iter_days(path, dump_type))
+    with open_read(dump_file(path, dump_type)) as f:
+        return pickle.load(f)
+
+
+def aggregate_dump(content, dump_type):
+    """
+    Compute the daily series from the content returned by read_dump
+    """
+
+    if dump_type == "columnar":
+        return aggregate_columns(content["agent_status"], content["test_result"], content["quarantine"])
+    if dump_type in ["full", "stream"]:
+        return aggregate_nets(content)
+    return {name: content[name] for name in series_names}
+
+
+def run_stages(scenario, directory, timings, checkpoint = None):
+    """
+    Run all the stages of one scenario, adding the time of each stage to timings.
+    checkpoint(stage) is called at the end of simulate (that includes write), read, aggregate and figures
+
+    Return
+    ------
+    dump_bytes: int
+        Size of the dump file
+
+    """
+
+    path = os.path.join(directory, "run")
+    dump_type = scenario["dump_type"]
+    # cold start: no network or result cache, no cached centrality
+    cache.cache_dir = Path(directory) / "cache"
+    centrality._betweenness.clear()
+
+    open_dump = simulation.open_dump
+    simulation.open_dump = lambda *args: TimedWriter(open_dump(*args), timings)
+    try:
+        write = timings["write"]
+        start = time.perf_counter()
+        simulate(path = path, **scenario)
+        timings["simulate"] += time.perf_counter() - start - (timings["write"] - write)
+    finally:
+        simulation.open_dump = open_dump
+    checkpoint = checkpoint or (lambda stage: None)
+    checkpoint("simulate")
+    dump_bytes = os.path.getsize(dump_file(path, dump_type))
+
+    start = time.perf_counter()
+    content = read_dump(path, dump_type)
+    timings["read"] += time.perf_counter() - start
+    checkpoint("read")
+
+    start = time.perf_counter()
+    series = aggregate_dump(content, dump_type)
+    timings["aggregate"] += time.perf_counter() - start
+    checkpoint("aggregate")
+    del content
+
+    start = time.perf_counter()
+    payload = results_payload(series, series, scenario["number_of_steps"], scenario["initial_day_restriction"], scenario["restriction_duration"])
+    build_figures(read_payload(json.loads(json.dumps(payload))))
+    timings["figures"] += time.perf_counter() - start
+    checkpoint("figures")
+    return dump_bytes
+
+
+def stage_peaks(scenario, directory):
+    """
+    Run the stages of one scenario tracing the memory allocations, return the peak of each stage in bytes.
+    The peak of simulate includes the dump writer
+    """
+
+    peaks = dict()
+
+    def checkpoint(stage):
+        peaks[stage] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.reset_peak()
+
+    tracemalloc.start()
+    try:
+        run_stages(scenario, directory, {stage: 0.0 for stage in stages}, checkpoint)
+    finally:
+        tracemalloc.stop()
+    return peaks
+
+
+def benchmark(args):
+    """
+    Run the grid of scenarios and write the results as JSON
+    """
+
+    results = list()
+    grid = itertools.product(args.families, args.steps, args.policies, args.dumps)
+    for n_of_families, number_of_steps, policy_test, dump_type in grid:
+        scenario = dict(n_of_families = n_of_families, number_of_steps = number_of_steps, n_initial_infected_nodes = args.infected,
+                        initial_day_restriction = number_of_steps // 3, restriction_duration = number_of_steps // 3,
+                        n_test = args.tests, policy_test = policy_test, contact_tracing_efficiency = 0.8,
+                        use_random_seed = True, seed = args.seed, dump_type = dump_type)
+
+        timings = {stage: 0.0 for stage in stages}
+        for repeat in range(args.repeat):
+            with tempfile.TemporaryDirectory() as directory:
+                dump_bytes = run_stages(scenario, directory, timings)
+        result = dict(scenario, dump_bytes = dump_bytes, stages = {stage: dict(seconds = timings[stage] / args.repeat) for stage in stages})
+
+        if not args.no_memory:
+            with tempfile.TemporaryDirectory() as directory:
+                for stage, peak in stage_peaks(scenario, directory).items():
+                    result["stages"][stage]["peak_bytes"] = peak
+
+        results.append(result)
+        print(n_of_families, number_of_steps, policy_test, dump_type,
+              "  ".join("%s %.3fs" % (stage, result["stages"][stage]["seconds"]) for stage in stages), file = sys.stderr)
+
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output = True, text = True).stdout.strip()
+    except OSError:
+        commit = None
+    report = dict(meta = dict(created = time.strftime("%Y-%m-%dT%H:%M:%S"), commit = commit, python = platform.python_version(),
+                              machine = platform.machine(), repeat = args.repeat),
+                  results = results)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent = 1)
+    else:
+        json.dump(report, sys.stdout, indent = 1)
+
+
+def result_key(result):
+    return (result["n_of_families"], result["number_of_steps"], result["policy_test"], result["dump_type"])
+
+
+def compare(args):
+    """
+    Compare two reports, flag the stages slower (or using more memory) than the baseline by more than the threshold.
+    Exit with status 1 if any regression is found
+    """
+
+    with open(args.baseline) as f:
+        baseline = {result_key(result): result for result in json.load(f)["results"]}
+    with open(args.current) as f:
+        current = json.load(f)["results"]
+
+    regressions = 0
+    for result in current:
+        key = result_key(result)
+        if key not in baseline:
+            print("%-45s not in the baseline" % (key,))
+            continue
+        for stage in stages:
+            for metric in ["seconds", "peak_bytes"]:
+                old = baseline[key]["stages"].get(stage, {}).get(metric)
+                new = result["stages"].get(stage, {}).get(metric)
+                if old is None or new is None:
+                    continue
+                # ignore tiny absolute differences, they are noise
+                floor = args.min_seconds if metric == "seconds" else args.min_bytes
+                change = (new - old) / old if old > 0 else 0.0
+                flag = ""
+                if change > args.threshold and new - old > floor:
+                    flag = "REGRESSION"
+                    regressions += 1
+                elif change < -args.threshold and old - new > floor:
+                    flag = "improvement"
+                print("%-45s %-10s %-10s %12.4g -> %12.4g  %+7.1f%%  %s" % (key, stage, metric, old, new, 100 * change, flag))
+
+    print(str(regressions) + " regressions")
+    sys.exit(1 if regressions else 0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description = "Benchmark of the simulation, dump and rendering pipeline")
+    commands = parser.add_subparsers(dest = "command", required = True)
+
+    run = commands.add_parser("run", help = "Time each stage over a grid of scenarios")
+    run.add_argument("--families", type = int, nargs = "+", default = [100, 300])
+    run.add_argument("--steps", type = int, nargs = "+", default = [50])
+    run.add_argument("--policies", nargs = "+", default = ["Random"], choices = policies_test)
+    run.add_argument("--dumps", nargs = "+", default = dump_types, choices = dump_types)
+    run.add_argument("--tests", type = int, default = 10, help = "Daily number of tests")
+    run.add_argument("--infected", type = int, default = 10, help = "Initial infected nodes")
+    run.add_argument("--seed", type = int, default = 0)
+    run.add_argument("--repeat", type = int, default = 1, help = "Average the timings over repeated runs")
+    run.add_argument("--no-memory", action = "store_true", help = "Skip the traced run measuring the peak memory of each stage")
+    run.add_argument("--output", help = "JSON report, default stdout")
+    run.set_defaults(function = benchmark)
+
+    comparison = commands.add_parser("compare", help = "Flag regressions of a report against a baseline report")
+    comparison.add_argument("baseline")
+    comparison.add_argument("current")
+    comparison.add_argument("--threshold", type = float, default = 0.2, help = "Relative change flagged, default 20%%")
+    comparison.add_argument("--min-seconds", type = float, default = 0.01, help = "Ignore smaller time differences")
+    comparison.add_argument("--min-bytes", type = int, default = 1024 * 1024, help = "Ignore smaller memory differences")
+    comparison.set_defaults(function = compare)
+
+    args = parser.parse_args()
+    args.function(args)
+
+
+if __name__ == "__main__":
+    main()
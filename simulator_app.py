@@ -4,8 +4,9 @@ from dash.dependencies import Input, Output
 import dash_bootstrap_components as dbc
 
 from src.app import app, server
-from src.layouts import tab1_content, tab2_content
+from src.layouts import tab1_content, tab2_content, tab3_content, tab4_content
 import src.callbacks
+import src.api
 
 
 # app layout 
@@ -17,6 +18,8 @@ app.layout = dbc.Container(
         [
             dcc.Tab(tab1_content, id ="tab-1", label="Simulator"),
             dcc.Tab(tab2_content, id ="tab-2", label="Statistics"),
+            dcc.Tab(tab3_content, id ="tab-3", label="Parameter sweep"),
+            dcc.Tab(tab4_content, id ="tab-4", label="Results catalog"),
         ],
 
         id="tabs"),
@@ -0,0 +1,66 @@
+"""
+Run a batch of simulator scenarios without the web interface.
+
+The input is a JSONL file, one parameter set per line with the fields of the simulator form, e.g.
+    {"id": "strict", "n_of_families": 500, "social_distance_strictness": 4, "n_test": 20, "n_seeds": 5}
+Missing fields take the initial value of the form. For each item, the output folder gets the daily series in
+series/<id>.npz and a record in manifest.jsonl; summary.json collects the summaries of all the done items.
+Running the same batch again only runs the items that are missing, failed or changed.
+
+    python simulator_batch.py scenarios.jsonl --output simulator_results/batches/nightly --workers 8
+"""
+import argparse, sys, time
+from concurrent.futures import as_completed
+from pathlib import Path
+
+from src import executor
+from src.batch import read_items, pending_items, run_item, append_manifest, write_summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description = "Run a JSONL file of simulator scenarios in parallel")
+    parser.add_argument("input", help = "JSONL file, one parameter set per line")
+    parser.add_argument("--output", help = "Output folder, default simulator_results/batches/<input name>")
+    parser.add_argument("--workers", type = int, default = executor.max_workers, help = "Worker processes, default one for each core")
+    parser.add_argument("--rerun", action = "store_true", help = "Run all the items again, ignoring the manifest")
+    args = parser.parse_args()
+
+    try:
+        items = read_items(args.input)
+    except (OSError, ValueError) as error:
+        parser.error(str(error))
+    directory = Path(args.output or Path("simulator_results/batches") / Path(args.input).stem)
+    directory.mkdir(parents = True, exist_ok = True)
+
+    pending = items if args.rerun else pending_items(items, directory)
+    print(str(len(items) - len(pending)) + " of " + str(len(items)) + " items already done, running " + str(len(pending)), file = sys.stderr)
+
+    executor.max_workers = args.workers
+    pool = executor.get_pool()
+    futures = {pool.submit(run_item, item_id, fields, str(directory)): item_id for item_id, fields in pending}
+    failed = 0
+    start = time.perf_counter()
+    try:
+        for finished, future in enumerate(as_completed(futures), start = 1):
+            item_id = futures[future]
+            try:
+                record = future.result()
+            except Exception as error:
+                record = dict(id = item_id, key = None, state = "failed", error = str(error))
+                failed += 1
+            append_manifest(directory, record)
+            print("[%d/%d] %s %s %.1fs" % (finished, len(futures), item_id, record["state"], time.perf_counter() - start),
+                  file = sys.stderr)
+    except KeyboardInterrupt:
+        # the finished items are in the manifest, the next run goes on from there
+        pool.shutdown(wait = False, cancel_futures = True)
+        print("interrupted, run again to resume", file = sys.stderr)
+        sys.exit(130)
+
+    summary = write_summary(items, directory)
+    print(str(len(summary)) + " items done, " + str(failed) + " failed, results in " + str(directory), file = sys.stderr)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+import numpy as np
+
+
+# daily series available for each simulation, same names of the light dump
+statuses = ['S', 'E', 'I', 'R', 'D']
+series_names = statuses + ['total', 'quarantined', 'tested', 'positive']
+# int8 code of each status in columnar dumps
+status_codes = {status: code for code, status in enumerate(statuses)}
+
+# days reduced at once on (days, nodes) matrices, bounds the size of temporary arrays
+chunk_days = 64
+
+
+def count_network(G):
+    """
+    Count people status, tests and quarantine in the contact network of one day.
+    Each node attribute is read once as a column and reduced with numpy
+
+    Parameters
+    ----------
+    G: ig.Graph()
+        The contact network
+
+    Return
+    ------
+    counts: dict
+        Number of nodes for each name in series_names
+
+    """
+
+    agent_status = np.asarray(G.vs["agent_status"])
+    test_result = np.asarray(G.vs["test_result"])
+    quarantine = np.asarray(G.vs["quarantine"])
+
+    counts = {status: int(np.count_nonzero(agent_status == status)) for status in statuses}
+    counts['total'] = sum(counts[status] for status in statuses)
+    counts['quarantined'] = int(np.count_nonzero(quarantine != 0))
+    counts['tested'] = int(np.count_nonzero(test_result != -1))
+    counts['positive'] = int(np.count_nonzero(test_result == 1))
+    return counts
+
+
+def node_columns(G):
+    """
+    Read the daily state of each node of the contact network of one day as int8 arrays, as stored in columnar dumps
+
+    Parameters
+    ----------
+    G: ig.Graph()
+        The contact network
+
+    Return
+    ------
+    columns: dict
+        agent_status (see status_codes), test_result and quarantine of each node
+
+    """
+
+    return dict(agent_status = np.asarray([status_codes[value] for value in G.vs["agent_status"]], dtype = np.int8),
+                test_result = np.asarray(G.vs["test_result"], dtype = np.int8),
+                quarantine = np.asarray(G.vs["quarantine"], dtype = np.int8))
+
+
+def aggregate_nets(nets):
+    """
+    Compute the daily series of a full dump
+
+    Parameters
+    ----------
+    nets: iterable of ig.Graph()
+        The contact network of each day
+
+    Return
+    ------
+    series: dict
+        A numpy array with one value per day for each name in series_names
+
+    """
+
+    daily = {name: [] for name in series_names}
+    for G in nets:
+        counts = count_network(G)
+        for name in series_names:
+            daily[name].append(counts[name])
+    return {name: np.asarray(values, dtype = np.int64) for name, values in daily.items()}
+
+
+def aggregate_columns(agent_status, test_result, quarantine):
+    """
+    Compute the daily series from (days, nodes) matrices of node attributes, as stored in columnar dumps.
+    Matrices can be memory maps, they are reduced a chunk of days at a time
+
+    Parameters
+    ----------
+    agent_status: np.ndarray of int8
+        Status code of each node on each day, see status_codes
+
+    test_result: np.ndarray
+        Test result of each node on each day
+
+    quarantine: np.ndarray
+        Quarantine days left of each node on each day
+
+    Return
+    ------
+    series: dict
+        A numpy array with one value per day for each name in series_names
+
+    """
+
+    n_days = agent_status.shape[0]
+    series = {name: np.zeros(n_days, dtype = np.int64) for name in series_names}
+    for start in range(0, n_days, chunk_days):
+        days = slice(start, start + chunk_days)
+        status_chunk = np.asarray(agent_status[days])
+        test_chunk = np.asarray(test_result[days])
+        for status, code in status_codes.items():
+            series[status][days] = np.count_nonzero(status_chunk == code, axis = 1)
+        series['quarantined'][days] = np.count_nonzero(np.asarray(quarantine[days]) != 0, axis = 1)
+        series['tested'][days] = np.count_nonzero(test_chunk != -1, axis = 1)
+        series['positive'][days] = np.count_nonzero(test_chunk == 1, axis = 1)
+    series['total'] = sum(series[status] for status in statuses)
+    return series
@@ -0,0 +1,191 @@
+import gzip, inspect, json, uuid
+from pathlib import Path
+
+import numpy as np
+from flask import request, Response, url_for
+
+from src import jobs
+from src.aggregation import series_names
+from src.app import server, session_id
+from src.ensemble import stack_series
+from src.figures import encode
+from src.simulation import form_defaults, form_scenarios, check_parameters
+
+
+# same limits of the simulator form
+max_families = 1000
+max_steps = 1000
+max_seeds = 100
+
+# smaller responses are not worth compressing
+min_gzip_bytes = 1024
+
+api_dir = Path("simulator_results/api")
+
+
+def respond(content, status = 200, headers = None):
+    """
+    Compact JSON response, gzip encoded if the client accepts it
+
+    Parameters
+    ----------
+    content: dict
+        Body of the response
+
+    status: int
+        HTTP status code
+
+    headers: dict
+        Additional headers
+
+    Return
+    ------
+    response: flask.Response
+        The response
+
+    """
+
+    body = json.dumps(content, separators = (",", ":")).encode("utf-8")
+    response = Response(body, status = status, mimetype = "application/json", headers = headers)
+    response.vary.add("Accept-Encoding")
+    if len(body) >= min_gzip_bytes and "gzip" in request.headers.get("Accept-Encoding", ""):
+        response.set_data(gzip.compress(body, compresslevel = 6))
+        response.headers["Content-Encoding"] = "gzip"
+    return response
+
+
+def error(message, status):
+    return respond(dict(error = message), status)
+
+
+def check_form(fields):
+    """
+    Check a parameter set submitted to the API before enqueuing it
+
+    Parameters
+    ----------
+    fields: dict
+        Fields of the simulator form, see form_defaults
+
+    Return
+    ------
+    None
+
+    Raise
+    -----
+    ValueError
+        If a field is unknown, of the wrong type or out of its valid range
+
+    """
+
+    if not isinstance(fields, dict):
+        raise ValueError("Expected a JSON object with the fields of the simulator form")
+    unknown = set(fields) - set(form_defaults)
+    if unknown:
+        raise ValueError("Unknown fields " + ", ".join(sorted(unknown)))
+    form = dict(form_defaults, **fields)
+    for name in ["n_of_families", "number_of_steps", "n_initial_infected_nodes", "incubation_days", "infection_duration",
+                 "initial_day_restriction", "restriction_duration", "social_distance_strictness", "n_test",
+                 "contact_tracing_duration", "n_seeds"]:
+        if not isinstance(form[name], int) or isinstance(form[name], bool):
+            raise ValueError("Invalid " + name + ", expected an integer")
+    for name in ["R_0", "contact_tracing_efficiency"]:
+        if not isinstance(form[name], (int, float)) or isinstance(form[name], bool):
+            raise ValueError("Invalid " + name + ", expected a number")
+    if form["n_of_families"] > max_families:
+        raise ValueError("Invalid number of families. Use at most " + str(max_families) + " families")
+    if form["number_of_steps"] > max_steps:
+        raise ValueError("Invalid number of steps. Use at most " + str(max_steps) + " steps")
+    if form["n_seeds"] < 1 or form["n_seeds"] > max_seeds:
+        raise ValueError("Invalid number of seeds. Use from 1 to " + str(max_seeds) + " seeds")
+
+    scenarios, paths, paths_no_rest = form_scenarios(form, "check")
+    names = inspect.signature(check_parameters).parameters
+    check_parameters(**{name: scenarios[0][name] for name in names})
+
+
+@server.route("/api/simulations", methods = ["POST"])
+def submit_simulation():
+    """
+    Enqueue the simulations of a parameter set, the body is a JSON object with the fields of the simulator form
+    (the missing ones take their initial value in the form). Reply 202 with the job id and the urls to poll,
+    or 429 with a Retry-After header if the server or the session has too many simulations, see jobs.submit
+    """
+
+    fields = request.get_json(silent = True)
+    try:
+        check_form(fields)
+    except ValueError as exception:
+        return error(str(exception), 400)
+
+    # each submission gets its own folder, the results are in the result cache anyway
+    path = api_dir / uuid.uuid4().hex / "run"
+    path.parent.mkdir(parents = True, exist_ok = True)
+    scenarios, paths, paths_no_rest = form_scenarios(fields, path)
+    meta = dict(form_defaults, **fields)
+    meta.update(paths = paths, paths_no_rest = paths_no_rest)
+    try:
+        job_id = jobs.submit(scenarios, meta = meta, record = True, session = session_id())
+    except jobs.Rejected as exception:
+        return respond(dict(error = str(exception), retry_after = exception.retry_after), 429,
+                       headers = {"Retry-After": str(exception.retry_after)})
+
+    status_url = url_for("simulation_status", job_id = job_id)
+    return respond(dict(job_id = job_id, state = "queued", status = status_url,
+                        series = url_for("simulation_series", job_id = job_id)),
+                   202, headers = dict(Location = status_url))
+
+
+@server.route("/api/simulations/<job_id>", methods = ["GET"])
+def simulation_status(job_id):
+    """
+    Status of a job: state (queued, running, done or failed), progress in percent, position in the queue and error message
+    """
+
+    job = jobs.status(job_id)
+    if job["state"] == "unknown":
+        return error("Unknown job " + job_id, 404)
+    return respond(dict(job_id = job_id, state = job["state"], progress = job["progress"], position = job["position"], error = job["error"]))
+
+
+@server.route("/api/simulations/<job_id>/series", methods = ["GET"])
+def simulation_series(job_id):
+    """
+    Daily series of a done job, with and without restriction. Query parameters:
+        start, end  day range as indexes from 0, end excluded (default all the days)
+        names       comma separated series names (default all, see series_names)
+        runs        "all" for the series of each seed, default the median of the ensemble
+    """
+
+    job = jobs.status(job_id)
+    if job["state"] == "unknown" or job["meta"] is None or "paths_no_rest" not in job["meta"]:
+        return error("Unknown job " + job_id, 404)
+    if job["state"] != "done":
+        return respond(dict(job_id = job_id, state = job["state"], progress = job["progress"], error = job["error"]), 409)
+
+    meta = job["meta"]
+    names = request.args.get("names", ",".join(series_names)).split(",")
+    if any(name not in series_names for name in names):
+        return error("Invalid names, use " + ",".join(series_names), 400)
+    all_runs = request.args.get("runs") == "all"
+    try:
+        start = int(request.args.get("start", 0))
+        end = int(request.args["end"]) if "end" in request.args else None
+    except ValueError:
+        return error("Invalid start or end, expected integers", 400)
+    if start < 0 or (end is not None and start > end):
+        return error("Invalid day range, use 0 <= start <= end", 400)
+
+    # sent back by the workers, the dumps may still be written in background
+    runs = jobs.results(job_id)
+    results = dict(job_id = job_id, n_runs = len(meta["paths"]))
+    for arm, paths in [("restriction", meta["paths"]), ("no_restriction", meta["paths_no_rest"])]:
+        stacked = stack_series([runs[str(path)]["series"] for path in paths])
+        days = slice(start, end)
+        if all_runs:
+            results[arm] = {name: [encode(run) for run in stacked[name][:, days]] for name in names}
+        else:
+            results[arm] = {name: encode(np.median(stacked[name][:, days], axis = 0)) for name in names}
+    n_days = stacked["S"].shape[1]
+    results.update(start = min(start, n_days), end = n_days if end is None else min(end, n_days))
+    return respond(results)
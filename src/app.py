@@ -1,6 +1,52 @@
 import dash_bootstrap_components as dbc
 import dash
+import re, uuid
+from flask import Response, abort, g, request, send_file
+
+from src import export, jobs, metrics
+
 app = dash.Dash(external_stylesheets=[dbc.themes.BOOTSTRAP])
 app.title = 'Covid-19 contact simulator'
 
-server = app.server
\ No newline at end of file
+server = app.server
+
+# cookie identifying the browser session, the admission control of src.jobs limits the simulations of each session
+session_cookie = "simulator_session"
+
+
+@server.before_request
+def load_session():
+    g.new_session = session_cookie not in request.cookies
+
+
+@server.after_request
+def save_session(response):
+    if g.get("new_session"):
+        response.set_cookie(session_cookie, uuid.uuid4().hex, httponly = True, samesite = "Lax")
+    return response
+
+
+def session_id():
+    """
+    Id of the session of the current request: its session cookie, or the client address for clients without cookies
+    (e.g. scripts using the REST API)
+    """
+
+    return request.cookies.get(session_cookie) or request.remote_addr
+
+
+# Prometheus metrics of this server process
+@server.route("/metrics")
+def metrics_endpoint():
+    # stats of the dumps written in background since the last poll
+    jobs.drain_updates()
+    return Response(metrics.render(), mimetype = "text/plain; version=0.0.4")
+
+
+# zip bundle of the figures exported in background, see src.export
+@server.route("/exports/<key>.zip")
+def export_download(key):
+    if not re.fullmatch("[0-9a-f]{64}", key) or export.export_status(key)["state"] != "done":
+        abort(404)
+    return send_file(export.bundle_path(key).resolve(), mimetype = "application/zip", as_attachment = True,
+                     download_name = "simulation_figures_" + key[:8] + ".zip")
\ No newline at end of file
@@ -0,0 +1,237 @@
+import hashlib, json, os, re, shutil, tempfile, time, uuid
+from pathlib import Path
+
+import numpy as np
+
+from src import cache
+from src.aggregation import series_names
+from src.jobs import run_cached
+from src.simulation import form_defaults, form_scenarios
+from src.sweep import summarize
+
+
+# item ids are used as file names
+item_id_pattern = re.compile(r"^[A-Za-z0-9_.-]+$")
+
+manifest_name = "manifest.jsonl"
+summary_name = "summary.json"
+series_dir_name = "series"
+
+
+def read_items(file):
+    """
+    Read the parameter sets of a batch, one JSON object per line with the fields of the simulator form
+    (see form_defaults) and an optional "id". Without an id, the item is named after its name_file field or its line
+
+    Parameters
+    ----------
+    file: string
+        Path of the JSONL file, blank lines and lines starting with # are skipped
+
+    Return
+    ------
+    items: list of (string, dict)
+        Id and form fields of each item, in the order of the file
+
+    Raise
+    -----
+    ValueError
+        If a line is not a JSON object, has unknown fields, or an id is invalid or repeated
+
+    """
+
+    items = list()
+    ids = set()
+    with open(file) as f:
+        for number, line in enumerate(f, start = 1):
+            if line.strip() == "" or line.lstrip().startswith("#"):
+                continue
+            try:
+                fields = json.loads(line)
+            except json.JSONDecodeError as error:
+                raise ValueError("Line " + str(number) + ": " + str(error))
+            if not isinstance(fields, dict):
+                raise ValueError("Line " + str(number) + ": expected a JSON object")
+
+            item_id = str(fields.pop("id", fields.pop("name_file", "item_" + str(number))))
+            # accepted for symmetry with the form, without effect here
+            fields.pop("live_update", None)
+            unknown = set(fields) - set(form_defaults)
+            if unknown:
+                raise ValueError("Line " + str(number) + ": unknown fields " + ", ".join(sorted(unknown)))
+            if not item_id_pattern.match(item_id):
+                raise ValueError("Line " + str(number) + ": invalid id " + item_id + ", use letters, digits, _ . -")
+            if item_id in ids:
+                raise ValueError("Line " + str(number) + ": repeated id " + item_id)
+            ids.add(item_id)
+            items.append((item_id, fields))
+    return items
+
+
+def item_key(fields):
+    """
+    Hex digest of the parameters of an item, a done item is rerun only if its parameters change
+    """
+
+    form = dict(form_defaults, **fields)
+    encoded = json.dumps(dict(form, cache_version = cache.cache_version), sort_keys = True, default = str)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+def read_manifest(directory):
+    """
+    Read the manifest of a batch, the record of each finished item appended as a JSON line
+
+    Parameters
+    ----------
+    directory: string
+        Output folder of the batch
+
+    Return
+    ------
+    records: dict
+        Last record of each item id. A line truncated by an interruption is ignored
+
+    """
+
+    records = dict()
+    try:
+        with open(Path(directory) / manifest_name) as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                records[record["id"]] = record
+    except FileNotFoundError:
+        pass
+    return records
+
+
+def append_manifest(directory, record):
+    """
+    Append the record of a finished item to the manifest, flushed to disk so that it survives an interruption
+    """
+
+    with open(Path(directory) / manifest_name, "a") as f:
+        f.write(json.dumps(record) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def pending_items(items, directory):
+    """
+    Select the items still to run: the ones not done yet, failed, changed since their run or whose series file is missing
+
+    Parameters
+    ----------
+    items: list of (string, dict)
+        See read_items
+
+    directory: string
+        Output folder of the batch
+
+    Return
+    ------
+    pending: list of (string, dict)
+        The items to run, in the given order
+
+    """
+
+    records = read_manifest(directory)
+    pending = list()
+    for item_id, fields in items:
+        record = records.get(item_id)
+        if (record is None or record["state"] != "done" or record["key"] != item_key(fields)
+                or not (Path(directory) / record["series"]).exists()):
+            pending.append((item_id, fields))
+    return pending
+
+
+def run_item(item_id, fields, directory):
+    """
+    Simulate one item of a batch inside a worker process: the scenario with restriction and its baseline for each seed.
+    The daily series are saved in <directory>/series/<item_id>.npz, int32 arrays of shape (n_seeds, days) named after
+    series_names for the scenario with restriction and prefixed by no_restr_ for the baseline. The dumps are removed,
+    the full results are still in the result cache
+
+    Parameters
+    ----------
+    item_id: string
+        Id of the item
+
+    fields: dict
+        Fields of the simulator form
+
+    directory: string
+        Output folder of the batch
+
+    Return
+    ------
+    record: dict
+        Manifest record of the item with the summary of each run, see sweep.summarize
+
+    """
+
+    start = time.perf_counter()
+    series_dir = Path(directory) / series_dir_name
+    series_dir.mkdir(parents = True, exist_ok = True)
+
+    work = tempfile.mkdtemp(dir = directory, prefix = "." + item_id + ".")
+    try:
+        scenarios, paths, paths_no_rest = form_scenarios(fields, Path(work) / item_id)
+        runs = {scenario["path"]: run_cached(scenario)[1] for scenario in scenarios}
+        series = [runs[path] for path in paths]
+        series_no_rest = [runs[path] for path in paths_no_rest]
+    finally:
+        shutil.rmtree(work, ignore_errors = True)
+
+    arrays = dict()
+    for name in series_names:
+        arrays[name] = np.stack([run[name] for run in series]).astype(np.int32)
+        arrays["no_restr_" + name] = np.stack([run[name] for run in series_no_rest]).astype(np.int32)
+    target = series_dir / (item_id + ".npz")
+    tmp = str(target) + "." + uuid.uuid4().hex + ".tmp"
+    with open(tmp, "wb") as f:
+        np.savez_compressed(f, **arrays)
+    os.replace(tmp, target)
+
+    return dict(id = item_id,
+                key = item_key(fields),
+                state = "done",
+                series = str(Path(series_dir_name) / target.name),
+                summary = dict(restriction = [summarize(run) for run in series],
+                               no_restriction = [summarize(run) for run in series_no_rest]),
+                seconds = round(time.perf_counter() - start, 3))
+
+
+def write_summary(items, directory):
+    """
+    Write <directory>/summary.json: for each done item, in the order of the batch, its id, parameters and summary
+
+    Parameters
+    ----------
+    items: list of (string, dict)
+        See read_items
+
+    directory: string
+        Output folder of the batch
+
+    Return
+    ------
+    summary: list of dict
+        The content of the file
+
+    """
+
+    records = read_manifest(directory)
+    summary = list()
+    for item_id, fields in items:
+        record = records.get(item_id)
+        if record is not None and record["state"] == "done" and record["key"] == item_key(fields):
+            summary.append(dict(id = item_id, parameters = dict(form_defaults, **fields), summary = record["summary"]))
+    tmp = Path(directory) / (summary_name + ".tmp")
+    with open(tmp, "w") as f:
+        json.dump(summary, f, indent = 1)
+    os.replace(tmp, Path(directory) / summary_name)
+    return summary
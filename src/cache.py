@@ -0,0 +1,128 @@
+import hashlib, json, os, shutil, uuid
+from pathlib import Path
+
+from src.storage import evict_lru, result_suffix
+
+
+# bump to invalidate all the cached results when the simulator changes
+cache_version = 4
+
+cache_dir = Path(os.environ.get("SIMULATOR_CACHE_DIR", "simulator_results/cache"))
+# eviction limits, the least recently used results are removed first
+max_bytes = int(os.environ.get("SIMULATOR_CACHE_BYTES", 512 * 1024 * 1024))
+max_entries = int(os.environ.get("SIMULATOR_CACHE_ENTRIES", 256))
+
+
+def scenario_key(scenario):
+    """
+    Compute the content address of a simulation from its full parameter set
+
+    Parameters
+    ----------
+    scenario: dict
+        Keyword arguments of the simulate call. The output path is not part of the key
+
+    Return
+    ------
+    key: string
+        Hex digest identifying the result, or None if the simulation is not reproducible (random seed not fixed)
+
+    """
+
+    if not scenario.get("use_random_seed"):
+        return None
+    parameters = {name: value for name, value in scenario.items() if name != "path"}
+    parameters["cache_version"] = cache_version
+    encoded = json.dumps(parameters, sort_keys = True, default = str)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+def entry_path(key, suffix):
+    """
+    Return the path of the cached dump of key, suffix is the file extension of the dump, see storage.result_suffix
+    """
+
+    return cache_dir / (key + suffix)
+
+
+def copy_atomic(source, target):
+    """
+    Copy source on target so that readers never see a partially written file
+    """
+
+    tmp = Path(str(target) + "." + uuid.uuid4().hex + ".tmp")
+    try:
+        shutil.copyfile(source, tmp)
+        os.replace(tmp, target)
+    finally:
+        if tmp.exists():
+            tmp.unlink()
+
+
+def fetch(key, target):
+    """
+    Copy the cached result of key on target
+
+    Parameters
+    ----------
+    key: string
+        Key returned by scenario_key
+
+    target: string
+        Path of the dump file to write
+
+    Return
+    ------
+    hit: bool
+        True if the result was in cache and has been copied
+
+    """
+
+    if key is None:
+        return False
+    entry = entry_path(key, result_suffix(target))
+    try:
+        copy_atomic(entry, target)
+        # mark as recently used
+        os.utime(entry)
+    except FileNotFoundError:
+        return False
+    return True
+
+
+def store(key, source):
+    """
+    Add the dump file source to the cache under key, then evict old results if the cache is too big
+
+    Parameters
+    ----------
+    key: string
+        Key returned by scenario_key
+
+    source: string
+        Path of the dump file to cache
+
+    Return
+    ------
+    None
+
+    """
+
+    if key is None:
+        return
+    cache_dir.mkdir(parents = True, exist_ok = True)
+    copy_atomic(source, entry_path(key, result_suffix(source)))
+    evict()
+
+
+def evict():
+    """
+    Remove the least recently used results until the cache fits in max_bytes and max_entries
+
+    Return
+    ------
+    None
+
+    """
+
+    evict_lru([entry for entry in cache_dir.glob("*") if entry.suffix != ".tmp"], max_bytes, max_entries)
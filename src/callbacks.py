@@ -1,39 +1,30 @@
+import dash
+import dash_html_components as html
+import dash_bootstrap_components as dbc
 from dash.dependencies import Input, Output, State
+from dash.exceptions import PreventUpdate
 from pathlib import Path
-import plotly.graph_objs as go
-import glob, os, pickle
-from collections import Counter
+import glob, os, time, uuid
 import igraph as ig
 
-from src.app import app
+from src.app import app, session_id
 
 
 # used to run simulation
-from ctns.contact_network_simulator import run_simulation
+from src import catalog, export, jobs
+from src.metrics import timer
+from src.ensemble import ensemble_statistics
+from src.figures import figure_ids, figure_builders, results_payload, read_payload, catalog_figure
+from src.sweep import sweep_dir, sweep_parameters, sweep_metrics, parse_values, expand_grid, collect, metric_grid
+from src.simulation import form_scenarios
 
 
 
-# on the click event of run_sim button get all parameter value and run simultion then return all graphics
+# on the click event of run_sim button get all parameter value and submit the simulations as a background job
 @app.callback(
-    [Output('graph_sim', 'figure'),
-        Output('graph_sim_without_restr', 'figure'),
-        Output('graph_infected', 'figure'),
-        Output('graph_dead', 'figure'),
-        Output('graph_Inf_daily', 'figure'),
-        Output('graph_dead_daily', 'figure'),
-        Output('graph_total_infected', 'figure'),
-        Output('graph_test', 'figure'),
-
-        # show or hide the componentt
-        Output('graph_sim', 'style'),
-        Output('graph_sim_without_restr', 'style'),
-        Output('graph_infected', 'style'),
-        Output('graph_dead', 'style'),
-        Output('graph_Inf_daily', 'style'),
-        Output('graph_dead_daily', 'style'),
-        Output('graph_total_infected', 'style'),
-        Output('graph_test', 'style'),
-        ],
+    [Output('job_id', 'data'),
+        Output('busy_alert', 'children'),
+        Output('busy_alert', 'is_open')],
     
     # input event
     [Input("run_sim", "n_clicks")], 
@@ -54,12 +45,14 @@ from ctns.contact_network_simulator import run_simulation
         State('contact_tracing_efficiency', 'value'),
         State('contact_tracing_duration', 'value'),
         State('dump_type', 'value'),
-        State('name_file', 'value')]
+        State('name_file', 'value'),
+        State('live_update', 'value'),
+        State('n_seeds', 'value')]
 )
 
-def updateSimulation(n_clicks, n_of_families, number_of_steps, n_initial_infected_nodes, incubation_days, infection_duration, R_0, initial_day_restriction, restriction_duration, social_distance_strictness, restriction_decreasing, n_test , policy_test, contact_tracing_efficiency, contact_tracing_duration, dump_type, name_file):
+def submitSimulation(n_clicks, n_of_families, number_of_steps, n_initial_infected_nodes, incubation_days, infection_duration, R_0, initial_day_restriction, restriction_duration, social_distance_strictness, restriction_decreasing, n_test , policy_test, contact_tracing_efficiency, contact_tracing_duration, dump_type, name_file, live_update, n_seeds):
     """
-    Execute the simulations (with and without restriction) and return graphics with comparison and statistics. Save simulation results and parameters in the folder "simulator_results/" in .pickle file format (overwrite if files already exist)
+    Enqueue the simulations (with and without restriction) as a background job. Results and parameters are saved in the folder "simulator_results/" in .pickle file format, with the extension of the codec if compressed (e.g. .pickle.zst, see storage.dump_codec) (overwrite if files already exist)
 
     Parameters
     ----------
@@ -102,383 +95,447 @@ def updateSimulation(n_clicks, n_of_families, number_of_steps, n_initial_infecte
         Number of avaiable tests
 
     policy_test: string
-        Strategy with which test are made. Can be Random, Degree Centrality, Betweenness Centrality
+        Strategy with which test are made. Can be Random, Degree Centrality, Betweenness Centrality, Approximate Betweenness
 
     contact_tracing_efficiency: float
         The percentage of contacts successfully traced back in the past 14 days
 
+    live_update: list
+        [1] to update the charts day by day while the simulation is running
+
+    n_seeds: int
+        Number of runs with different seeds of each scenario. With more than one seed, the charts show the median and the percentile band of the ensemble
+
 
     Return
     ------
 
-    outputs:list
-        List of all updated grapahics.
-        Save simulation (overwrite if files already exist) results and parameters in the folder "simulator_results/" in .pickle file format.
+    outputs: list
+        Id of the submitted job, polled by pollSimulation, the message shown if the job is rejected and if it is shown
 
     """
    
     # check to avoid first running at the launch of the app and on refresh page
-    if n_clicks is not None:
-
-
-        decrease = False
-        if restriction_decreasing == [1]:
-            decrease = True
-
-        # create dir
-        if not os.path.exists("simulator_results"):
-            os.mkdir("simulator_results")
-
-        path = Path("simulator_results/" + str(name_file))
-         
-        run_simulation( use_steps = True,
-                        n_of_families = n_of_families, 
-                        number_of_steps = number_of_steps,
-                        incubation_days = incubation_days,
-                        infection_duration = infection_duration,
-                        initial_day_restriction = initial_day_restriction,
-                        restriction_duration = restriction_duration,
-                        social_distance_strictness = social_distance_strictness,
-                        restriction_decreasing = decrease,
-                        n_initial_infected_nodes = n_initial_infected_nodes,
-                        R_0 = R_0,
-                        n_test = n_test,
-                        policy_test = policy_test,
-                        contact_tracing_efficiency = contact_tracing_efficiency / 100,
-                        contact_tracing_duration = contact_tracing_duration,
-                        path = str(path),
-                        #use_random_seed = True,
-                        seed = 0,
-                        dump_type = dump_type,
-                        )
-        
-        # list of data to plot
-        S_rest = []
-        I_rest = []
-        E_rest = []
-        R_rest = []
-        D_rest = []
-        tot_rest = []
-        Q_rest = []
-        T_rest = []
-        T_pos = []
-        
-        if dump_type == 'full':
-            dump_full = dict()
-            nets = list()
-            with open(str(path)+'.pickle', "rb") as f:
-                dump_full = pickle.load(f)
-                nets = dump_full['nets']
-            # get daily count of peple status
-            for day in range(0, len(nets)):
-                G = nets[day]
-                report = Counter(G.vs["agent_status"])
-                s = report["S"]
-                e = report["E"]
-                i = report["I"]
-                r = report["R"]
-                d = report["D"]
-                tested = 0
-                quarantined = 0
-                positive = 0
-                for node in G.vs:
-                    if node["test_result"] != -1:
-                        tested += 1
-                    if node["test_result"] == 1:
-                        positive += 1
-                    if node["quarantine"] != 0:
-                        quarantined += 1
-                        
-                S_rest.append(s)
-                E_rest.append(e)
-                I_rest.append(i)
-                R_rest.append(r)
-                D_rest.append(d)
-                tot_rest.append(s + e + i + r +d)
-                
-                Q_rest.append(quarantined)
-                T_rest.append(tested)
-                T_pos.append(positive)
-
-        else:
-            dump_light = dict()
-            with open(str(path)+'.pickle', "rb") as f:
-                dump_light = pickle.load(f)
-            S_rest = dump_light['S']
-            I_rest = dump_light['I']
-            E_rest = dump_light['E']
-            R_rest = dump_light['R']
-            D_rest = dump_light['D']
-            tot_rest = dump_light['total']
-            Q_rest = dump_light['quarantined']
-            T_rest = dump_light['tested']
-            T_pos = dump_light['positive']
-
-            
+    if n_clicks is None:
+        raise PreventUpdate
+
+    # create dir
+    if not os.path.exists("simulator_results"):
+        os.mkdir("simulator_results")
+
+    form = dict(n_of_families = n_of_families,
+                number_of_steps = number_of_steps,
+                n_initial_infected_nodes = n_initial_infected_nodes,
+                incubation_days = incubation_days,
+                infection_duration = infection_duration,
+                R_0 = R_0,
+                initial_day_restriction = initial_day_restriction,
+                restriction_duration = restriction_duration,
+                social_distance_strictness = social_distance_strictness,
+                restriction_decreasing = restriction_decreasing,
+                n_test = n_test,
+                policy_test = policy_test,
+                contact_tracing_efficiency = contact_tracing_efficiency,
+                contact_tracing_duration = contact_tracing_duration,
+                dump_type = dump_type,
+                n_seeds = n_seeds)
+
+    # simulations with and without restriction of each seed, the baseline without restriction does not depend on the
+    # restriction, test and tracing parameters so it is shared by all the scenarios with the same population and disease
+    scenarios, paths, paths_no_rest = form_scenarios(form, Path("simulator_results/" + str(name_file)))
+
+    # everything needed to plot the results once the job is done
+    meta = dict(number_of_steps = number_of_steps,
+                initial_day_restriction = initial_day_restriction,
+                restriction_duration = restriction_duration,
+                dump_type = dump_type,
+                path = paths[0],
+                path_no_rest = paths_no_rest[0],
+                paths = paths,
+                paths_no_rest = paths_no_rest)
+
+    # the scenarios are independent, the job runs them concurrently. Under load it waits its turn or is rejected
+    try:
+        job_id = jobs.submit(scenarios, meta = meta, live = live_update == [1], record = True, session = session_id())
+    except jobs.Rejected as e:
+        return [dash.no_update, str(e) + ", please retry in " + str(e.retry_after) + " seconds", True]
+    return [job_id, "", False]
+
+
+
+# poll the submitted job, show its progress and extend the live charts
+@app.callback(
+    [Output('job_progress', 'value'),
+        Output('job_progress', 'children'),
+        Output('job_progress', 'color'),
+        Output('job_interval', 'disabled'),
+        Output('job_done', 'data'),
+        Output('graph_sim', 'extendData'),
+        Output('graph_infected', 'extendData'),
+        Output('live_sent', 'data')],
+    [Input('job_interval', 'n_intervals'),
+        Input('job_id', 'data')],
+    [State('live_sent', 'data')]
+)
 
+def pollSimulation(n_intervals, job_id, live_sent):
+    """
+    Update the progress bar of the running job. When the job ends stop polling and notify storeResults.
+    For live jobs, send to graph_sim and graph_infected only the days simulated since the last poll
 
-        
-        # list of output to return
-        outputs = []
+    Parameters
+    ----------
+    n_intervals: int
+        Number of ticks of the polling interval
 
-        
-       
-        
-        path_no_rest = Path("simulator_results/" + str(name_file) + "no_restr")
-           
-        run_simulation( use_steps = True,
-                        n_of_families = n_of_families, 
-                        number_of_steps = number_of_steps,
-                        incubation_days = incubation_days,
-                        infection_duration = infection_duration,
-                        initial_day_restriction = initial_day_restriction,
-                        restriction_duration = restriction_duration,
-                        social_distance_strictness = 0,
-                        restriction_decreasing = False,
-                        n_initial_infected_nodes = n_initial_infected_nodes,
-                        R_0 = R_0,
-                        n_test = 0,
-                        policy_test = policy_test,
-                        contact_tracing_efficiency = 0,
-                        contact_tracing_duration = 0,
-                        path = str(path_no_rest),
-                        #use_random_seed = True,
-                        seed = 0,
-                        dump_type = dump_type,
-                        )
-        
-         # daily count
-        S = []
-        I = []
-        E = []
-        R = []
-        D = []
-        tot = []
-        if dump_type == 'full':
-            dump_full = dict()
-            nets = list()
-            with open(str(path_no_rest) +'.pickle', "rb") as f:
-                dump_full = pickle.load(f)
-                nets = dump_full['nets']
-            for day in range(0, len(nets)):
-                G = nets[day]
-                report = Counter(G.vs["agent_status"])
-                s = report["S"]
-                e = report["E"]
-                i = report["I"]
-                r = report["R"]
-                d = report["D"]
-                
-                        
-                S.append(s)
-                E.append(e)
-                I.append(i)
-                R.append(r)
-                D.append(d)
-                tot.append(s + e + i + r +d)
-        else:
-            dump_light = dict()
-            with open(str(path_no_rest) +'.pickle', "rb") as f:
-                dump_light = pickle.load(f)
-            S = dump_light['S']
-            I = dump_light['I']
-            E = dump_light['E']
-            R = dump_light['R']
-            D = dump_light['D']
-            tot = dump_light['total']
-          
-        cut1 = [I_rest[i] + E_rest[i] for i in range(len(E_rest))]
-        cut2 = [I[i] + E[i] for i in range(len(E))]
-
-
-        cut_all = number_of_steps
-        for i in range(len(cut1)):
-            if cut1[i] == 0 and cut2[i] == 0:
-                cut_all = i + 1
-                break
-
-        graph_sim = dict({'data': [],
-                'layout': {
-                   'title': 'Contacts network model with restriction',
-                   'xaxis':{'title':'Day'},
-                   'yaxis':{'title':'Count'}
-               }
-               })
-
-        graph_sim['data'].append({'x': list(range(1, len(S_rest[:cut_all]) +1)), 'y': S_rest[:cut_all],  'name': 'S', 'marker' : {'color': 'Blue'}})
-        graph_sim['data'].append({'x': list(range(1,len(E_rest[:cut_all]) +1)), 'y': E_rest[:cut_all],  'name': 'E', 'marker' : {'color': 'Orange'}})
-        graph_sim['data'].append({'x': list(range(1,len(I_rest[:cut_all]) +1)), 'y': I_rest[:cut_all],  'name': 'I', 'marker' : {'color': 'Red'}})
-        graph_sim['data'].append({'x': list(range(1, len(R_rest[:cut_all]) +1)), 'y': R_rest[:cut_all],  'name': 'R', 'marker' : {'color': 'Green'}})
-        graph_sim['data'].append({'x': list(range(1, len(D_rest[:cut_all]) +1)), 'y': D_rest[:cut_all],  'name': 'deceduti', 'marker' : {'color': 'Black'}})
-        graph_sim['data'].append({'x': list(range(1, len(tot_rest[:cut_all]) +1)), 'y': tot_rest[:cut_all], 'name': 'Total'})
-        graph_sim['data'].append({'x': [initial_day_restriction, initial_day_restriction], 'y':[0, tot_rest[0]], 'type': 'scatter', 'line': dict(color='rgb(55, 83, 109)', dash='dot'), 'name': 'Begin restriction'})
-        graph_sim['data'].append({'x': [initial_day_restriction + restriction_duration, initial_day_restriction + restriction_duration], 'y':[0, tot_rest[0]], 'type': 'scatter', 'line': dict(color='rgb(55, 83, 109)', dash='dot'), 'name': 'End restriction'})
-                         
-               
-            
-
-        graph_sim_without_restr = {'data': [ {'x': list(range(1, len(S[:cut_all]) +1)), 'y': S[:cut_all], 'name': 'S', 'marker' : {'color': 'Blue'}},
-                         {'x': list(range(1,len(E[:cut_all]) +1)), 'y': E[:cut_all], 'name': 'E', 'marker' : {'color': 'Orange'}},
-                         {'x': list(range(1,len(I[:cut_all]) +1)), 'y': I[:cut_all], 'name': 'I', 'marker' : {'color': 'Red'}},
-                         {'x': list(range(1, len(R[:cut_all]) +1)), 'y': R[:cut_all], 'name': 'R', 'marker' : {'color': 'Green'}},
-                         {'x': list(range(1, len(D[:cut_all]) +1)), 'y': D[:cut_all], 'name': 'deceduti', 'marker' : {'color': 'Black'}},
-                         {'x': list(range(1, len(tot[:cut_all]) +1)), 'y': tot, 'name': 'Total'},
-                         {'x': [initial_day_restriction, initial_day_restriction], 'y':[0, tot[0]], 'type': 'scatter', 'line': dict(color='rgb(55, 83, 109)', dash='dot'), 'name': 'Begin restriction'},
-                         {'x': [initial_day_restriction + restriction_duration, initial_day_restriction + restriction_duration], 'y':[0, tot[0]], 'type': 'scatter', 'line': dict(color='rgb(55, 83, 109)', dash='dot'), 'name': 'End restriction'},
-                         ],
-               'layout': {
-                   'title': 'Contacts network model without restriction',
-                   'xaxis':{'title':'Day'},
-                   'yaxis':{'title':'Count'}
-               }
-              }
+    job_id: string
+        Id of the current job
 
-        
+    live_sent: dict
+        Id of the live job and number of days of each scenario already sent to the charts
 
-        # get total infected people (infected + exposed)
-        inf_rest = []
-        inf = []
-        for i in range(max(len(I_rest), len(I))):
-            if i < len(I):      
-                inf.append(I[i] + E[i])
-            else:
-                inf.append(0)
-            if i < len(I_rest):
-                inf_rest.append(I_rest[i] + E_rest[i])
-            else:
-                inf_rest.append(0)
-
-         # con e senza restrizioni
-        graph_infected = {'data': [{'x': list(range(1, cut_all +1)), 'y': inf[:cut_all], 'name': 'Without restriction'},
-                                 {'x': list(range(1, cut_all +1)), 'y': inf_rest[:cut_all], 'name': 'With restriction'},
-                                 {'x': [initial_day_restriction, initial_day_restriction], 'y':[0, max(inf + inf_rest)], 'type': 'scatter', 'line': dict(color='rgb(55, 83, 109)', dash='dot'), 'name': 'Begin restriction'},
-                                 {'x': [initial_day_restriction + restriction_duration, initial_day_restriction + restriction_duration], 'y':[0, max(inf + inf_rest)], 'type': 'scatter', 'line': dict(color='rgb(55, 83, 109)', dash='dot'), 'name': 'End restriction'},
-                         
-                                 ],
-                'layout': {'title': 'Comparison infected with and without restrictions',
-                           'xaxis':{'title':'Day'},
-                           'yaxis':{'title':'Number of incfected'}
-                          }
-               }
-
-
-
-        # get all dead people 
-        if len(D) > len(D_rest):
-            while(len(D) > len(D_rest)):
-                D_rest.append(D_rest[-1])
-        else:
-            while(len(D_rest) > len(D)):
-                D.append(D[-1])
-               
-        graph_dead = {'data': [{'x': list(range(1, cut_all +1)), 'y': D[:cut_all], 'name': 'Without restriction'},
-                                 {'x': list(range(1, cut_all+1)), 'y': D_rest[:cut_all], 'name': 'With restriction'},
-                                 {'x': [initial_day_restriction, initial_day_restriction], 'y':[0, max(D + D_rest)], 'type': 'scatter', 'line': dict(color='rgb(55, 83, 109)', dash='dot'), 'name': 'Begin restriction'},
-                                 {'x': [initial_day_restriction + restriction_duration, initial_day_restriction + restriction_duration], 'y':[0, max(D + D_rest)], 'type': 'scatter', 'line': dict(color='rgb(55, 83, 109)', dash='dot'), 'name': 'End restriction'},
-                         
-                                 ],
-                'layout': {'title': 'Comparison dead with and without restrictions',
-                           'xaxis':{'title':'Day'},
-                           'yaxis':{'title':'Number of dead'}
-                          }
-               }
-
-        # get daily increment of infected and dead people
-        inf_giorn_rest = [E_rest[0]]
-        dead_giorn_rest = [D_rest[0]]
-
-        inf_giorn = [E[0]]
-        dead_giorn = [D[0]]
-
-        for i in range(1, max(len(S), len(S_rest))):
-            if i < len(S):
-                inf_giorn.append(S[i-1] - S[i] )
-                dead_giorn.append(D[i] - D[i-1])
-            else:
-                inf_giorn.append(0) 
-                dead_giorn.append(0)
-            if i < len(S_rest):
-                inf_giorn_rest.append(S_rest[i-1] - S_rest[i])
-                dead_giorn_rest.append(D_rest[i] - D_rest[i-1])
-            else:
-                inf_giorn_rest.append(0) 
-                dead_giorn_rest.append(0)
-
- 
-        graph_Inf_daily = {'data': [{'x': list(range(1,len(I[:cut_all]) +1)), 'y': inf_giorn[:cut_all], 'name': 'Without restriction'},
-                                 {'x': list(range(1,len(I[:cut_all]) +1)), 'y': inf_giorn_rest[:cut_all], 'name': 'With restriction'},
-                                 {'x': [initial_day_restriction, initial_day_restriction], 'y':[0, max(inf_giorn + inf_giorn_rest)], 'type': 'scatter', 'line': dict(color='rgb(55, 83, 109)', dash='dot'), 'name': 'Begin restriction'},
-                                 {'x': [initial_day_restriction + restriction_duration, initial_day_restriction + restriction_duration], 'y':[0, max(inf_giorn + inf_giorn_rest)], 'type': 'scatter', 'line': dict(color='rgb(55, 83, 109)', dash='dot'), 'name': 'End restriction'},
-                         
-                                 ],
-                'layout': {'title': 'Comparison daily infected with and without restrictions',
-                           'xaxis':{'title':'Day'},
-                           'yaxis':{'title':'Number of infected'}
-                          }
-               }
-               
-        graph_dead_daily = {'data': [{'x': list(range(1,len(D[:cut_all]) +1)), 'y': dead_giorn[:cut_all], 'name': 'Without restriction'},
-                                 {'x': list(range(1,len(D[:cut_all]) +1)), 'y': dead_giorn_rest[:cut_all], 'name': 'With restriction'},
-                                 {'x': [initial_day_restriction, initial_day_restriction], 'y':[0, max(dead_giorn + dead_giorn_rest)], 'type': 'scatter', 'line': dict(color='rgb(55, 83, 109)', dash='dot'), 'name': 'Inizio restrizione'},
-                                 {'x': [initial_day_restriction + restriction_duration, initial_day_restriction + restriction_duration], 'y':[0, max(dead_giorn + dead_giorn_rest)], 'type': 'scatter', 'line': dict(color='rgb(55, 83, 109)', dash='dot'), 'name': 'End restriction'},
-                         
-                                 ],
-                'layout': {'title': 'Comparison daily dead with and without restrictions',
-                           'xaxis':{'title':'Day'},
-                           'yaxis':{'title':'Number of dead'}
-                          }
-               }
-
-        x = ["Results"]
-        last_day = len(I) - 1
-        last_day_rest = len(I_rest) - 1
-        y = [tot[last_day] - S[last_day]]
-        y_rest = [tot_rest[last_day_rest] - S_rest[last_day_rest]]
-
-        graph_total_infected = {'data': [{'x': x, 'y': y, 'type': 'bar', 'name': 'Without restriction'},
-                                 {'x': x, 'y': y_rest, 'type': 'bar', 'name': 'With restriction'},
-    
-                                 ],
-                'layout': {'title': 'Total number of infected people with and without restriction',
-                           'yaxis':{'title':'Count'}
-                          }
-               }
+    Return
+    ------
 
-        
-       # test made and quarantine people
+    outputs: list
+        Progress value, progress label, progress color, if polling is disabled, the id of the finished job,
+        new data of graph_sim and graph_infected and updated live_sent
 
-        graph_test = {'data': [{'x': list(range(1,len(T_rest[:cut_all]) +1)), 'y': T_rest[:cut_all], 'type': 'bar', 'name': 'Test made'},
-                                 {'x': list(range(1,len(T_rest[:cut_all]) +1)), 'y': T_pos[:cut_all], 'type': 'bar', 'name': 'Positive test'},
-                                 {'x': list(range(1,len(T_rest[:cut_all]) +1)), 'y': Q_rest[:cut_all], 'name': 'Quarantine'},
-    
-                                 ],
-                'layout': {'title': 'Comparison quarantine test made and positive test',
-                           'yaxis':{'title':'Count (log axis)', 'type':"log"},
-                          }
-               }
-       
-
-        outputs = [graph_sim, graph_sim_without_restr, graph_infected, graph_dead, graph_Inf_daily, graph_dead_daily, graph_total_infected, graph_test, {'display': 'block'}, {'display': 'block'}, {'display': 'block'},{'display': 'block'},{'display': 'block'},{'display': 'block'},{'display': 'block'},{'display': 'block'}]
-        names = ['graph_sim.pdf', 'graph_sim_without_restr.pdf', 'graph_infected.pdf', 'graph_dead.pdf', 'graph_Inf_daily.pdf', 'graph_dead_daily.pdf', 'graph_total_infected.pdf', 'graph_test.pdf']
-        save_pdf = False
-
-        if save_pdf == True:
-            for index in range(len(names)):
-                if isinstance(outputs[index], dict):
-                    fig = go.Figure(outputs[index])
-                    fig.write_image(names[index])
-                else:
-                    outputs[index].write_image(names[index])
-        
-        return outputs
-        
-    else:
-        # first launch do not run the simulation and hide all graphics
-        return [{}, {}, {}, {}, {}, {}, {}, {}, {'display': 'None'}, {'display': 'None'}, {'display': 'None'}, {'display': 'None'}, {'display': 'None'}, {'display': 'None'}, {'display': 'None'}, {'display': 'None'}]
+    """
+
+    no_live = [dash.no_update, dash.no_update, dash.no_update]
+    if job_id is None:
+        return [0, "", "primary", True, dash.no_update] + no_live
+
+    job = jobs.status(job_id)
+    if job["state"] == "queued":
+        return [0, queued_label(job), "primary", False, dash.no_update] + no_live
+    if job["state"] == "running":
+        progress = [job["progress"], str(job["progress"]) + "%", "primary", False, dash.no_update]
+        # the charts are initialized by updateLiveFigures when the job id changes, extend them from the next tick
+        triggered = [trigger["prop_id"] for trigger in dash.callback_context.triggered]
+        if not job["live"] or 'job_interval.n_intervals' not in triggered:
+            return progress + no_live
+
+        sent = [0, 0]
+        if live_sent is not None and live_sent["job_id"] == job_id:
+            sent = live_sent["sent"]
+        # only the first seed is shown live
+        counts_rest, counts = jobs.live_counts(job_id, sent)
+        if len(counts_rest) == 0 and len(counts) == 0:
+            return progress + no_live
+
+        days_rest = list(range(sent[0] + 1, sent[0] + len(counts_rest) + 1))
+        days = list(range(sent[1] + 1, sent[1] + len(counts) + 1))
+        extend_sim = [dict(x = [days_rest for name in live_sim_series],
+                           y = [[day[name] for day in counts_rest] for name in live_sim_series]),
+                      list(range(len(live_sim_series)))]
+        extend_infected = [dict(x = [days, days_rest],
+                                y = [[day['I'] + day['E'] for day in counts], [day['I'] + day['E'] for day in counts_rest]]),
+                           [0, 1]]
+        live_sent = dict(job_id = job_id, sent = [sent[0] + len(counts_rest), sent[1] + len(counts)])
+        return progress + [extend_sim, extend_infected, live_sent]
+    if job["state"] == "done":
+        return [100, "Completed", "success", True, job_id] + no_live
+    if job["state"] == "failed":
+        return [100, "Simulation failed: " + job["error"], "danger", True, dash.no_update] + no_live
+    return [100, "Simulation not found, please run it again", "danger", True, dash.no_update] + no_live
+
+
+
+def queued_label(job):
+    """
+    Label of the progress bar of a job waiting for a worker, with its position in the queue
+    """
+
+    if not job["position"]:
+        return "Queued, starting soon"
+    return "Queued, " + str(job["position"]) + " simulations ahead"
+
+
+
+# series of graph_sim extended by live jobs, in the order of its traces
+live_sim_series = ['S', 'E', 'I', 'R', 'D', 'total']
+
+
+def live_figures():
+    """
+    Empty graph_sim and graph_infected figures, with the traces extended by pollSimulation during live jobs
+
+    Return
+    ------
+
+    figures: list of dict
+        graph_sim and graph_infected figures
+
+    """
+
+    graph_sim = {'data': [{'x': [], 'y': [], 'name': 'S', 'marker' : {'color': 'Blue'}},
+                          {'x': [], 'y': [], 'name': 'E', 'marker' : {'color': 'Orange'}},
+                          {'x': [], 'y': [], 'name': 'I', 'marker' : {'color': 'Red'}},
+                          {'x': [], 'y': [], 'name': 'R', 'marker' : {'color': 'Green'}},
+                          {'x': [], 'y': [], 'name': 'deceduti', 'marker' : {'color': 'Black'}},
+                          {'x': [], 'y': [], 'name': 'Total'},
+                          ],
+                 'layout': {
+                     'title': 'Contacts network model with restriction (running)',
+                     'xaxis':{'title':'Day'},
+                     'yaxis':{'title':'Count'}
+                 }
+                }
+
+    graph_infected = {'data': [{'x': [], 'y': [], 'name': 'Without restriction'},
+                               {'x': [], 'y': [], 'name': 'With restriction'},
+                               ],
+                      'layout': {'title': 'Comparison infected with and without restrictions (running)',
+                                 'xaxis':{'title':'Day'},
+                                 'yaxis':{'title':'Number of incfected'}
+                                }
+                     }
+
+    return [graph_sim, graph_infected]
+
+
+
+# when a job is done read its results in the sim_results store, each figure is then built from the store
+@app.callback(
+    Output('sim_results', 'data'),
+    [Input('job_done', 'data')]
+)
+
+def storeResults(job_id):
+    """
+    Read the results of a finished job: the daily series with and without restriction and the parameters needed
+    to plot them
+
+    Parameters
+    ----------
+    job_id: string
+        Id of the finished job
+
+    Return
+    ------
+
+    results: dict
+        Compact payload of the results, see results_payload. None to hide the graphics
+
+    """
+
+    job = jobs.status(job_id) if job_id is not None else None
+
+    # check to avoid plotting at the launch of the app and on refresh page
+    if job is None or job["state"] != "done":
+        return None
+
+    n_seeds = len(job["meta"]["paths"])
+
+    # list of data to plot, daily count of people status, tests and quarantine, sent back by the workers
+    # while the dumps may still be written in background
+    runs = jobs.results(job_id)
+    series_rest = runs[str(job["meta"]["path"])]["series"]
+    series = runs[str(job["meta"]["path_no_rest"])]["series"]
+
+    # with many seeds plot the median of the ensemble and its percentile band
+    ensemble_rest = ensemble = None
+    if n_seeds > 1:
+        ensemble_rest = ensemble_statistics([runs[str(seed_path)]["series"] for seed_path in job["meta"]["paths"]])
+        ensemble = ensemble_statistics([runs[str(seed_path)]["series"] for seed_path in job["meta"]["paths_no_rest"]])
+        series_rest = {name: statistics['median'] for name, statistics in ensemble_rest.items()}
+        series = {name: statistics['median'] for name, statistics in ensemble.items()}
+
+    results = results_payload(series_rest, series, job["meta"]["number_of_steps"], job["meta"]["initial_day_restriction"],
+                              job["meta"]["restriction_duration"], ensemble_rest = ensemble_rest, ensemble = ensemble, n_runs = n_seeds)
+
+    return results
+
+
+
+def figure_callback(figure_id):
+    """
+    Build the callback updating the figure figure_id from the sim_results store
+
+    Parameters
+    ----------
+    figure_id: string
+        One of figure_ids
+
+    Return
+    ------
+
+    callback: function
+        The callback
+
+    """
+
+    def updateFigure(results):
+        if results is None:
+            return {}
+        with timer('figures'):
+            return figure_builders[figure_id](read_payload(results))
+
+    updateFigure.__name__ = 'update_' + figure_id
+    return updateFigure
+
+
+for figure_id in figure_ids:
+    if figure_id not in ['graph_sim', 'graph_infected']:
+        app.callback(Output(figure_id, 'figure'), [Input('sim_results', 'data')])(figure_callback(figure_id))
+
+
+
+# graph_sim and graph_infected are also the live charts, extended by pollSimulation while a live job runs
+@app.callback(
+    [Output('graph_sim', 'figure'),
+        Output('graph_infected', 'figure')],
+    [Input('sim_results', 'data'),
+        Input('job_id', 'data')]
+)
+
+def updateLiveFigures(results, job_id):
+    """
+    Build graph_sim and graph_infected from the sim_results store. When a live job is submitted, show them empty
+
+    Parameters
+    ----------
+    results: dict
+        Content of the sim_results store
+
+    job_id: string
+        Id of the last submitted job
+
+    Return
+    ------
+
+    figures: list of dict
+        graph_sim and graph_infected figures
+
+    """
+
+    triggered = [trigger["prop_id"] for trigger in dash.callback_context.triggered]
+    if 'job_id.data' in triggered:
+        if job_id is None or not jobs.status(job_id)["live"]:
+            raise PreventUpdate
+        return live_figures()
 
+    if results is None:
+        return [{}, {}]
+    with timer('figures'):
+        results = read_payload(results)
+        return [figure_builders['graph_sim'](results), figure_builders['graph_infected'](results)]
 
 
 
+# show a graph only when its figure has data, without a round-trip to the server
+for figure_id in figure_ids:
+    app.clientside_callback(
+        """
+        function(figure) {
+            if (figure && figure.data && figure.data.length > 0) {
+                return {'display': 'block'};
+            }
+            return {'display': 'none'};
+        }
+        """,
+        Output(figure_id, 'style'),
+        [Input(figure_id, 'figure')]
+    )
+
+
+
+
+
+# export the figures of the results in the sim_results store, without a round-trip to enable the button
+app.clientside_callback(
+    """
+    function(results) {
+        return !results;
+    }
+    """,
+    Output('export_button', 'disabled'),
+    [Input('sim_results', 'data')]
+)
+
+
+
+@app.callback(
+    Output('export_key', 'data'),
+    [Input('export_button', 'n_clicks'),
+        Input('sim_results', 'data')],
+    [State('export_formats', 'value')]
+)
+
+def requestExport(n_clicks, results, formats):
+    """
+    Start rendering the figures of the results in the background export pool. New results discard the previous export
+
+    Parameters
+    ----------
+    n_clicks: int
+        Number of clicks of the export button
+
+    results: dict
+        Content of the sim_results store
+
+    formats: list of string
+        Formats of the exported figures, "pdf" and "png"
+
+    Return
+    ------
+
+    key: string
+        Key of the export, polled by pollExport. None when there is nothing to export
+
+    """
+
+    triggered = [trigger["prop_id"] for trigger in dash.callback_context.triggered]
+    if results is None or 'export_button.n_clicks' not in triggered:
+        return None
+    if not formats:
+        raise PreventUpdate
+    return export.request_export(results, formats)
+
+
+
+@app.callback(
+    [Output('export_status', 'children'),
+        Output('export_interval', 'disabled')],
+    [Input('export_interval', 'n_intervals'),
+        Input('export_key', 'data')]
+)
+
+def pollExport(n_intervals, key):
+    """
+    Show the state of the export, and the download link of its bundle when it is ready
+
+    Parameters
+    ----------
+    n_intervals: int
+        Number of ticks of the polling interval
+
+    key: string
+        Key of the current export
+
+    Return
+    ------
+
+    outputs: list
+        Status message or download link, and if polling is disabled
+
+    """
+
+    if key is None:
+        return [None, True]
+
+    status = export.export_status(key)
+    if status["state"] == "running":
+        return ["Exporting figures...", False]
+    if status["state"] == "done":
+        return [html.A("Download figures (zip)", href="/exports/" + key + ".zip"), True]
+    if status["state"] == "failed":
+        return [dbc.Alert("Export failed: " + status["error"], color="danger"), True]
+    return [dbc.Alert("Export not found, please export again", color="danger"), True]
+
+
 
 # check input before enable button run simulation
 @app.callback(
@@ -498,11 +555,12 @@ def updateSimulation(n_clicks, n_of_families, number_of_steps, n_initial_infecte
         Input('n_test','value'),
         Input('restriction_duration','value'),
         Input('name_file', 'value'),
-        Input('contact_tracing_duration', 'value')
+        Input('contact_tracing_duration', 'value'),
+        Input('n_seeds', 'value')
     ],
 )
 
-def enable_disable_button(n_of_families, number_of_steps, n_initial_infected_nodes, incubation_days, infection_duration, R_0, initial_day_restriction, n_test, restriction_duration, name_file, contact_tracing_duration):
+def enable_disable_button(n_of_families, number_of_steps, n_initial_infected_nodes, incubation_days, infection_duration, R_0, initial_day_restriction, n_test, restriction_duration, name_file, contact_tracing_duration, n_seeds):
     """
     Check parameters value before enable button simulation. If any parameter of the simulation does not in (min, max) range this callback disable button and show alert message.
 
@@ -536,6 +594,9 @@ def enable_disable_button(n_of_families, number_of_steps, n_initial_infected_nod
     restriction_duration: int
         How many days the sociability distancing last. Use 0 to make the restriction last till the end of the simulation
 
+    n_seeds: int
+        Number of runs with different seeds of each scenario
+
     
     Return
     ------
@@ -552,7 +613,7 @@ def enable_disable_button(n_of_families, number_of_steps, n_initial_infected_nod
     if n_of_families is not None and number_of_steps is not None and n_initial_infected_nodes is not None \
         and incubation_days is not None and infection_duration is not None and R_0 is not None \
         and initial_day_restriction is not None and n_test is not None \
-        and restriction_duration is not None \
+        and restriction_duration is not None and n_seeds is not None \
         and name_file != "":
         
         return [False, False]
@@ -561,3 +622,282 @@ def enable_disable_button(n_of_families, number_of_steps, n_initial_infected_nod
         return [True, True]
 
 
+
+
+
+
+
+# on the click event of run_sweep button expand the parameter grid and submit all its points as a background job
+@app.callback(
+    [Output('sweep_job_id', 'data'),
+        Output('sweep_alert', 'children'),
+        Output('sweep_alert', 'is_open')],
+
+    # input event
+    [Input("run_sweep", "n_clicks")],
+
+    # grid values and current value of the other parameters
+    [State('sweep_social_distance_strictness', 'value'),
+        State('sweep_n_test', 'value'),
+        State('sweep_contact_tracing_efficiency', 'value'),
+        State('sweep_R_0', 'value'),
+        State('n_of_families','value'),
+        State('number_of_steps','value'),
+        State('n_initial_infected_nodes','value'),
+        State('incubation_days','value'),
+        State('infection_duration','value'),
+        State('R_0','value'),
+        State('initial_day_restriction','value'),
+        State('restriction_duration','value'),
+        State('social_distance_strictness','value'),
+        State('restriction_decreasing', 'value'),
+        State('n_test','value'),
+        State('policy_test','value'),
+        State('contact_tracing_efficiency', 'value'),
+        State('contact_tracing_duration', 'value')]
+)
+
+def submitSweep(n_clicks, sweep_social_distance_strictness, sweep_n_test, sweep_contact_tracing_efficiency, sweep_R_0, n_of_families, number_of_steps, n_initial_infected_nodes, incubation_days, infection_duration, R_0, initial_day_restriction, restriction_duration, social_distance_strictness, restriction_decreasing, n_test, policy_test, contact_tracing_efficiency, contact_tracing_duration):
+    """
+    Expand the grid of social_distance_strictness x n_test x contact_tracing_efficiency x R_0 and submit one simulation for each point.
+    Empty grid fields use the value of the simulator form, as all the parameters that are not swept
+
+    Parameters
+    ----------
+    n_clicks int
+        Number of click of the sweep button
+
+    sweep_social_distance_strictness, sweep_n_test, sweep_contact_tracing_efficiency, sweep_R_0: string
+        Comma separated values of the swept parameters
+
+    n_of_families ... contact_tracing_duration:
+        Parameters of the simulator form, see submitSimulation
+
+    Return
+    ------
+
+    outputs: list
+        Id of the submitted job, error message and if the error is shown
+
+    """
+
+    if n_clicks is None:
+        raise PreventUpdate
+
+    try:
+        grid = dict(social_distance_strictness = parse_values(sweep_social_distance_strictness, int) or [social_distance_strictness],
+                    n_test = parse_values(sweep_n_test, int) or [n_test],
+                    contact_tracing_efficiency = parse_values(sweep_contact_tracing_efficiency) or [contact_tracing_efficiency],
+                    R_0 = parse_values(sweep_R_0) or [R_0])
+        sweep_id = uuid.uuid4().hex
+        base = dict(use_steps = True,
+                    n_of_families = n_of_families,
+                    number_of_steps = number_of_steps,
+                    incubation_days = incubation_days,
+                    infection_duration = infection_duration,
+                    initial_day_restriction = initial_day_restriction,
+                    restriction_duration = restriction_duration,
+                    restriction_decreasing = restriction_decreasing == [1],
+                    n_initial_infected_nodes = n_initial_infected_nodes,
+                    policy_test = policy_test,
+                    contact_tracing_duration = contact_tracing_duration,
+                    use_random_seed = True,
+                    seed = 0)
+        points, scenarios = expand_grid(base, grid, sweep_dir / sweep_id)
+    except ValueError as e:
+        return [dash.no_update, "Invalid grid: " + str(e), True]
+
+    (sweep_dir / sweep_id).mkdir(parents = True, exist_ok = True)
+    # the dumps are written before the job is done, collect removes them
+    try:
+        job_id = jobs.submit(scenarios, meta = dict(sweep_id = sweep_id, points = points, scenarios = scenarios), persist = "sync",
+                             session = session_id())
+    except jobs.Rejected as e:
+        return [dash.no_update, str(e) + ", please retry in " + str(e.retry_after) + " seconds", True]
+    return [job_id, "", False]
+
+
+
+# poll the sweep job and collect the summary of each point when it is done
+@app.callback(
+    [Output('sweep_progress', 'value'),
+        Output('sweep_progress', 'children'),
+        Output('sweep_progress', 'color'),
+        Output('sweep_interval', 'disabled'),
+        Output('sweep_results', 'data')],
+    [Input('sweep_interval', 'n_intervals'),
+        Input('sweep_job_id', 'data')]
+)
+
+def pollSweep(n_intervals, job_id):
+    """
+    Update the progress bar of the sweep. When the job ends stop polling and return the summary of each point
+
+    Parameters
+    ----------
+    n_intervals: int
+        Number of ticks of the polling interval
+
+    job_id: string
+        Id of the sweep job
+
+    Return
+    ------
+
+    outputs: list
+        Progress value, progress label, progress color, if polling is disabled and the records of the sweep
+
+    """
+
+    if job_id is None:
+        return [0, "", "primary", True, dash.no_update]
+
+    job = jobs.status(job_id)
+    if job["state"] == "queued":
+        return [0, queued_label(job), "primary", False, dash.no_update]
+    if job["state"] == "running":
+        return [job["progress"], str(job["progress"]) + "%", "primary", False, dash.no_update]
+    if job["state"] == "done":
+        meta = job["meta"]
+        if "records" not in meta:
+            runs = jobs.results(job_id)
+            meta["records"] = collect(meta["sweep_id"], meta["points"], meta["scenarios"],
+                                      [runs[str(scenario["path"])]["series"] for scenario in meta["scenarios"]])
+        return [100, "Completed " + str(len(meta["records"])) + " points", "success", True, meta["records"]]
+    if job["state"] == "failed":
+        return [100, "Sweep failed: " + job["error"], "danger", True, dash.no_update]
+    return [100, "Sweep not found, please run it again", "danger", True, dash.no_update]
+
+
+
+# draw the heatmap and the slice plot of the sweep
+@app.callback(
+    [Output('sweep_heatmap', 'figure'),
+        Output('sweep_slices', 'figure')],
+    [Input('sweep_results', 'data'),
+        Input('sweep_x', 'value'),
+        Input('sweep_y', 'value'),
+        Input('sweep_metric', 'value')]
+)
+
+def updateSweep(records, x, y, metric):
+    """
+    Plot a metric of the sweep over two swept parameters, averaging over the other ones
+
+    Parameters
+    ----------
+    records: list of dict
+        Swept parameters and summary metrics of each point
+
+    x: string
+        Parameter on the x axis
+
+    y: string
+        Parameter on the y axis (heatmap) or of the lines (slice plot)
+
+    metric: string
+        Metric to plot
+
+    Return
+    ------
+
+    outputs: list
+        Heatmap and slice plot figures
+
+    """
+
+    if not records:
+        return [{}, {}]
+
+    x_values, y_values, z = metric_grid(records, x, y, metric)
+    heatmap = {'data': [{'type': 'heatmap', 'x': x_values, 'y': y_values, 'z': z.tolist(), 'colorscale': 'Reds', 'colorbar': {'title': sweep_metrics[metric]}}],
+               'layout': {'title': sweep_metrics[metric] + ' (mean over the other parameters)',
+                          'xaxis': {'title': sweep_parameters[x], 'type': 'category'},
+                          'yaxis': {'title': sweep_parameters[y], 'type': 'category'}
+                         }
+              }
+
+    slices = {'data': [{'x': x_values, 'y': z[row].tolist(), 'name': sweep_parameters[y] + ' = ' + str(y_value), 'mode': 'lines+markers'} for row, y_value in enumerate(y_values)],
+              'layout': {'title': sweep_metrics[metric] + ' by ' + sweep_parameters[x],
+                         'xaxis': {'title': sweep_parameters[x]},
+                         'yaxis': {'title': sweep_metrics[metric]}
+                        }
+             }
+    return [heatmap, slices]
+
+
+
+
+# list the runs of the results catalog, when the tab is opened and on refresh
+@app.callback(
+    Output('catalog_table', 'data'),
+    [Input('catalog_refresh', 'n_clicks'),
+        Input('tabs', 'value')]
+)
+
+def loadCatalog(n_clicks, tab):
+    """
+    Read the runs recorded in the results catalog, without loading their dumps
+
+    Parameters
+    ----------
+    n_clicks: int
+        Number of clicks of the refresh button
+
+    tab: string
+        Id of the selected tab
+
+    Return
+    ------
+
+    rows: list of dict
+        One row of the catalog table for each run, most recent first
+
+    """
+
+    if tab not in (None, 'tab-4') and n_clicks is None:
+        raise PreventUpdate
+
+    rows = list()
+    for run in catalog.list_runs():
+        row = dict(run)
+        row['created'] = time.strftime('%Y-%m-%d %H:%M', time.localtime(run['created']))
+        row['baseline'] = 'yes' if run['baseline'] else 'no'
+        row['exists'] = 'yes' if run['exists'] else 'no'
+        row['file_kb'] = round(run['file_bytes'] / 1024, 1)
+        row['contact_tracing_efficiency'] = round(100 * run['contact_tracing_efficiency'])
+        rows.append(row)
+    return rows
+
+
+
+# overlay the daily series of the selected runs, from the catalog index
+@app.callback(
+    Output('catalog_overlay', 'figure'),
+    [Input('catalog_table', 'selected_row_ids'),
+        Input('catalog_series', 'value')]
+)
+
+def overlayRuns(selected_ids, series_name):
+    """
+    Plot the daily series of the selected runs on the same chart
+
+    Parameters
+    ----------
+    selected_ids: list of int
+        Ids of the selected runs
+
+    series_name: string
+        "infected" or "dead"
+
+    Return
+    ------
+
+    figure: dict
+        The overlay figure, empty if no run is selected
+
+    """
+
+    if not selected_ids:
+        return {}
+    return catalog_figure(catalog.runs_series(selected_ids), series_name)
@@ -0,0 +1,207 @@
+import json, os, sqlite3, time
+from pathlib import Path
+
+from src.sweep import summarize
+
+
+catalog_file = Path(os.environ.get("SIMULATOR_CATALOG", "simulator_results/catalog.sqlite"))
+
+# parameters copied in their own column, to filter and sort the runs without parsing the JSON of all the parameters
+parameter_columns = {"n_of_families": "INTEGER",
+                     "number_of_steps": "INTEGER",
+                     "n_initial_infected_nodes": "INTEGER",
+                     "R_0": "REAL",
+                     "initial_day_restriction": "INTEGER",
+                     "restriction_duration": "INTEGER",
+                     "social_distance_strictness": "INTEGER",
+                     "n_test": "INTEGER",
+                     "policy_test": "TEXT",
+                     "contact_tracing_efficiency": "REAL",
+                     "seed": "INTEGER"}
+
+summary_columns = {"total_infected": "INTEGER",
+                   "total_dead": "INTEGER",
+                   "peak_infected": "INTEGER",
+                   "peak_day": "INTEGER"}
+
+# daily series kept in the catalog, enough to overlay the runs without their dumps
+catalog_series = ["infected", "dead"]
+
+# one row for each dump file, a dump written again on the same path updates its row and keeps its rowid
+schema = ("CREATE TABLE IF NOT EXISTS runs (path TEXT PRIMARY KEY, name TEXT, created REAL, baseline INTEGER, key TEXT, "
+          "dump_type TEXT, file_bytes INTEGER, parameters TEXT, series TEXT, "
+          + ", ".join(name + " " + kind for name, kind in dict(parameter_columns, **summary_columns).items()) + ")")
+
+
+def connect():
+    """
+    Open the catalog, creating it on first use. Worker processes write concurrently, each write waits for the others
+
+    Return
+    ------
+    connection: sqlite3.Connection
+        Connection to the catalog, rows are returned as sqlite3.Row
+
+    """
+
+    catalog_file.parent.mkdir(parents = True, exist_ok = True)
+    connection = sqlite3.connect(str(catalog_file), timeout = 30)
+    connection.row_factory = sqlite3.Row
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute(schema)
+    connection.execute("CREATE INDEX IF NOT EXISTS runs_key ON runs (key)")
+    return connection
+
+
+def catalog_entry(series):
+    """
+    Summary and compact daily series of a run, as recorded in the catalog
+
+    Parameters
+    ----------
+    series: dict
+        Daily series of the run with at least S, E, I, D and total, see load_series
+
+    Return
+    ------
+    summary: dict
+        The value of each one of summary_columns, see sweep.summarize
+
+    compact: dict
+        The catalog_series as lists of int
+
+    """
+
+    compact = dict(infected = [int(e + i) for e, i in zip(series["E"], series["I"])], dead = [int(d) for d in series["D"]])
+    return summarize(series), compact
+
+
+def record(path, scenario, key, summary, compact, file_bytes, baseline = False):
+    """
+    Record a dump written in simulator_results, with its parameters and summary
+
+    Parameters
+    ----------
+    path: string
+        Path of the dump file
+
+    scenario: dict
+        Keyword arguments of the simulate call
+
+    key: string
+        Cache key of the scenario, see cache.scenario_key
+
+    summary, compact: dict
+        See catalog_entry
+
+    file_bytes: int
+        Size of the dump file
+
+    baseline: bool
+        If the run is the baseline without restriction of another scenario
+
+    Return
+    ------
+    None
+
+    """
+
+    row = dict(path = str(path), name = Path(path).stem, created = time.time(), baseline = int(baseline), key = key,
+               dump_type = scenario["dump_type"], file_bytes = int(file_bytes),
+               parameters = json.dumps({name: value for name, value in scenario.items() if name != "path"}, default = str),
+               series = json.dumps(compact, separators = (",", ":")))
+    row.update({name: scenario.get(name) for name in parameter_columns})
+    row.update({name: summary[name] for name in summary_columns})
+
+    # update in place a run written again on the same path, it keeps its rowid and so its selection in the catalog table
+    connection = connect()
+    try:
+        with connection:
+            connection.execute("INSERT INTO runs (" + ", ".join(row) + ") VALUES (" + ", ".join("?" * len(row)) + ") "
+                               "ON CONFLICT(path) DO UPDATE SET " + ", ".join(name + " = excluded." + name for name in row if name != "path"),
+                               list(row.values()))
+    finally:
+        connection.close()
+
+
+def lookup(key):
+    """
+    Summary and series of a run already recorded with the same cache key, e.g. the run whose result is copied from the cache
+
+    Parameters
+    ----------
+    key: string
+        Cache key of the scenario
+
+    Return
+    ------
+    entry: tuple
+        (summary, compact) as returned by catalog_entry, None if no run has the key
+
+    """
+
+    if key is None or not catalog_file.exists():
+        return None
+    connection = connect()
+    try:
+        row = connection.execute("SELECT series, " + ", ".join(summary_columns) + " FROM runs WHERE key = ? ORDER BY created DESC LIMIT 1",
+                                 (key,)).fetchone()
+    finally:
+        connection.close()
+    if row is None:
+        return None
+    return {name: row[name] for name in summary_columns}, json.loads(row["series"])
+
+
+def list_runs():
+    """
+    All the recorded runs, most recent first, without their series
+
+    Return
+    ------
+    runs: list of dict
+        One dict for each run with the columns of the catalog and "exists", if its dump file is still on disk
+
+    """
+
+    if not catalog_file.exists():
+        return list()
+    connection = connect()
+    try:
+        rows = connection.execute("SELECT rowid AS id, path, name, created, baseline, dump_type, file_bytes, "
+                                  + ", ".join(list(parameter_columns) + list(summary_columns))
+                                  + " FROM runs ORDER BY created DESC").fetchall()
+    finally:
+        connection.close()
+    runs = [dict(row) for row in rows]
+    for run in runs:
+        run["exists"] = os.path.exists(run["path"])
+    return runs
+
+
+def runs_series(ids):
+    """
+    Daily series of some recorded runs
+
+    Parameters
+    ----------
+    ids: list of int
+        Ids of the runs, as returned by list_runs
+
+    Return
+    ------
+    runs: list of dict
+        For each run found, its id, name, baseline flag and the catalog_series as lists
+
+    """
+
+    if not ids or not catalog_file.exists():
+        return list()
+    connection = connect()
+    try:
+        rows = connection.execute("SELECT rowid AS id, name, baseline, series FROM runs WHERE rowid IN ("
+                                  + ", ".join("?" * len(ids)) + ")", list(ids)).fetchall()
+    finally:
+        connection.close()
+    by_id = {row["id"]: dict(id = row["id"], name = row["name"], baseline = bool(row["baseline"]), **json.loads(row["series"])) for row in rows}
+    return [by_id[run_id] for run_id in ids if run_id in by_id]
@@ -0,0 +1,232 @@
+import hashlib, math, os
+from collections import OrderedDict
+
+import numpy as np
+
+
+# test policies ranking the nodes by a centrality measure
+centrality_policies = {"Degree Centrality": "degree", "Betweenness Centrality": "betweenness",
+                       "Approximate Betweenness": "approximate_betweenness"}
+
+# how many connected components keep their betweenness in memory, in each process
+max_cached_components = int(os.environ.get("SIMULATOR_CENTRALITY_CACHE", 64))
+
+# approximate betweenness: sampled source nodes per component, or if betweenness_error is set
+# the number needed to reach that error with probability betweenness_confidence, see sample_size
+betweenness_samples = int(os.environ.get("SIMULATOR_BETWEENNESS_SAMPLES", 100))
+betweenness_error = float(os.environ["SIMULATOR_BETWEENNESS_ERROR"]) if "SIMULATOR_BETWEENNESS_ERROR" in os.environ else None
+betweenness_confidence = 0.9
+
+# components smaller than this have null betweenness
+min_component_size = 3
+
+_betweenness = OrderedDict()
+
+
+def component_fingerprints(G):
+    """
+    Split the contact network in connected components and fingerprint each one.
+    A fingerprint depends on the nodes of the component, its edges and their weights, so two components with the
+    same fingerprint (e.g. in the networks of two days, or of two scenarios) have the same betweenness
+
+    Parameters
+    ----------
+    G: ig.Graph()
+        The contact network
+
+    Return
+    ------
+    components: list of (string, np.ndarray)
+        Fingerprint and sorted node indices of each component with at least min_component_size nodes
+
+    """
+
+    n_nodes = G.vcount()
+    membership = np.asarray(G.connected_components().membership, dtype = np.int64)
+    sizes = np.bincount(membership, minlength = 1)
+
+    edges = np.asarray(G.get_edgelist(), dtype = np.int64).reshape(-1, 2)
+    weights = np.asarray(G.es["weight"] if G.ecount() > 0 else [], dtype = np.float64)
+    keys = edges.min(axis = 1) * n_nodes + edges.max(axis = 1)
+    edge_component = membership[edges[:, 0]]
+    edge_order = np.lexsort((keys, edge_component))
+    edge_bounds = np.concatenate([[0], np.cumsum(np.bincount(edge_component, minlength = len(sizes)))])
+
+    node_order = np.argsort(membership, kind = "stable")
+    node_bounds = np.concatenate([[0], np.cumsum(sizes)])
+
+    components = list()
+    for component in np.flatnonzero(sizes >= min_component_size):
+        nodes = node_order[node_bounds[component]:node_bounds[component + 1]]
+        component_edges = edge_order[edge_bounds[component]:edge_bounds[component + 1]]
+        digest = hashlib.sha1()
+        digest.update(nodes.tobytes())
+        digest.update(keys[component_edges].tobytes())
+        digest.update(weights[component_edges].tobytes())
+        components.append((digest.hexdigest(), nodes))
+    return components
+
+
+def sample_size(n_nodes, error = None, confidence = None):
+    """
+    Number of sampled source nodes such that the approximate betweenness of every node is within error of the exact one
+    with probability confidence (Hoeffding bound and union bound over the nodes).
+    The error is relative to n_nodes * (n_nodes - 2) / 2, the bound of the betweenness in a component of n_nodes nodes.
+    Without an error, betweenness_samples
+
+    Parameters
+    ----------
+    n_nodes: int
+        Number of nodes
+
+    error: float
+        Maximum error, default betweenness_error if set
+
+    confidence: float
+        Probability that no node exceeds the error, default betweenness_confidence
+
+    Return
+    ------
+    k: int
+        Number of source nodes, at most n_nodes (exact betweenness)
+
+    """
+
+    error = betweenness_error if error is None else error
+    if error is None:
+        return min(n_nodes, betweenness_samples)
+    confidence = betweenness_confidence if confidence is None else confidence
+    k = math.ceil(math.log(2 * n_nodes / (1 - confidence)) / (2 * error ** 2))
+    return min(n_nodes, k)
+
+
+def component_betweenness(G, fingerprint, nodes, k = None):
+    """
+    Weighted betweenness of a connected component, exact or estimated from k sampled source nodes.
+    The sources are drawn with a generator seeded by the fingerprint, so the estimate does not consume
+    the random numbers of the simulation and the same component always has the same estimate
+
+    Parameters
+    ----------
+    G: ig.Graph()
+        The contact network
+
+    fingerprint: string
+        Fingerprint of the component, see component_fingerprints
+
+    nodes: np.ndarray
+        Sorted node indices of the component
+
+    k: int
+        Number of sampled source nodes, None for the exact betweenness
+
+    Return
+    ------
+    values: np.ndarray
+        Betweenness of the nodes of the component, in the same order of nodes
+
+    """
+
+    key = (fingerprint, k if k is not None and k < len(nodes) else None)
+    if key in _betweenness:
+        _betweenness.move_to_end(key)
+        return _betweenness[key]
+
+    # induced subgraphs keep the order of the nodes
+    component = G.subgraph(nodes)
+    if key[1] is None:
+        values = np.asarray(component.betweenness(directed = False, weights = "weight"))
+    else:
+        rng = np.random.default_rng(int(fingerprint[:16], 16))
+        sources = np.sort(rng.choice(len(nodes), size = k, replace = False)).tolist()
+        # paths from a sample of sources, scaled to all the sources: unbiased estimate
+        values = np.asarray(component.betweenness(directed = False, weights = "weight", sources = sources)) * len(nodes) / k
+
+    _betweenness[key] = values
+    while len(_betweenness) > max_cached_components:
+        _betweenness.popitem(last = False)
+    return values
+
+
+def betweenness(G, approximate = False):
+    """
+    Weighted betweenness of every node of the contact network.
+    Each connected component is computed on its own and cached by fingerprint, so after quarantine or social distancing
+    only the components whose edges changed are recomputed, and a network already seen by this process costs nothing
+
+    Parameters
+    ----------
+    G: ig.Graph()
+        The contact network, edges must have the "weight" attribute
+
+    approximate: bool
+        Estimate the betweenness of each component from sample_size sampled source nodes
+
+    Return
+    ------
+    values: np.ndarray
+        Betweenness of each node
+
+    """
+
+    values = np.zeros(G.vcount())
+    for fingerprint, nodes in component_fingerprints(G):
+        k = sample_size(len(nodes)) if approximate else None
+        values[nodes] = component_betweenness(G, fingerprint, nodes, k)
+    return values
+
+
+def centrality(G, measure):
+    """
+    Centrality of every node of the contact network
+
+    Parameters
+    ----------
+    G: ig.Graph()
+        The contact network
+
+    measure: string
+        Either "degree" (weighted degree), "betweenness" (weighted betweenness) or "approximate_betweenness"
+
+    Return
+    ------
+    values: np.ndarray
+        Centrality of each node
+
+    """
+
+    if measure == "degree":
+        # a single pass over the edges, cheaper than any fingerprint
+        return np.asarray(G.strength(weights = "weight"), dtype = np.float64)
+    if measure == "betweenness":
+        return betweenness(G)
+    if measure == "approximate_betweenness":
+        return betweenness(G, approximate = True)
+    raise ValueError("Unknown centrality measure " + str(measure))
+
+
+def rank(G, candidates, policy_test):
+    """
+    Sort the candidates to test by decreasing centrality, ties by decreasing node index as in ctns
+
+    Parameters
+    ----------
+    G: ig.Graph()
+        The contact network
+
+    candidates: list of int
+        Index of the nodes that can be tested
+
+    policy_test: string
+        One of centrality_policies
+
+    Return
+    ------
+    ranking: list of int
+        The candidates, most central first
+
+    """
+
+    candidates = np.asarray(candidates, dtype = np.int64)
+    values = centrality(G, centrality_policies[policy_test])[candidates]
+    return candidates[np.lexsort((candidates, values))[::-1]].tolist()
@@ -0,0 +1,432 @@
+import os, pickle, struct, threading, uuid
+
+import numpy as np
+
+from src.aggregation import series_names, count_network, node_columns, aggregate_nets, aggregate_columns
+from src.metrics import timer
+from src import storage
+from src.storage import open_read, open_write, touch
+
+
+dump_types = ["full", "light", "columnar", "stream"]
+
+# columnar file layout: magic, header length, pickled header, then each array aligned at 64 bytes
+columnar_magic = b"CTNSCOL1"
+columnar_alignment = 64
+
+sex_codes = {"man": 0, "woman": 1}
+sociability_codes = {"low": 0, "medium": 1, "high": 2}
+category_codes = {"family_contacts": 0, "frequent_contacts": 1, "occasional_contacts": 2, "random_contacts": 3}
+
+
+def dump_file(path, dump_type, codec = None):
+    """
+    Return the name of the file where a dump of type dump_type is saved. Compressed dumps have the extension
+    of their codec too (e.g. .pickle.zst), columnar dumps are never compressed
+
+    Parameters
+    ----------
+    path: string
+        Path of the dump without the file extension
+
+    dump_type: string
+        Type of the dump
+
+    codec: string
+        Codec of the dump, default storage.dump_codec
+
+    Return
+    ------
+    file: string
+        Path of the dump with its file extension
+
+    """
+
+    if dump_type == "columnar":
+        return str(path) + ".columnar"
+    codec = storage.dump_codec if codec is None else codec
+    return str(path) + (".stream" if dump_type == "stream" else ".pickle") + storage.codec_extensions[codec]
+
+
+def find_dump(path, dump_type):
+    """
+    Return the file of an existing dump, whatever the codec it was written with (the current one is tried first)
+
+    Parameters
+    ----------
+    path: string
+        Path of the dump without the file extension
+
+    dump_type: string
+        Type of the dump
+
+    Return
+    ------
+    file: string
+        Path of the dump with its file extension, dump_file if no file exists
+
+    """
+
+    for codec in [storage.dump_codec] + list(storage.codec_extensions):
+        if os.path.exists(dump_file(path, dump_type, codec)):
+            return dump_file(path, dump_type, codec)
+    return dump_file(path, dump_type)
+
+
+class FullDumpWriter:
+    """
+    Dump the contact network of each day (ctns "full" dump)
+    """
+
+    def __init__(self, path, parameters):
+        self.path = path
+        self.to_dump = dict(nets = list(), parameters = parameters)
+
+    def append(self, net):
+        self.to_dump["nets"].append(net.copy())
+
+    def repeat(self, days):
+        # the same network object, pickled only once
+        self.to_dump["nets"].extend([self.to_dump["nets"][-1]] * days)
+
+    def close(self):
+        with open_write(dump_file(self.path, "full")) as f:
+            pickle.dump(self.to_dump, f, protocol = pickle.DEFAULT_PROTOCOL)
+
+
+class LightDumpWriter:
+    """
+    Dump only the daily count of people status, tests and quarantine (ctns "light" dump)
+    """
+
+    def __init__(self, path, parameters):
+        self.path = path
+        self.to_dump = {name: list() for name in series_names}
+        self.to_dump["parameters"] = parameters
+
+    def append(self, net):
+        counts = count_network(net)
+        for name in series_names:
+            self.to_dump[name].append(counts[name])
+
+    def repeat(self, days):
+        for name in series_names:
+            self.to_dump[name].extend([self.to_dump[name][-1]] * days)
+
+    def close(self):
+        with open_write(dump_file(self.path, "light")) as f:
+            pickle.dump(self.to_dump, f, protocol = pickle.DEFAULT_PROTOCOL)
+
+
+class ColumnarDumpWriter:
+    """
+    Dump the node attributes of each day as typed arrays in a single memory-mappable file.
+    Static node attributes are stored once, daily node state as (days, nodes) int8 matrices and
+    the daily contacts as a flat edge list with the offset of each day
+    """
+
+    def __init__(self, path, parameters):
+        self.path = path
+        self.parameters = parameters
+        self.nodes = None
+        self.agent_status = list()
+        self.test_result = list()
+        self.quarantine = list()
+        self.edges = list()
+        self.edge_weight = list()
+        self.edge_category = list()
+
+    def append(self, net):
+        if self.nodes is None:
+            self.nodes = dict(age = np.asarray(net.vs["age"], dtype = np.int8),
+                              sex = np.asarray([sex_codes[value] for value in net.vs["sex"]], dtype = np.int8),
+                              sociability = np.asarray([sociability_codes[value] for value in net.vs["sociability"]], dtype = np.int8),
+                              family_id = np.asarray(net.vs["family_id"], dtype = np.int32),
+                              death_rate = np.asarray(net.vs["death_rate"], dtype = np.float32))
+        columns = node_columns(net)
+        self.agent_status.append(columns["agent_status"])
+        self.test_result.append(columns["test_result"])
+        self.quarantine.append(columns["quarantine"])
+        self.edges.append(np.asarray(net.get_edgelist(), dtype = np.int32).reshape(-1, 2))
+        self.edge_weight.append(np.asarray(net.es["weight"], dtype = np.int8))
+        self.edge_category.append(np.asarray([category_codes[value] for value in net.es["category"]], dtype = np.int8))
+
+    def repeat(self, days):
+        for days_list in [self.agent_status, self.test_result, self.quarantine, self.edges, self.edge_weight, self.edge_category]:
+            days_list.extend([days_list[-1]] * days)
+
+    def close(self):
+        n_nodes = len(self.nodes["age"]) if self.nodes is not None else 0
+        arrays = {"node_" + name: values for name, values in (self.nodes or {}).items()}
+        arrays["agent_status"] = np.asarray(self.agent_status, dtype = np.int8).reshape(-1, n_nodes)
+        arrays["test_result"] = np.asarray(self.test_result, dtype = np.int8).reshape(-1, n_nodes)
+        arrays["quarantine"] = np.asarray(self.quarantine, dtype = np.int8).reshape(-1, n_nodes)
+        arrays["edge_offsets"] = np.cumsum([0] + [len(edges) for edges in self.edges]).astype(np.int64)
+        arrays["edges"] = np.concatenate(self.edges) if self.edges else np.zeros((0, 2), dtype = np.int32)
+        arrays["edge_weight"] = np.concatenate(self.edge_weight) if self.edge_weight else np.zeros(0, dtype = np.int8)
+        arrays["edge_category"] = np.concatenate(self.edge_category) if self.edge_category else np.zeros(0, dtype = np.int8)
+        write_columnar(dump_file(self.path, "columnar"), arrays, self.parameters)
+
+
+class StreamDumpWriter:
+    """
+    Dump the contact network of each day as soon as it is simulated: the file is a sequence of pickles,
+    the first one is a header with the simulation parameters, then one ig.Graph() per day.
+    Neither writing nor reading (see iter_stream) needs to keep more than one day in memory
+    """
+
+    def __init__(self, path, parameters):
+        self.f = open_write(dump_file(path, "stream"))
+        pickle.dump(dict(parameters = parameters), self.f, protocol = pickle.DEFAULT_PROTOCOL)
+
+    def append(self, net):
+        pickle.dump(net, self.f, protocol = pickle.DEFAULT_PROTOCOL)
+        self.last = net
+
+    def repeat(self, days):
+        # each day is a separate pickle, the last network is pickled once and its bytes written again
+        data = pickle.dumps(self.last, protocol = pickle.DEFAULT_PROTOCOL)
+        for day in range(days):
+            self.f.write(data)
+
+    def close(self):
+        self.f.close()
+
+
+dump_writers = {"full": FullDumpWriter, "light": LightDumpWriter, "columnar": ColumnarDumpWriter, "stream": StreamDumpWriter}
+
+
+def open_dump(path, dump_type, parameters):
+    """
+    Create the writer of a dump, call append(net) on it for each simulated day and close() at the end.
+    repeat(days) appends again the last day days times, e.g. after the end of the epidemic
+
+    Parameters
+    ----------
+    path: string
+        Path of the dump without the file extension
+
+    dump_type: string
+        Type of the dump, one of dump_types
+
+    parameters: dict
+        Simulation parameters saved in the dump
+
+    Return
+    ------
+    writer: object
+        The dump writer
+
+    """
+
+    return dump_writers[dump_type](path, parameters)
+
+
+def close_in_background(writer, on_closed = None, seconds = None):
+    """
+    Close a dump writer in a background thread, e.g. to return the results of a simulation before its dump
+    is on disk. The thread is not a daemon, so the process does not exit before the pending dumps are written
+
+    Parameters
+    ----------
+    writer: object
+        Writer returned by open_dump, with all the days appended
+
+    on_closed: callable
+        Called without arguments in the background thread once the dump is written
+
+    seconds: dict
+        If given, the seconds spent closing the writer are added under "write", see metrics.timer
+
+    Return
+    ------
+    thread: threading.Thread
+        The thread writing the dump
+
+    """
+
+    def close():
+        with timer("write", seconds if seconds is not None else dict()):
+            writer.close()
+        if on_closed is not None:
+            on_closed()
+
+    thread = threading.Thread(target = close, name = "dump-writer")
+    thread.start()
+    return thread
+
+
+def write_columnar(file, arrays, parameters):
+    """
+    Write arrays in the columnar file format, each array can then be memory-mapped by read_columnar
+
+    Parameters
+    ----------
+    file: string
+        Path of the file
+
+    arrays: dict
+        Name and value of the numpy arrays to write
+
+    parameters: dict
+        Simulation parameters saved in the header
+
+    Return
+    ------
+    None
+
+    """
+
+    # compute the offset of each array, relative to the end of the header
+    layout = dict()
+    offset = 0
+    for name, values in arrays.items():
+        offset = -(-offset // columnar_alignment) * columnar_alignment
+        layout[name] = (values.dtype.str, values.shape, offset)
+        offset += values.nbytes
+
+    header = pickle.dumps(dict(parameters = parameters, arrays = layout), protocol = pickle.DEFAULT_PROTOCOL)
+    data_start = -(-(len(columnar_magic) + 8 + len(header)) // columnar_alignment) * columnar_alignment
+
+    # written aside and renamed, a crash never leaves a truncated file at the path read by the cache and the catalog
+    tmp = str(file) + "." + uuid.uuid4().hex + ".tmp"
+    try:
+        with open(tmp, "wb") as f:
+            f.write(columnar_magic)
+            f.write(struct.pack("<Q", len(header)))
+            f.write(header)
+            for name, values in arrays.items():
+                f.seek(data_start + layout[name][2])
+                f.write(np.ascontiguousarray(values).tobytes())
+        os.replace(tmp, file)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def read_columnar(file):
+    """
+    Open a columnar dump without reading it: every array is a read-only memory map of the file
+
+    Parameters
+    ----------
+    file: string
+        Path of the file
+
+    Return
+    ------
+    dump: dict
+        The simulation "parameters" and a numpy memmap for each stored array
+
+    """
+
+    with open(file, "rb") as f:
+        if f.read(len(columnar_magic)) != columnar_magic:
+            raise ValueError("Not a columnar dump: " + str(file))
+        header_length, = struct.unpack("<Q", f.read(8))
+        header = pickle.loads(f.read(header_length))
+    data_start = -(-(len(columnar_magic) + 8 + header_length) // columnar_alignment) * columnar_alignment
+
+    dump = dict(parameters = header["parameters"])
+    for name, (dtype, shape, offset) in header["arrays"].items():
+        if int(np.prod(shape)) == 0:
+            dump[name] = np.zeros(shape, dtype = dtype)
+        else:
+            dump[name] = np.memmap(file, dtype = dtype, mode = "r", offset = data_start + offset, shape = tuple(shape))
+    return dump
+
+
+def iter_stream(file):
+    """
+    Read a stream dump one day at a time
+
+    Parameters
+    ----------
+    file: string
+        Path of the file
+
+    Return
+    ------
+    nets: generator of ig.Graph()
+        The contact network of each day, only one is in memory at a time
+
+    """
+
+    with open_read(file) as f:
+        # skip the header
+        pickle.load(f)
+        while True:
+            try:
+                yield pickle.load(f)
+            except EOFError:
+                return
+
+
+def iter_days(path, dump_type):
+    """
+    Iterate over the contact network of each day of a dump with the networks (full or stream).
+    Stream dumps are read in constant memory, full dumps must be unpickled at once
+
+    Parameters
+    ----------
+    path: string
+        Path of the dump without the file extension
+
+    dump_type: string
+        Either "full" or "stream"
+
+    Return
+    ------
+    nets: generator of ig.Graph()
+        The contact network of each day
+
+    """
+
+    if dump_type == "stream":
+        yield from iter_stream(find_dump(path, dump_type))
+    elif dump_type == "full":
+        with open_read(find_dump(path, dump_type)) as f:
+            yield from pickle.load(f)["nets"]
+    else:
+        raise ValueError("Dump type " + str(dump_type) + " does not store the networks")
+
+
+def load_series(path, dump_type):
+    """
+    Read the daily series of a simulation from its dump
+
+    Parameters
+    ----------
+    path: string
+        Path of the dump without the file extension
+
+    dump_type: string
+        Type of the dump, one of dump_types
+
+    Return
+    ------
+    series: dict
+        A numpy array with one value per day for each name in series_names
+
+    """
+
+    file = find_dump(path, dump_type)
+    # mark as recently used, see storage.enforce_quota
+    touch(file)
+    if dump_type == "columnar":
+        with timer("read"):
+            dump = read_columnar(file)
+        with timer("aggregate"):
+            return aggregate_columns(dump["agent_status"], dump["test_result"], dump["quarantine"])
+    if dump_type == "stream":
+        # days are read and aggregated one at a time, the reading time is part of the aggregation
+        with timer("aggregate"):
+            return aggregate_nets(iter_stream(file))
+
+    with timer("read"):
+        with open_read(file) as f:
+            dump = pickle.load(f)
+    with timer("aggregate"):
+        if dump_type == "full":
+            return aggregate_nets(dump["nets"])
+        return {name: np.asarray(dump[name], dtype = np.int64) for name in series_names}
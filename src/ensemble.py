@@ -0,0 +1,55 @@
+import numpy as np
+
+
+# percentiles of the band drawn around the median
+band_percentiles = (5, 95)
+
+
+def stack_series(series_list):
+    """
+    Stack the daily series of many runs of the same scenario in (runs, days) matrices.
+    Shorter runs are padded with their last value. The "infected" series (E + I) is added
+
+    Parameters
+    ----------
+    series_list: list of dict
+        The series of each run, as returned by load_series
+
+    Return
+    ------
+    stacked: dict
+        A (runs, days) numpy array for each series name
+
+    """
+
+    n_days = max(len(series['S']) for series in series_list)
+    stacked = dict()
+    for name in series_list[0].keys():
+        stacked[name] = np.stack([np.pad(series[name], (0, n_days - len(series[name])), mode = 'edge') for series in series_list])
+    stacked['infected'] = stacked['E'] + stacked['I']
+    return stacked
+
+
+def ensemble_statistics(series_list):
+    """
+    Reduce the daily series of many runs (e.g. one per seed) to their daily mean, median and percentile band
+
+    Parameters
+    ----------
+    series_list: list of dict
+        The series of each run, as returned by load_series
+
+    Return
+    ------
+    statistics: dict
+        For each series name a dict with "mean", "median", "low" and "high" numpy arrays,
+        low and high are the band_percentiles of each day
+
+    """
+
+    statistics = dict()
+    for name, values in stack_series(series_list).items():
+        low, median, high = np.percentile(values, [band_percentiles[0], 50, band_percentiles[1]], axis = 0)
+        statistics[name] = dict(mean = values.mean(axis = 0), median = median, low = low, high = high)
+    return statistics
+
@@ -0,0 +1,25 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+
+# number of worker processes, by default one for each available core
+max_workers = int(os.environ.get("SIMULATOR_WORKERS", os.cpu_count() or 1))
+
+_pool = None
+
+
+def get_pool():
+    """
+    Return the process pool shared by all the simulation requests, creating it on first use
+
+    Return
+    ------
+    pool: ProcessPoolExecutor
+        Pool of worker processes that run the simulations
+
+    """
+
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers = max_workers)
+    return _pool
@@ -0,0 +1,206 @@
+import hashlib, io, json, os, threading, uuid, zipfile
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+import plotly.graph_objs as go
+import plotly.io as pio
+
+from src import cache
+from src.figures import build_figures, read_payload
+
+
+# bump to invalidate the cached exports when the figures change
+export_version = 1
+
+export_formats = ["pdf", "png"]
+
+# renderer processes, each worker keeps its kaleido renderer alive between the exports
+max_workers = int(os.environ.get("SIMULATOR_EXPORT_WORKERS", 1))
+
+# size of the exported figures in pixels, png are rendered at scale times this size
+width = 1000
+height = 600
+scale = 2
+
+# how many exports are remembered for polling
+max_exports = 100
+
+_pool = None
+_exports = OrderedDict()
+_lock = threading.Lock()
+
+
+def warm_renderer():
+    """
+    Start the renderer of a worker process with a first empty figure, so that the first export does not wait for it.
+    Without kaleido nothing is started, the exports fail with the plotly error message
+    """
+
+    try:
+        pio.to_image(go.Figure(), format = "png", engine = "kaleido")
+    except (ImportError, ValueError):
+        pass
+
+
+def get_export_pool():
+    """
+    Return the pool of renderer processes, creating it on first use. It is separated from the simulation pool,
+    so that exports never wait for the simulations
+
+    Return
+    ------
+    pool: ProcessPoolExecutor
+        Pool of worker processes that render the figures
+
+    """
+
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers = max_workers, initializer = warm_renderer)
+    return _pool
+
+
+def export_key(results, formats):
+    """
+    Compute the content address of the export of a sim_results payload
+
+    Parameters
+    ----------
+    results: dict
+        Payload of the sim_results store, see results_payload
+
+    formats: list of string
+        Formats of the exported figures, from export_formats
+
+    Return
+    ------
+    key: string
+        Hex digest identifying the export
+
+    """
+
+    encoded = json.dumps(dict(results = results, formats = sorted(formats), width = width, height = height, scale = scale,
+                              export_version = export_version), sort_keys = True)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+def bundle_path(key):
+    """
+    Path of the zip bundle of an export, it is a cache entry evicted with the cached results
+    """
+
+    return cache.entry_path(key, ".export.zip")
+
+
+def render_bundle(key, results, formats):
+    """
+    Render all the figures of a sim_results payload inside a worker process and write them in a zip bundle,
+    one file for each figure with data and format, and the payload itself in results.json
+
+    Parameters
+    ----------
+    key: string
+        Key returned by export_key
+
+    results: dict
+        Payload of the sim_results store
+
+    formats: list of string
+        Formats of the exported figures
+
+    Return
+    ------
+    None
+
+    """
+
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as bundle:
+        for figure_id, figure in build_figures(read_payload(results)).items():
+            if not figure.get("data"):
+                continue
+            figure = go.Figure(figure)
+            for image_format in formats:
+                image = pio.to_image(figure, format = image_format, width = width, height = height,
+                                     scale = scale if image_format == "png" else 1, engine = "kaleido")
+                bundle.writestr(figure_id + "." + image_format, image)
+        bundle.writestr("results.json", json.dumps(results))
+
+    cache.cache_dir.mkdir(parents = True, exist_ok = True)
+    target = bundle_path(key)
+    tmp = str(target) + "." + uuid.uuid4().hex + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(buffer.getvalue())
+    os.replace(tmp, target)
+    cache.evict()
+
+
+def request_export(results, formats):
+    """
+    Start the export of a sim_results payload in the background and return immediately.
+    An export already in the cache, or being rendered, is not rendered again
+
+    Parameters
+    ----------
+    results: dict
+        Payload of the sim_results store
+
+    formats: list of string
+        Formats of the exported figures, from export_formats
+
+    Return
+    ------
+    key: string
+        Key of the export, to use for polling it with export_status
+
+    """
+
+    key = export_key(results, formats)
+    with _lock:
+        future = _exports.get(key)
+        if bundle_path(key).exists():
+            _exports[key] = None
+        elif future is None or future.done():
+            # new, failed or evicted from the cache
+            _exports[key] = get_export_pool().submit(render_bundle, key, results, formats)
+        _exports.move_to_end(key)
+
+        # forget the oldest finished exports
+        for old_key in list(_exports.keys()):
+            if len(_exports) <= max_exports:
+                break
+            if _exports[old_key] is None or _exports[old_key].done():
+                del _exports[old_key]
+    return key
+
+
+def export_status(key):
+    """
+    Get the current status of an export
+
+    Parameters
+    ----------
+    key: string
+        Key returned by request_export
+
+    Return
+    ------
+    status: dict
+        A dict with keys
+        - state: one of "unknown", "running", "done", "failed"
+        - error: error message if the export failed, else None
+
+    """
+
+    with _lock:
+        known = key in _exports
+        future = _exports.get(key)
+    if future is None or future.done():
+        if future is not None and future.exception() is not None:
+            return dict(state = "failed", error = str(future.exception()))
+        if bundle_path(key).exists():
+            return dict(state = "done", error = None)
+        if known:
+            return dict(state = "failed", error = "The export has been evicted from the cache, please export again")
+        return dict(state = "unknown", error = None)
+    return dict(state = "running", error = None)
@@ -0,0 +1,506 @@
+import os
+
+import numpy as np
+
+from src.ensemble import band_percentiles
+
+
+# traces longer than this are downsampled keeping the min and max of each bucket of days, 0 to disable
+max_points = int(os.environ.get("SIMULATOR_FIGURE_POINTS", 1000))
+# decimals kept for non integer values, e.g. the median of an ensemble
+decimals = 2
+
+restriction_line = dict(color = 'rgb(55, 83, 109)', dash = 'dot')
+# series of graph_sim: name of the series, name in the legend, line color and band color
+status_styles = [('S', 'S', 'Blue', 'rgba(0, 0, 255, 0.15)'),
+                 ('E', 'E', 'Orange', 'rgba(255, 165, 0, 0.15)'),
+                 ('I', 'I', 'Red', 'rgba(255, 0, 0, 0.15)'),
+                 ('R', 'R', 'Green', 'rgba(0, 128, 0, 0.15)'),
+                 ('D', 'deceduti', 'Black', 'rgba(0, 0, 0, 0.15)')]
+band_colors = {'Without restriction': 'rgba(31, 119, 180, 0.2)', 'With restriction': 'rgba(255, 127, 14, 0.2)'}
+
+figure_ids = ['graph_sim', 'graph_sim_without_restr', 'graph_infected', 'graph_dead',
+              'graph_Inf_daily', 'graph_dead_daily', 'graph_total_infected', 'graph_test']
+
+
+def encode(values):
+    """
+    Compact JSON encoding of an array: integers stay integers, other values are rounded to decimals
+
+    Parameters
+    ----------
+    values: np.ndarray
+        The values
+
+    Return
+    ------
+    values: list
+        The values as a list of int or float
+
+    """
+
+    values = np.asarray(values)
+    if values.dtype.kind in 'iub':
+        return values.astype(np.int64).tolist()
+    rounded = np.round(values.astype(np.float64), decimals)
+    if np.all(rounded == np.round(rounded)):
+        return rounded.astype(np.int64).tolist()
+    return rounded.tolist()
+
+
+def downsample(values, points):
+    """
+    Select at most points days of a series, keeping the first and the last day and the min and max of each bucket of days,
+    so that peaks are still drawn
+
+    Parameters
+    ----------
+    values: np.ndarray
+        The daily series
+
+    points: int
+        Maximum number of days to keep
+
+    Return
+    ------
+    index: np.ndarray
+        Sorted index of the kept days
+
+    """
+
+    n_days = len(values)
+    if n_days <= points:
+        return np.arange(n_days)
+    n_buckets = max(1, (points - 2) // 2)
+    bucket = np.arange(n_days) * n_buckets // n_days
+    # sorted by bucket and then by value: the first and last day of each bucket are its min and max
+    order = np.lexsort((values, bucket))
+    ends = np.cumsum(np.bincount(bucket, minlength = n_buckets))
+    index = np.concatenate([[0, n_days - 1], order[ends - 1], order[np.concatenate([[0], ends[:-1]])]])
+    return np.unique(index)
+
+
+def series_trace(values, name, points = None, **style):
+    """
+    Plotly trace of a daily series starting at day 1. The x axis is encoded as x0/dx, unless the series is downsampled
+
+    Parameters
+    ----------
+    values: np.ndarray
+        The daily series
+
+    name: string
+        Name in the legend
+
+    points: int
+        Downsample to at most points days, default max_points
+
+    style:
+        Other attributes of the trace, e.g. marker or type
+
+    Return
+    ------
+    trace: dict
+        The trace
+
+    """
+
+    points = max_points if points is None else points
+    if points and len(values) > points:
+        index = downsample(values, points)
+        trace = {'x': (index + 1).tolist(), 'y': encode(values[index]), 'name': name}
+    else:
+        trace = {'x0': 1, 'dx': 1, 'y': encode(values), 'name': name}
+    trace.update(style)
+    return trace
+
+
+def restriction_traces(initial_day_restriction, restriction_duration, top, begin_name = 'Begin restriction'):
+    """
+    Vertical dotted lines at the begin and at the end of the restriction
+
+    Parameters
+    ----------
+    initial_day_restriction: int
+        Day of the begin of the restriction
+
+    restriction_duration: int
+        Duration of the restriction
+
+    top: float
+        Height of the lines
+
+    begin_name: string
+        Name in the legend of the first line
+
+    Return
+    ------
+    traces: list of dict
+        The two traces
+
+    """
+
+    top = encode([top])[0]
+    end = initial_day_restriction + restriction_duration
+    return [{'x': [initial_day_restriction, initial_day_restriction], 'y': [0, top], 'type': 'scatter', 'line': restriction_line, 'name': begin_name},
+            {'x': [end, end], 'y': [0, top], 'type': 'scatter', 'line': restriction_line, 'name': 'End restriction'}]
+
+
+def band_traces(statistics, cut, name, color, points = None):
+    """
+    Plotly traces drawing the percentile band of a series as a filled area
+
+    Parameters
+    ----------
+    statistics: dict
+        Statistics of one series, see ensemble_statistics
+
+    cut: int
+        Number of days to plot
+
+    name: string
+        Name of the series in the legend
+
+    color: string
+        rgba fill color
+
+    points: int
+        Downsample to at most points days, default max_points
+
+    Return
+    ------
+    traces: list of dict
+        Upper and lower bound traces, the lower one is filled up to the upper one
+
+    """
+
+    legend = name + ' ' + str(band_percentiles[0]) + '-' + str(band_percentiles[1]) + '%'
+    return [series_trace(statistics['high'][:cut], legend, points, legendgroup = legend, showlegend = False,
+                         mode = 'lines', line = {'width': 0}, hoverinfo = 'skip'),
+            series_trace(statistics['low'][:cut], legend, points, legendgroup = legend,
+                         mode = 'lines', line = {'width': 0}, fill = 'tonexty', fillcolor = color, hoverinfo = 'skip')]
+
+
+def cut_day(series_rest, series, number_of_steps):
+    """
+    Number of days to plot: up to the first day without exposed and infected people in both the scenarios
+
+    Parameters
+    ----------
+    series_rest: dict
+        Daily series with restriction, see load_series
+
+    series: dict
+        Daily series without restriction
+
+    number_of_steps: int
+        Number of simulated days
+
+    Return
+    ------
+    cut: int
+        Number of days to plot
+
+    """
+
+    n_days = min(len(series_rest['E']), len(series['E']))
+    over = (series_rest['E'][:n_days] + series_rest['I'][:n_days] == 0) & (series['E'][:n_days] + series['I'][:n_days] == 0)
+    if over.any():
+        return int(np.argmax(over)) + 1
+    return number_of_steps
+
+
+def pad(values, n_days, mode = 'constant'):
+    """
+    Extend a daily series to n_days, with zeros (mode "constant") or its last value (mode "edge")
+    """
+
+    return np.pad(values, (0, max(0, n_days - len(values))), mode = mode)
+
+
+def daily_increment(decreasing, first):
+    """
+    Daily increment of a cumulative series, e.g. new infected from S (decreasing) or new dead from D
+
+    Parameters
+    ----------
+    decreasing: np.ndarray
+        The cumulative series with the sign such that the increment is decreasing[i - 1] - decreasing[i]
+
+    first: float
+        Value of the first day
+
+    Return
+    ------
+    increment: np.ndarray
+        The increment of each day
+
+    """
+
+    increment = np.empty(len(decreasing), dtype = np.result_type(decreasing, first))
+    if len(decreasing) > 0:
+        increment[0] = first
+        increment[1:] = decreasing[:-1] - decreasing[1:]
+    return increment
+
+
+def results_payload(series_rest, series, number_of_steps, initial_day_restriction, restriction_duration,
+                    ensemble_rest = None, ensemble = None, n_runs = 1):
+    """
+    Compact JSON payload with everything needed to build the figures of a simulation, e.g. for a dcc.Store
+
+    Parameters
+    ----------
+    series_rest: dict
+        Daily series with restriction as numpy arrays, see load_series
+
+    series: dict
+        Daily series without restriction
+
+    number_of_steps: int
+        Number of simulated days
+
+    initial_day_restriction: int
+        Day of the begin of the restriction
+
+    restriction_duration: int
+        Duration of the restriction
+
+    ensemble_rest: dict
+        Statistics of the ensemble with restriction (see ensemble_statistics), to draw the percentile bands.
+        Then series_rest is usually the median
+
+    ensemble: dict
+        Statistics of the ensemble without restriction
+
+    n_runs: int
+        Number of runs of the ensemble, shown in the titles
+
+    Return
+    ------
+    payload: dict
+        The payload, see read_payload
+
+    """
+
+    payload = dict(series_rest = {name: encode(values) for name, values in series_rest.items()},
+                   series = {name: encode(values) for name, values in series.items()},
+                   number_of_steps = number_of_steps,
+                   initial_day_restriction = initial_day_restriction,
+                   restriction_duration = restriction_duration,
+                   n_runs = n_runs,
+                   ensemble_rest = None,
+                   ensemble = None)
+    if ensemble_rest is not None and ensemble is not None:
+        # only the bands that are drawn
+        for key, statistics in [('ensemble_rest', ensemble_rest), ('ensemble', ensemble)]:
+            payload[key] = {name: dict(low = encode(statistics[name]['low']), high = encode(statistics[name]['high']))
+                            for name in [status for status, name, color, band in status_styles] + ['infected']}
+    return payload
+
+
+def read_payload(payload):
+    """
+    Read the payload of results_payload back to numpy arrays
+
+    Parameters
+    ----------
+    payload: dict
+        The payload
+
+    Return
+    ------
+    results: dict
+        Same keys of the payload, with numpy arrays in place of lists
+
+    """
+
+    results = dict(payload)
+    results['series_rest'] = {name: np.asarray(values) for name, values in payload['series_rest'].items()}
+    results['series'] = {name: np.asarray(values) for name, values in payload['series'].items()}
+    for key in ['ensemble_rest', 'ensemble']:
+        if payload.get(key) is not None:
+            results[key] = {name: {bound: np.asarray(values) for bound, values in statistics.items()} for name, statistics in payload[key].items()}
+    return results
+
+
+def layout(title, yaxis, xaxis = True):
+    """
+    Layout of a figure with a title and the axis titles, the x axis is the day
+    """
+
+    if xaxis:
+        return {'title': title, 'xaxis': {'title': 'Day'}, 'yaxis': {'title': yaxis}}
+    return {'title': title, 'yaxis': {'title': yaxis}}
+
+
+def comparison_figure(results, without, with_restriction, title, yaxis, points, begin_name = 'Begin restriction'):
+    """
+    Figure comparing a daily series with and without restriction, with the restriction lines up to the maximum of both
+    """
+
+    cut = cut_day(results['series_rest'], results['series'], results['number_of_steps'])
+    data = [series_trace(without[:cut], 'Without restriction', points), series_trace(with_restriction[:cut], 'With restriction', points)]
+    data += restriction_traces(results['initial_day_restriction'], results['restriction_duration'], max(without.max(), with_restriction.max()), begin_name)
+    return {'data': data, 'layout': layout(title, yaxis)}
+
+
+def add_bands(figure, results, series_name, points):
+    """
+    Add the percentile band of the ensemble without and with restriction to a comparison figure
+    """
+
+    if results.get('ensemble_rest') is None:
+        return figure
+    cut = cut_day(results['series_rest'], results['series'], results['number_of_steps'])
+    for key, name in [('ensemble', 'Without restriction'), ('ensemble_rest', 'With restriction')]:
+        figure['data'] += band_traces(results[key][series_name], cut, name, band_colors[name], points)
+    figure['layout']['title'] += ' (median of ' + str(results['n_runs']) + ' runs)'
+    return figure
+
+
+def n_days(results):
+    """
+    Number of days of the longest scenario
+    """
+
+    return max(len(results['series_rest']['S']), len(results['series']['S']))
+
+
+def status_figure(results, key, title, points):
+    """
+    Count of people in each status in one scenario, key is "series_rest" or "series"
+    """
+
+    values = results[key]
+    cut = cut_day(results['series_rest'], results['series'], results['number_of_steps'])
+    data = [series_trace(values[status][:cut], name, points, marker = {'color': color}) for status, name, color, band in status_styles]
+    data.append(series_trace(values['total'][:cut], 'Total', points))
+    data += restriction_traces(results['initial_day_restriction'], results['restriction_duration'], values['total'][0])
+    figure = {'data': data, 'layout': layout(title, 'Count')}
+
+    # percentile band of the ensemble around the median
+    if key == 'series_rest' and results.get('ensemble_rest') is not None:
+        for status, name, color, band in status_styles:
+            figure['data'] += band_traces(results['ensemble_rest'][status], cut, name, band, points)
+        figure['layout']['title'] += ' (median of ' + str(results['n_runs']) + ' runs)'
+    return figure
+
+
+def graph_sim(results, points = None):
+    return status_figure(results, 'series_rest', 'Contacts network model with restriction', points)
+
+
+def graph_sim_without_restr(results, points = None):
+    return status_figure(results, 'series', 'Contacts network model without restriction', points)
+
+
+def graph_infected(results, points = None):
+    # infected + exposed, zero after the end of a scenario
+    inf = pad(results['series']['I'] + results['series']['E'], n_days(results))
+    inf_rest = pad(results['series_rest']['I'] + results['series_rest']['E'], n_days(results))
+    figure = comparison_figure(results, inf, inf_rest, 'Comparison infected with and without restrictions', 'Number of incfected', points)
+    return add_bands(figure, results, 'infected', points)
+
+
+def graph_dead(results, points = None):
+    dead = pad(results['series']['D'], n_days(results), 'edge')
+    dead_rest = pad(results['series_rest']['D'], n_days(results), 'edge')
+    figure = comparison_figure(results, dead, dead_rest, 'Comparison dead with and without restrictions', 'Number of dead', points)
+    return add_bands(figure, results, 'D', points)
+
+
+def graph_Inf_daily(results, points = None):
+    # daily increment, zero after the end of a scenario
+    series, series_rest = results['series'], results['series_rest']
+    inf_daily = pad(daily_increment(series['S'], series['E'][0]), n_days(results))
+    inf_daily_rest = pad(daily_increment(series_rest['S'], series_rest['E'][0]), n_days(results))
+    return comparison_figure(results, inf_daily, inf_daily_rest, 'Comparison daily infected with and without restrictions', 'Number of infected', points)
+
+
+def graph_dead_daily(results, points = None):
+    series, series_rest = results['series'], results['series_rest']
+    dead_daily = pad(daily_increment(-series['D'], series['D'][0]), n_days(results))
+    dead_daily_rest = pad(daily_increment(-series_rest['D'], series_rest['D'][0]), n_days(results))
+    return comparison_figure(results, dead_daily, dead_daily_rest, 'Comparison daily dead with and without restrictions', 'Number of dead', points, 'Inizio restrizione')
+
+
+def graph_total_infected(results, points = None):
+    # total infected at the last day
+    series, series_rest = results['series'], results['series_rest']
+    return {'data': [{'x': ["Results"], 'y': encode([series['total'][-1] - series['S'][-1]]), 'type': 'bar', 'name': 'Without restriction'},
+                     {'x': ["Results"], 'y': encode([series_rest['total'][-1] - series_rest['S'][-1]]), 'type': 'bar', 'name': 'With restriction'}],
+            'layout': layout('Total number of infected people with and without restriction', 'Count', xaxis = False)}
+
+
+def graph_test(results, points = None):
+    # test made and quarantine people
+    series_rest = results['series_rest']
+    cut = cut_day(results['series_rest'], results['series'], results['number_of_steps'])
+    return {'data': [series_trace(series_rest['tested'][:cut], 'Test made', points, type = 'bar'),
+                     series_trace(series_rest['positive'][:cut], 'Positive test', points, type = 'bar'),
+                     series_trace(series_rest['quarantined'][:cut], 'Quarantine', points)],
+            'layout': {'title': 'Comparison quarantine test made and positive test',
+                       'yaxis': {'title': 'Count (log axis)', 'type': "log"}}}
+
+
+# function building each figure from the results, see read_payload
+figure_builders = {'graph_sim': graph_sim,
+                   'graph_sim_without_restr': graph_sim_without_restr,
+                   'graph_infected': graph_infected,
+                   'graph_dead': graph_dead,
+                   'graph_Inf_daily': graph_Inf_daily,
+                   'graph_dead_daily': graph_dead_daily,
+                   'graph_total_infected': graph_total_infected,
+                   'graph_test': graph_test}
+
+
+def build_figures(results, points = None):
+    """
+    Build all the figures of a simulation with and without restriction
+
+    Parameters
+    ----------
+    results: dict
+        Series and parameters of the simulation, see read_payload
+
+    points: int
+        Downsample each trace to at most points days, default max_points
+
+    Return
+    ------
+    figures: dict
+        The figure of each one of figure_ids
+
+    """
+
+    return {figure_id: figure_builders[figure_id](results, points) for figure_id in figure_ids}
+
+
+def catalog_figure(runs, series_name, points = None):
+    """
+    Overlay of the same daily series of many past runs, from the results catalog
+
+    Parameters
+    ----------
+    runs: list of dict
+        Runs with their compact series, see catalog.runs_series
+
+    series_name: string
+        "infected" or "dead"
+
+    points: int
+        Downsample each trace to at most points days, default max_points
+
+    Return
+    ------
+    figure: dict
+        The figure
+
+    """
+
+    data = list()
+    for run in runs:
+        name = run['name'] + (' (baseline)' if run['baseline'] else '') + ' #' + str(run['id'])
+        data.append(series_trace(np.asarray(run[series_name]), name, points, line = {'dash': 'dash'} if run['baseline'] else {}))
+    return {'data': data, 'layout': layout('Comparison of past runs', series_name.capitalize() + ' people')}
@@ -0,0 +1,592 @@
+import math, multiprocessing, os, queue, threading, time, uuid
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+
+from src import cache, catalog, executor, metrics, storage
+from src.aggregation import count_network
+from src.dumps import dump_file, load_series
+from src.simulation import simulate, no_restriction_scenario
+
+
+# how many jobs are remembered for polling, older finished jobs are forgotten
+max_jobs = 100
+
+# admission control: jobs not finished of each session, and jobs waiting for a worker over all the sessions.
+# Over these limits a new job is rejected with an estimate of when to retry
+max_session_jobs = int(os.environ.get("SIMULATOR_SESSION_JOBS", 2))
+max_queued_jobs = int(os.environ.get("SIMULATOR_QUEUED_JOBS", 20))
+# shortest retry hint in seconds, and duration of a scenario assumed before any is measured
+min_retry_after = 5
+default_scenario_seconds = 10
+
+_jobs = OrderedDict()
+_lock = threading.Lock()
+# scenarios waiting for a worker, one queue for each session in round robin order. At most executor.max_workers
+# scenarios are in the pool at once, so a session submitting many scenarios does not delay the others
+_pending = OrderedDict()
+_in_flight = 0
+_scenario_seconds = default_scenario_seconds
+_manager = None
+_updates = None
+_persisted = None
+
+
+def get_updates():
+    """
+    Return the queue shared with the worker processes where each simulation publishes its progress.
+    Items are (job_id, scenario_index, simulated_days, counts) tuples, counts is the count_network dict
+    of the last simulated day for live jobs, else None
+
+    Return
+    ------
+    updates: multiprocessing.managers.BaseProxy
+        Shared queue
+
+    """
+
+    global _manager, _updates, _persisted
+    if _updates is None:
+        _manager = multiprocessing.Manager()
+        _updates = _manager.Queue()
+        _persisted = _manager.Queue()
+    return _updates
+
+
+def get_persisted():
+    """
+    Return the queue shared with the worker processes where the scenarios whose dump is written in background
+    send their stats, once the dump is written. Items are stats dicts, see metrics.record_stats
+
+    Return
+    ------
+    persisted: multiprocessing.managers.BaseProxy
+        Shared queue
+
+    """
+
+    get_updates()
+    return _persisted
+
+
+def run_scenario(job_id, index, scenario, updates, live = False, record = False, persist = "async", node_states = False, persisted = None):
+    """
+    Run one scenario of a job inside a worker process, publishing its progress day by day, and send back its daily series.
+    If the same scenario was already simulated, its result is copied from the cache instead.
+    Once the dump is written the least recently used results are removed if simulator_results is over its budget,
+    see storage.enforce_quota
+
+    Parameters
+    ----------
+    job_id: string
+        Id of the job
+
+    index: int
+        Index of the scenario in the job
+
+    scenario: dict
+        Keyword arguments of the simulate call
+
+    updates: queue
+        Shared queue, see get_updates
+
+    live: bool
+        Publish also the daily count of people status, tests and quarantine
+
+    record: bool
+        Record the run in the results catalog, once its dump is written
+
+    persist: string
+        How the dump is written, see simulate
+
+    node_states: bool
+        Send back also the daily state of each node, see simulate
+
+    persisted: queue
+        Shared queue, see get_persisted. Needed with persist "async"
+
+    Return
+    ------
+    result: dict
+        A dict with keys
+        - series: the daily series, see simulate
+        - node_states: the node_states dict filled by simulate, None if not asked
+        - stats: timing and cache statistics of the scenario, recorded in the metrics of the server process, see metrics.record_stats.
+          None when the dump is written in background, the stats are then sent to persisted once it is written
+
+    """
+
+    def on_step(step_index, net):
+        updates.put((job_id, index, step_index + 1, count_network(net) if live else None))
+
+    def on_persisted(hit, series):
+        if record:
+            record_run(scenario, series, hit)
+        # the cached results have their own budget
+        storage.enforce_quota(exclude = [cache.cache_dir])
+        if background(hit):
+            persisted.put(stats)
+
+    def background(hit):
+        # a dump copied from the cache is already written
+        return persist == "async" and not hit
+
+    stats = dict()
+    states = dict() if node_states else None
+    hit, series = run_cached(scenario, on_step, stats, persist = persist, node_states = states,
+                             on_persisted = on_persisted if persist != "none" else None)
+    if hit:
+        updates.put((job_id, index, scenario["number_of_steps"], None))
+    # the stats still being filled by the background writer are not sent back here
+    return dict(series = series, node_states = states, stats = None if background(hit) else stats)
+
+
+def record_run(scenario, series, hit):
+    """
+    Record a run in the results catalog. The summary comes from the daily series of the run,
+    or from the catalog entry of the same scenario when the result was copied from the cache
+
+    Parameters
+    ----------
+    scenario: dict
+        Keyword arguments of the simulate call
+
+    series: dict
+        Daily series of the run, see simulate
+
+    hit: bool
+        If the result was copied from the cache
+
+    Return
+    ------
+    None
+
+    """
+
+    key = cache.scenario_key(scenario)
+    target = dump_file(scenario["path"], scenario["dump_type"])
+    entry = catalog.lookup(key) if hit else None
+    if entry is None:
+        # not a cache hit, recorded before the catalog existed, or with a removed catalog
+        entry = catalog.catalog_entry(series)
+    summary, compact = entry
+    catalog.record(target, scenario, key, summary, compact, os.path.getsize(target),
+                   baseline = no_restriction_scenario(scenario) == scenario)
+
+
+def run_cached(scenario, on_step = None, stats = None, persist = "sync", node_states = None, on_persisted = None):
+    """
+    Run one simulation, or copy its result from the cache if the same scenario was already simulated.
+    The dump is stored in the cache once written
+
+    Parameters
+    ----------
+    scenario: dict
+        Keyword arguments of the simulate call
+
+    on_step: callable
+        See simulate, not called when the result comes from the cache
+
+    stats: dict
+        If given, filled with the timing and cache statistics of the run, see metrics.record_stats
+
+    persist, node_states:
+        See simulate. The node states are not in every dump type, the cache is not used when they are asked.
+        With persist "none" the result is neither read from nor stored in the cache
+
+    on_persisted: callable
+        Called as on_persisted(hit, series) once the dump is written and stored in the cache, or copied from the cache.
+        With persist "async" and a cache miss it is called in the background thread writing the dump, once stats are complete
+
+    Return
+    ------
+    hit: bool
+        True if the result was copied from the cache
+
+    series: dict
+        The daily series of the run, see simulate
+
+    """
+
+    stats = dict() if stats is None else stats
+    seconds = stats.setdefault("seconds", dict())
+    key = cache.scenario_key(scenario) if persist != "none" else None
+    target = dump_file(scenario["path"], scenario["dump_type"])
+    if key is not None and node_states is None:
+        with metrics.timer("cache", seconds):
+            found = cache.fetch(key, target)
+        stats["result_cache"] = "hit" if found else "miss"
+        if found:
+            series = load_series(scenario["path"], scenario["dump_type"])
+            if on_persisted is not None:
+                on_persisted(True, series)
+            return True, series
+
+    def store(series):
+        with metrics.timer("cache", seconds):
+            cache.store(key, target)
+        if on_persisted is not None:
+            on_persisted(False, series)
+
+    series = simulate(on_step = on_step, stats = stats, persist = persist, node_states = node_states,
+                      on_persisted = store if persist != "none" else None, **scenario)
+    return False, series
+
+
+def scenario_done(job, future):
+    """
+    Record the metrics of a finished scenario, and of its job when it is the last one
+    """
+
+    if future.cancelled() or future.exception() is not None:
+        metrics.scenarios.inc(outcome = "failed")
+    else:
+        metrics.scenarios.inc(outcome = "done")
+        # else recorded by drain_updates once the dump is written
+        if future.result()["stats"] is not None:
+            metrics.record_stats(future.result()["stats"])
+
+    with _lock:
+        last = not job["finished"] and all(other.done() for other in job["futures"])
+        if last:
+            job["finished"] = True
+    if last:
+        metrics.job_seconds.observe(time.time() - job["submitted"])
+
+
+class Rejected(Exception):
+    """
+    A job refused by the admission control, retry_after is the number of seconds after which it is worth retrying
+    """
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def retry_after():
+    """
+    Estimate the seconds needed by the pool to run the scenarios already queued, from the duration of the last scenarios.
+    Call with _lock held
+    """
+
+    backlog = sum(len(scenarios) for scenarios in _pending.values()) + _in_flight
+    return max(min_retry_after, math.ceil(backlog * _scenario_seconds / executor.max_workers))
+
+
+def submit(scenarios, meta = None, live = False, record = False, persist = "async", node_states = False, session = None):
+    """
+    Enqueue a job made of independent scenarios and return immediately.
+    The scenarios of all the sessions share a fair queue in front of the pool, see dispatch
+
+    Parameters
+    ----------
+    scenarios: list of dict
+        Keyword arguments of the simulate call of each scenario
+
+    meta: dict
+        Any information needed to render the results once the job is done
+
+    live: bool
+        Collect the daily counts while the scenarios are simulated, see live_counts
+
+    record: bool
+        Record each run in the results catalog, see src.catalog
+
+    persist: string
+        How the dumps are written, see simulate. The results are sent back in memory anyway, see results.
+        By default the dumps are written in background, after the job is done
+
+    node_states: bool
+        Send back also the daily state of each node of each scenario, see results
+
+    session: string
+        Id of the user session submitting the job, see app.session_id. Default a single anonymous session
+
+    Return
+    ------
+    job_id: string
+        Id to use for polling the job with status
+
+    Raise
+    -----
+    Rejected
+        If the session has already max_session_jobs jobs not finished, or max_queued_jobs jobs are waiting for a worker
+
+    """
+
+    updates = get_updates()
+    job_id = uuid.uuid4().hex
+    session = "" if session is None else str(session)
+
+    with _lock:
+        unfinished = [job for job in _jobs.values() if not all(future.done() for future in job["futures"])]
+        if sum(job["session"] == session for job in unfinished) >= max_session_jobs:
+            metrics.rejected_jobs.inc(reason = "session")
+            raise Rejected("You already have " + str(max_session_jobs) + " simulations running or queued, wait for one of them to finish",
+                           retry_after())
+        if sum(not any(future.running() or future.done() for future in job["futures"]) for job in unfinished) >= max_queued_jobs:
+            metrics.rejected_jobs.inc(reason = "overload")
+            raise Rejected("The server is busy, too many simulations are waiting", retry_after())
+
+        _jobs[job_id] = dict(futures = [Future() for scenario in scenarios],
+                             steps = [scenario["number_of_steps"] for scenario in scenarios],
+                             days = [0 for scenario in scenarios],
+                             counts = [list() for scenario in scenarios],
+                             paths = [str(scenario["path"]) for scenario in scenarios],
+                             options = (updates, live, record, persist, node_states, get_persisted()),
+                             session = session,
+                             live = live,
+                             meta = meta,
+                             submitted = time.time(),
+                             finished = False)
+        job = _jobs[job_id]
+        _pending.setdefault(session, deque()).extend((job_id, index, scenario) for index, scenario in enumerate(scenarios))
+
+        # forget the oldest finished jobs
+        for old_id in list(_jobs.keys()):
+            if len(_jobs) <= max_jobs:
+                break
+            if all(future.done() for future in _jobs[old_id]["futures"]):
+                del _jobs[old_id]
+
+    # outside the lock, the callback runs immediately if the scenario is already done
+    for future in job["futures"]:
+        future.add_done_callback(lambda future: scenario_done(job, future))
+    dispatch()
+
+    return job_id
+
+
+def dispatch():
+    """
+    Send queued scenarios to the pool while it has idle workers, taking one scenario from each session in turn
+
+    Return
+    ------
+    None
+
+    """
+
+    global _in_flight
+    while True:
+        with _lock:
+            if _in_flight >= executor.max_workers or not _pending:
+                return
+            session, scenarios = next(iter(_pending.items()))
+            job_id, index, scenario = scenarios.popleft()
+            # the served session goes after the others
+            if scenarios:
+                _pending.move_to_end(session)
+            else:
+                del _pending[session]
+            job = _jobs[job_id]
+            future = job["futures"][index]
+            future.set_running_or_notify_cancel()
+            _in_flight += 1
+
+        try:
+            pool_future = executor.get_pool().submit(run_scenario, job_id, index, scenario, *job["options"])
+        except Exception as exception:
+            with _lock:
+                _in_flight -= 1
+            future.set_exception(exception)
+            continue
+        pool_future.add_done_callback(lambda pool_future, future = future, started = time.time(): scenario_finished(future, pool_future, started))
+
+
+def scenario_finished(future, pool_future, started):
+    """
+    Pass the outcome of a scenario run by the pool to the future of its job, then dispatch the next queued scenario
+    """
+
+    global _in_flight, _scenario_seconds
+    with _lock:
+        _in_flight -= 1
+        if not pool_future.cancelled() and pool_future.exception() is None:
+            _scenario_seconds = 0.8 * _scenario_seconds + 0.2 * (time.time() - started)
+
+    if pool_future.cancelled():
+        future.set_exception(RuntimeError("The simulation has been cancelled"))
+    elif pool_future.exception() is not None:
+        future.set_exception(pool_future.exception())
+    else:
+        future.set_result(pool_future.result())
+    dispatch()
+
+
+def queue_position(job_id):
+    """
+    Number of queued scenarios that will be sent to the pool before the first one of a job, following the round robin
+    of dispatch. Call with _lock held
+    """
+
+    queues = [deque(scenarios) for scenarios in _pending.values()]
+    ahead = 0
+    while queues:
+        for scenarios in list(queues):
+            if scenarios.popleft()[0] == job_id:
+                return ahead
+            ahead += 1
+            if not scenarios:
+                queues.remove(scenarios)
+    return ahead
+
+
+def drain_updates():
+    """
+    Move the progress published by the workers into the job records, and record the stats of the scenarios
+    whose dump has been written in background
+
+    Return
+    ------
+    None
+
+    """
+
+    if _updates is None:
+        return
+    while True:
+        try:
+            stats = _persisted.get_nowait()
+        except queue.Empty:
+            break
+        metrics.record_stats(stats)
+
+    updates = get_updates()
+    with _lock:
+        while True:
+            try:
+                job_id, index, days, counts = updates.get_nowait()
+            except queue.Empty:
+                break
+            job = _jobs.get(job_id)
+            if job is None:
+                continue
+            job["days"][index] = max(job["days"][index], days)
+            if counts is not None:
+                job["counts"][index].append(counts)
+
+
+def status(job_id):
+    """
+    Get the current status of a job
+
+    Parameters
+    ----------
+    job_id: string
+        Id returned by submit
+
+    Return
+    ------
+    status: dict
+        A dict with keys
+        - state: one of "unknown", "queued", "running", "done", "failed"
+        - progress: percent of simulated days over all the scenarios of the job, from 0 to 100
+        - position: for a queued job, the number of scenarios of any session that will start before it, else None
+        - error: error message if the job failed, else None
+        - live: if the job collects the daily counts
+        - meta: the meta dict given to submit
+
+    """
+
+    drain_updates()
+    with _lock:
+        job = _jobs.get(job_id)
+    if job is None:
+        return dict(state = "unknown", progress = 0, position = None, error = None, live = False, meta = None)
+
+    futures = job["futures"]
+    error = None
+    if all(future.done() for future in futures):
+        for future in futures:
+            if future.exception() is not None:
+                error = str(future.exception())
+                break
+        state = "failed" if error is not None else "done"
+        progress = 100
+    else:
+        state = "running" if any(future.running() or future.done() for future in futures) else "queued"
+        done_steps = 0
+        for index, future in enumerate(futures):
+            if future.done():
+                done_steps += job["steps"][index]
+            else:
+                done_steps += min(job["days"][index], job["steps"][index])
+        progress = min(99, int(100 * done_steps / max(1, sum(job["steps"]))))
+
+    position = None
+    if state == "queued":
+        with _lock:
+            position = queue_position(job_id)
+
+    return dict(state = state, progress = progress, position = position, error = error, live = job["live"], meta = job["meta"])
+
+
+def results(job_id):
+    """
+    Get the results sent back by the scenarios of a done job, without reading their dumps
+
+    Parameters
+    ----------
+    job_id: string
+        Id returned by submit
+
+    Return
+    ------
+    results: dict
+        For each scenario path, a dict with the daily series and the node_states (None if not asked), see run_scenario.
+        None if the job is unknown or not done
+
+    """
+
+    with _lock:
+        job = _jobs.get(job_id)
+    if job is None or not all(future.done() for future in job["futures"]):
+        return None
+    if any(future.exception() is not None for future in job["futures"]):
+        return None
+    return {path: dict(series = future.result()["series"], node_states = future.result()["node_states"])
+            for path, future in zip(job["paths"], job["futures"])}
+
+
+def live_counts(job_id, start = None):
+    """
+    Get the daily counts published so far by the scenarios of a live job
+
+    Parameters
+    ----------
+    job_id: string
+        Id returned by submit
+
+    start: list of int
+        For each scenario, the number of days to skip (e.g. already shown). Default all the days
+
+    Return
+    ------
+    counts: list of list of dict
+        For each scenario, the count_network dict of each new day
+
+    """
+
+    drain_updates()
+    with _lock:
+        job = _jobs.get(job_id)
+        if job is None:
+            return list()
+        if start is None:
+            start = [0 for counts in job["counts"]]
+        return [list(counts[skip:]) for counts, skip in zip(job["counts"], start)]
+
+
+def scenario_states():
+    """
+    Number of scenarios of the remembered jobs waiting for a worker and being simulated
+    """
+
+    with _lock:
+        futures = [future for job in _jobs.values() for future in job["futures"] if not future.done()]
+    running = sum(future.running() for future in futures)
+    return [(dict(state = "queued"), len(futures) - running), (dict(state = "running"), running)]
+
+
+metrics.register(metrics.Gauge("simulator_scenarios", "Scenarios waiting for a worker and being simulated", scenario_states))
@@ -1,8 +1,11 @@
 import dash_core_components as dcc
 import dash_html_components as html
 import dash_bootstrap_components as dbc
+import dash_table
 import statistics as stat
 
+from src.sweep import sweep_parameters, sweep_metrics
+
 
 # statistic to plot   
 age_range = ["0-9", "10-19", "20-29", "30-39", "40-49", "50-59", "60-69", "70-79", "80-89", "90+"]
@@ -24,7 +27,7 @@ form = dbc.Card(
         dbc.FormGroup(
             [
                 dbc.Label("Number of families: "),
-                dbc.Input(id="n_of_families", type="number", value=150, min = 10, max = 150),
+                dbc.Input(id="n_of_families", type="number", value=150, min = 10, max = 1000),
             ]
         ),
 
@@ -38,7 +41,14 @@ form = dbc.Card(
         dbc.FormGroup(
             [
                 dbc.Label("Simulation days:"),
-                dbc.Input(id="number_of_steps", type="number", value=150, min = 10, max = 150),
+                dbc.Input(id="number_of_steps", type="number", value=150, min = 10, max = 1000),
+            ]
+        ),
+
+        dbc.FormGroup(
+            [
+                dbc.Label("Number of runs (seeds):"),
+                dbc.Input(id="n_seeds", type="number", value=1, min = 1, max = 100),
             ]
         ),
 
@@ -143,7 +153,7 @@ form = dbc.Card(
                 dcc.Dropdown(
                     id="policy_test",
                     options=[
-                        {"label": col, "value": col} for col in ['Random', 'Degree Centrality', 'Betweenness Centrality']
+                        {"label": col, "value": col} for col in ['Random', 'Degree Centrality', 'Betweenness Centrality', 'Approximate Betweenness']
                     ],
                     value="Random",
                     clearable=False
@@ -189,6 +199,8 @@ form = dbc.Card(
                 options=[
                     {'label': 'full', 'value': 'full'},
                     {'label': 'light', 'value': 'light'},
+                    {'label': 'columnar', 'value': 'columnar'},
+                    {'label': 'stream', 'value': 'stream'},
                 ],
                 value='light',
                 labelStyle={'display': 'block'}
@@ -207,9 +219,44 @@ form = dbc.Card(
         dbc.FormGroup(
             [   
             
+            dbc.Checklist(
+                options=[
+                    {"label": "Live charts", "value": 1},
+                ],
+                value=[],
+                id="live_update",
+                switch=True,
+            ),
+            html.Br(),
             dbc.Button("Run simulation", id="run_sim",  color="primary", className="mr-1", block=True),
             html.Br(),
             dbc.Alert("Check the value of parameters or the name of results file!", id = 'alert_id', color="danger", is_open=False),
+            # shown when the simulations are refused by the admission control
+            dbc.Alert(id = 'busy_alert', color="warning", is_open=False),
+            
+            # progress of the running simulation, polled from the background job
+            dbc.Progress(id="job_progress", value=0, striped=True, animated=True, style={'height': '25px'}),
+            dcc.Interval(id="job_interval", interval=1000, disabled=True),
+            dcc.Store(id="job_id"),
+            dcc.Store(id="job_done"),
+            dcc.Store(id="live_sent"),
+            dcc.Store(id="sim_results"),
+
+            # figures exported in background, downloaded as a zip bundle
+            html.Br(),
+            dbc.Checklist(
+                options=[
+                    {"label": "PDF", "value": "pdf"},
+                    {"label": "PNG", "value": "png"},
+                ],
+                value=["pdf"],
+                id="export_formats",
+                inline=True,
+            ),
+            dbc.Button("Export figures", id="export_button", color="secondary", className="mr-1", block=True, disabled=True),
+            html.Div(id="export_status", className="mt-2"),
+            dcc.Interval(id="export_interval", interval=1000, disabled=True),
+            dcc.Store(id="export_key"),
             ]   
             ),
     ],
@@ -231,7 +278,7 @@ tab1_content = dbc.Card(
                     html.Br(),
                     dbc.Alert(
                         [
-                            "This is a light version only for demo. In this version the number of family and step are limited at 150 for not exceeding heroku timeout. Full code without limitation is available at:  ",
+                            "This is a light version only for demo. In this version the number of family and step are limited at 1000. Simulations run in background, the progress bar below the form shows how much is left. Full code without limitation is available at:  ",
                             html.A("here clikkabile", href=gitlink, className="alert-link"),
                         ],
                         color="warning",
@@ -243,6 +290,7 @@ tab1_content = dbc.Card(
                         html.Li('Number of families - The number of families involved in the simulation. A family is a group of people that live together'),
                         html.Li('Number of initial exposed people - Usually called patient zero. This parameter represents the number of the people that are infected at the beginning of the simulation '),
                         html.Li('Simulation days - An integer number that represents the number of days of the simulation '),
+                        html.Li('Number of runs - How many times each scenario is simulated with a different random seed. With more than one run the charts show the median and the 5-95% band of the runs '),
                         html.Li('Incubation days - This is the first epidemic parameter and it represents a mean of the number of days of incubation '),
                         html.Li('Disease duration - the avarage duration of the Covid-19 disease'),
                         html.Li('R0 - It is a decimal parameter and it is a mathematical term that indicates how contagious an infectious disease is '),
@@ -251,7 +299,7 @@ tab1_content = dbc.Card(
                         html.Li('sociability distance strictness - This parameter is a percentile that you can set through a slidebar. If this parameter is equal to 0%, it means that no sociability distance has been adopted, on the contrary, the strictness of the sociability distance is very high'),
                         html.Li('Decreasing restrionction - If enabled, the restriction decrease with the evolution of the simulation'),
                         html.Li('Daily number of test - This parameter represents the number of tests that are carried out daily '),
-                        html.Li('Policy test - The policy under which the tests are carried out. You can choose 3 different options: random, throut a computation of degree centrality or with a computation of between centrality (it may require more time for huge simulations) '),
+                        html.Li('Policy test - The policy under which the tests are carried out. You can choose 4 different options: random, throut a computation of degree centrality, with a computation of between centrality (it may require more time for huge simulations) or with an estimate of between centrality from a sample of nodes, much faster on huge simulations '),
                         html.Li('Contact tracing efficiency - the efficiency of contract tracing. This is a percentile which can be set through a slidebar'),
                     ]),
                     html.H3("Output components"),
@@ -398,6 +446,144 @@ tab1_content = dbc.Card(
 
 
 
+# parameter sweep form, empty fields use the value of the simulator form
+sweep_form = dbc.Card(
+    [
+        html.H3("Parameter grid"),
+        html.Br(),
+        html.P("Comma separated values of each parameter. Empty fields use the value set in the simulator tab, all the other parameters are taken from the simulator tab too."),
+        dbc.FormGroup(
+            [
+                dbc.Label("Social distance strictness (0-4):"),
+                dbc.Input(id="sweep_social_distance_strictness", type="text", value="0, 1, 2, 3, 4"),
+            ]
+        ),
+        dbc.FormGroup(
+            [
+                dbc.Label("Daily number of test:"),
+                dbc.Input(id="sweep_n_test", type="text", value="0, 10, 20"),
+            ]
+        ),
+        dbc.FormGroup(
+            [
+                dbc.Label("Contact tracing efficiency (0-100):"),
+                dbc.Input(id="sweep_contact_tracing_efficiency", type="text", value="0, 50, 100"),
+            ]
+        ),
+        dbc.FormGroup(
+            [
+                dbc.Label("R_0:"),
+                dbc.Input(id="sweep_R_0", type="text", value=""),
+            ]
+        ),
+        html.Br(),
+        dbc.FormGroup(
+            [
+            dbc.Button("Run sweep", id="run_sweep",  color="primary", className="mr-1", block=True),
+            html.Br(),
+            dbc.Alert(id = 'sweep_alert', color="danger", is_open=False),
+            dbc.Progress(id="sweep_progress", value=0, striped=True, animated=True, style={'height': '25px'}),
+            dcc.Interval(id="sweep_interval", interval=1000, disabled=True),
+            dcc.Store(id="sweep_job_id"),
+            dcc.Store(id="sweep_results"),
+            ]
+            ),
+    ],
+    body=True,
+    style = {'background-color': '#f2f2f2', 'border-radius': '4px', 'box-shadow': '2px 2px 2px lightgrey'},
+)
+
+
+# parameter sweep tab
+tab3_content = dbc.Card(
+    dbc.CardBody(
+        [
+            html.Br(),
+            html.H3("Parameter sweep tab"),
+            html.Br(),
+            html.P('In this tab you can simulate every combination of the values of social distance strictness, daily number of test, contact tracing efficiency and R0. Each point of the grid is simulated once (results already computed are reused) and only its summary is kept: total infected, total dead, peak of infected and day of the peak. The heatmap shows a metric over two parameters, averaged over the other ones, the slice plot shows the same metric with one line for each value of the second parameter.'),
+            dbc.Row(
+                [
+                    dbc.Col(sweep_form, md=4),
+                    dbc.Col([
+                        dbc.Container([
+                            html.Br(),
+                            dbc.Row([
+                                dbc.Col([dbc.Label("X axis:"), dcc.Dropdown(id="sweep_x", options=[{"label": label, "value": name} for name, label in sweep_parameters.items()], value="social_distance_strictness", clearable=False)], md=4),
+                                dbc.Col([dbc.Label("Y axis:"), dcc.Dropdown(id="sweep_y", options=[{"label": label, "value": name} for name, label in sweep_parameters.items()], value="n_test", clearable=False)], md=4),
+                                dbc.Col([dbc.Label("Metric:"), dcc.Dropdown(id="sweep_metric", options=[{"label": label, "value": name} for name, label in sweep_metrics.items()], value="total_infected", clearable=False)], md=4),
+                            ]),
+                            html.Br(),
+                            dbc.Spinner(dcc.Graph(id="sweep_heatmap"), color="primary"),
+                            html.Br(),
+                            dbc.Spinner(dcc.Graph(id="sweep_slices"), color="primary"),
+                            html.Br(),
+                        ], fluid = True),
+                    ], style = {'background-color': '#f2f2f2', 'border-radius': '4px', 'box-shadow': '2px 2px 2px lightgrey'},
+                    md=8),
+                ],
+            ),
+        ]
+    ),
+    className="mt-3",
+)
+
+
+# columns of the results catalog table
+catalog_columns = [
+    {"name": "Name", "id": "name"},
+    {"name": "Created", "id": "created"},
+    {"name": "Baseline", "id": "baseline"},
+    {"name": "Families", "id": "n_of_families", "type": "numeric"},
+    {"name": "Days", "id": "number_of_steps", "type": "numeric"},
+    {"name": "R0", "id": "R_0", "type": "numeric"},
+    {"name": "Strictness", "id": "social_distance_strictness", "type": "numeric"},
+    {"name": "Tests", "id": "n_test", "type": "numeric"},
+    {"name": "Policy", "id": "policy_test"},
+    {"name": "Tracing (%)", "id": "contact_tracing_efficiency", "type": "numeric"},
+    {"name": "Seed", "id": "seed", "type": "numeric"},
+    {"name": "Total infected", "id": "total_infected", "type": "numeric"},
+    {"name": "Total dead", "id": "total_dead", "type": "numeric"},
+    {"name": "Peak infected", "id": "peak_infected", "type": "numeric"},
+    {"name": "Peak day", "id": "peak_day", "type": "numeric"},
+    {"name": "Dump", "id": "dump_type"},
+    {"name": "Size (kB)", "id": "file_kb", "type": "numeric"},
+    {"name": "On disk", "id": "exists"},
+]
+
+
+# results catalog tab
+tab4_content = dbc.Card(
+    dbc.CardBody(
+        [
+            html.Br(),
+            html.H3("Results catalog tab"),
+            html.Br(),
+            html.P('In this tab you can browse the simulations saved in simulator_results, with their parameters and summary. Type in the row below the header to filter a column (e.g. > 100 or Random), click a header to sort, select some runs to compare their daily series. Everything comes from the catalog index, the dumps are not read.'),
+            dbc.Row(
+                [
+                    dbc.Col(dbc.Button("Refresh", id="catalog_refresh", color="primary", block=True), md=2),
+                    dbc.Col(dcc.Dropdown(id="catalog_series", options=[{"label": "Infected", "value": "infected"}, {"label": "Dead", "value": "dead"}], value="infected", clearable=False), md=3),
+                ],
+            ),
+            html.Br(),
+            dash_table.DataTable(
+                id="catalog_table",
+                columns=catalog_columns,
+                row_selectable="multi",
+                filter_action="native",
+                sort_action="native",
+                page_size=15,
+                style_table={'overflowX': 'auto'},
+            ),
+            html.Br(),
+            dcc.Graph(id="catalog_overlay"),
+        ]
+    ),
+    className="mt-3",
+)
+
+
 # statistics tab
 tab2_content = dbc.Container(
         [   
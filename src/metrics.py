@@ -0,0 +1,187 @@
+import threading, time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+
+# upper bounds in seconds of the latency histograms
+latency_buckets = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+_lock = threading.Lock()
+_metrics = OrderedDict()
+
+
+def format_labels(labels):
+    """
+    Prometheus text format of a label set, e.g. {stage="read"}
+    """
+
+    if not labels:
+        return ""
+    return "{" + ",".join(name + '="' + str(value).replace("\\", "\\\\").replace('"', '\\"') + '"' for name, value in labels) + "}"
+
+
+def format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """
+    Monotonic counter, one value for each label set
+    """
+
+    kind = "counter"
+
+    def __init__(self, name, documentation):
+        self.name = name
+        self.documentation = documentation
+        self.values = dict()
+
+    def inc(self, value = 1, **labels):
+        key = tuple(sorted(labels.items()))
+        with _lock:
+            self.values[key] = self.values.get(key, 0) + value
+
+    def samples(self):
+        with _lock:
+            return [(self.name, key, value) for key, value in self.values.items()]
+
+
+class Gauge:
+    """
+    Value read when the metrics are collected, function returns either a number or a list of (labels dict, number)
+    """
+
+    kind = "gauge"
+
+    def __init__(self, name, documentation, function):
+        self.name = name
+        self.documentation = documentation
+        self.function = function
+
+    def samples(self):
+        value = self.function()
+        if isinstance(value, list):
+            return [(self.name, tuple(sorted(labels.items())), number) for labels, number in value]
+        return [(self.name, (), value)]
+
+
+class Histogram:
+    """
+    Distribution of observed values in cumulative buckets, one histogram for each label set.
+    Percentiles are computed by the monitoring system, e.g. histogram_quantile(0.95, ...) in Prometheus
+    """
+
+    kind = "histogram"
+
+    def __init__(self, name, documentation, buckets = latency_buckets):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(buckets) + (float("inf"),)
+        self.values = dict()
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with _lock:
+            counts, total = self.values.get(key, ([0] * len(self.buckets), 0.0))
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[index] += 1
+            self.values[key] = (counts, total + value)
+
+    def samples(self):
+        samples = list()
+        with _lock:
+            for key, (counts, total) in self.values.items():
+                for bound, count in zip(self.buckets, counts):
+                    samples.append((self.name + "_bucket", key + (("le", format_value(bound)),), count))
+                samples.append((self.name + "_sum", key, total))
+                samples.append((self.name + "_count", key, counts[-1]))
+        return samples
+
+
+def register(metric):
+    """
+    Add a metric to the ones exposed by render, a metric with the same name is replaced
+    """
+
+    with _lock:
+        _metrics[metric.name] = metric
+    return metric
+
+
+def render():
+    """
+    All the registered metrics in the Prometheus text exposition format
+
+    Return
+    ------
+    text: string
+        The metrics
+
+    """
+
+    with _lock:
+        metrics = list(_metrics.values())
+    lines = list()
+    for metric in metrics:
+        lines.append("# HELP " + metric.name + " " + metric.documentation)
+        lines.append("# TYPE " + metric.name + " " + metric.kind)
+        for name, labels, value in metric.samples():
+            lines.append(name + format_labels(labels) + " " + format_value(value))
+    return "\n".join(lines) + "\n"
+
+
+stage_seconds = register(Histogram("simulator_stage_seconds", "Time spent in each stage: cache, network, simulate, write, read, aggregate, figures"))
+job_seconds = register(Histogram("simulator_job_seconds", "Time from the submission of a job to the end of its last scenario"))
+scenarios = register(Counter("simulator_scenarios_total", "Scenarios run by the workers, by outcome"))
+cache_requests = register(Counter("simulator_cache_requests_total", "Lookups in the result and network caches, by cache and result"))
+dump_bytes = register(Counter("simulator_dump_bytes_total", "Bytes of the dumps written by the simulations"))
+rejected_jobs = register(Counter("simulator_rejected_jobs_total", "Jobs rejected by the admission control, by reason"))
+
+
+@contextmanager
+def timer(stage, stats = None):
+    """
+    Measure the time spent in a stage
+
+    Parameters
+    ----------
+    stage: string
+        Name of the stage
+
+    stats: dict
+        If given, the seconds are added to stats[stage] instead of being observed here,
+        e.g. inside a worker process that sends them back with its result, see record_stats
+
+    """
+
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        if stats is None:
+            stage_seconds.observe(elapsed, stage = stage)
+        else:
+            stats[stage] = stats.get(stage, 0.0) + elapsed
+
+
+def record_stats(stats):
+    """
+    Record the stats collected by a worker process for one scenario
+
+    Parameters
+    ----------
+    stats: dict
+        Seconds of each stage under "seconds", "dump_bytes", and the "result_cache" and "network_cache" results (hit or miss)
+
+    """
+
+    for stage, seconds in stats.get("seconds", {}).items():
+        stage_seconds.observe(seconds, stage = stage)
+    for cache in ["result", "network"]:
+        if stats.get(cache + "_cache") is not None:
+            cache_requests.inc(cache = cache, result = stats[cache + "_cache"])
+    dump_bytes.inc(stats.get("dump_bytes", 0))
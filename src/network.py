@@ -0,0 +1,208 @@
+import hashlib, io, json, os, random, uuid
+
+import igraph as ig
+import numpy as np
+
+from ctns.generator import generate_network
+from ctns.steps import step
+from ctns.utility import reset_network
+
+from src import cache
+from src.dumps import sex_codes, sociability_codes
+
+
+# node attributes fixed at generation, the others are reset to their initial value when loaded
+contact_attributes = ["family_contacts", "frequent_contacts", "occasional_contacts"]
+initial_attributes = dict(agent_status = 'S', infected = False, days_from_infection = 0, probability_of_being_infected = 0.0,
+                          quarantine = 0, test_validity = 0, test_result = -1, needs_IC = False)
+
+
+def network_key(n_of_families, seed):
+    """
+    Compute the cache key of the contact network generated with n_of_families and seed
+
+    Parameters
+    ----------
+    n_of_families: int
+        Number of families in the network
+
+    seed: int
+        Seed of the generation
+
+    Return
+    ------
+    key: string
+        Hex digest identifying the network
+
+    """
+
+    encoded = json.dumps(dict(network = True, n_of_families = n_of_families, seed = seed, cache_version = cache.cache_version), sort_keys = True)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+def mean_weighted_degree(G):
+    """
+    Average weighted degree of the network over 20 days, the same computation of ctns compute_TR:
+    the transmission rate is R_0 / ((infection_duration - incubation_days) * mean_weighted_degree)
+
+    Parameters
+    ----------
+    G: ig.Graph()
+        The contact network, its status is reset at the end
+
+    Return
+    ------
+    mean_degree: float
+        Average weighted degree
+
+    """
+
+    avr_deg = list()
+    for i in range(20):
+        step(G, i, 0, 0, 0, 0, 0, 0, False, list(), 0, "Random", 0)
+        degrees = G.strength(list(range(len(G.vs))), weights = "weight")
+        avr_deg.append(sum(degrees) / len(degrees))
+    reset_network(G)
+    return sum(avr_deg) / len(avr_deg)
+
+
+def save_network(file, G, mean_degree):
+    """
+    Save a generated network, its mean weighted degree and the state of the random generators in a compressed npz file
+
+    Parameters
+    ----------
+    file: string
+        Path of the file
+
+    G: ig.Graph()
+        The contact network, without edges
+
+    mean_degree: float
+        See mean_weighted_degree
+
+    Return
+    ------
+    None
+
+    """
+
+    arrays = dict(mean_degree = np.float64(mean_degree),
+                  age = np.asarray(G.vs["age"], dtype = np.int8),
+                  sex = np.asarray([sex_codes[value] for value in G.vs["sex"]], dtype = np.int8),
+                  sociability = np.asarray([sociability_codes[value] for value in G.vs["sociability"]], dtype = np.int8),
+                  pre_existing_conditions = np.asarray(G.vs["pre_existing_conditions"], dtype = np.int8),
+                  family_id = np.asarray(G.vs["family_id"], dtype = np.int32),
+                  death_rate = np.asarray(G.vs["death_rate"], dtype = np.float64))
+    # contact lists as flat (contacts, 2) arrays with the offset of each node
+    for name in contact_attributes:
+        contacts = G.vs[name]
+        arrays[name + "_offsets"] = np.cumsum([0] + [len(node_contacts) for node_contacts in contacts]).astype(np.int64)
+        arrays[name] = np.asarray([pair for node_contacts in contacts for pair in node_contacts], dtype = np.int32).reshape(-1, 2)
+
+    _, keys, position, has_gauss, cached_gaussian = np.random.get_state()
+    arrays.update(numpy_keys = keys, numpy_position = np.int64(position), numpy_gauss = np.asarray([has_gauss, cached_gaussian]))
+    version, state, gauss_next = random.getstate()
+    arrays.update(python_state = np.asarray(state, dtype = np.int64), python_version = np.int64(version),
+                  python_gauss = np.float64(np.nan if gauss_next is None else gauss_next))
+
+    buffer = io.BytesIO()
+    np.savez_compressed(buffer, **arrays)
+    tmp = str(file) + "." + uuid.uuid4().hex + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(buffer.getvalue())
+    os.replace(tmp, file)
+
+
+def load_network(file):
+    """
+    Load a network saved by save_network and restore the random generators as they were after its generation
+
+    Parameters
+    ----------
+    file: string
+        Path of the file
+
+    Return
+    ------
+    G: ig.Graph()
+        The contact network
+
+    mean_degree: float
+        See mean_weighted_degree
+
+    """
+
+    with np.load(file) as arrays:
+        n_nodes = len(arrays["age"])
+        G = ig.Graph(n_nodes)
+        sexes = list(sex_codes.keys())
+        sociabilities = list(sociability_codes.keys())
+        G.vs["sex"] = [sexes[code] for code in arrays["sex"]]
+        G.vs["age"] = arrays["age"].tolist()
+        G.vs["family_id"] = arrays["family_id"].tolist()
+        for name in contact_attributes:
+            offsets = arrays[name + "_offsets"]
+            pairs = [tuple(pair) for pair in arrays[name].tolist()]
+            G.vs[name] = [pairs[offsets[index]:offsets[index + 1]] for index in range(n_nodes)]
+        G.vs["sociability"] = [sociabilities[code] for code in arrays["sociability"]]
+        G.vs["pre_existing_conditions"] = arrays["pre_existing_conditions"].tolist()
+        G.vs["death_rate"] = arrays["death_rate"].tolist()
+        for name, value in initial_attributes.items():
+            G.vs[name] = [value] * n_nodes
+        G.vs["symptoms"] = [list() for index in range(n_nodes)]
+
+        has_gauss, cached_gaussian = arrays["numpy_gauss"]
+        np.random.set_state(("MT19937", arrays["numpy_keys"], int(arrays["numpy_position"]), int(has_gauss), float(cached_gaussian)))
+        gauss_next = float(arrays["python_gauss"])
+        random.setstate((int(arrays["python_version"]), tuple(arrays["python_state"].tolist()), None if np.isnan(gauss_next) else gauss_next))
+        mean_degree = float(arrays["mean_degree"])
+    return G, mean_degree
+
+
+def build_network(n_of_families, seed = None, stats = None):
+    """
+    Generate the contact network of a simulation and its mean weighted degree.
+    With a seed, the network is generated once and then loaded from the cache, together with the state of the random
+    generators, so that the simulation goes on exactly as if the network had just been generated
+
+    Parameters
+    ----------
+    n_of_families: int
+        Number of families in the network
+
+    seed: int
+        Seed of the generation, the random generators must be already seeded with it. None to skip the cache
+
+    stats: dict
+        If given, stats["network_cache"] is set to "hit" or "miss"
+
+    Return
+    ------
+    G: ig.Graph()
+        The contact network
+
+    mean_degree: float
+        See mean_weighted_degree
+
+    """
+
+    stats = dict() if stats is None else stats
+    entry = cache.entry_path(network_key(n_of_families, seed), ".network.npz") if seed is not None else None
+    if entry is not None:
+        try:
+            G, mean_degree = load_network(entry)
+            # mark as recently used
+            os.utime(entry)
+            stats["network_cache"] = "hit"
+            return G, mean_degree
+        except FileNotFoundError:
+            stats["network_cache"] = "miss"
+
+    G = generate_network(n_of_families)
+    mean_degree = mean_weighted_degree(G)
+    if entry is not None:
+        cache.cache_dir.mkdir(parents = True, exist_ok = True)
+        save_network(entry, G, mean_degree)
+        cache.evict()
+    return G, mean_degree
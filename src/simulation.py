@@ -0,0 +1,379 @@
+import os, random, time
+from collections import deque
+
+import numpy as np
+
+from ctns.generator import init_infection
+
+from src.aggregation import series_names, count_network, node_columns
+from src.dumps import dump_types, dump_file, open_dump, close_in_background
+from src.metrics import timer, record_stats
+from src.network import build_network
+from src.steps import step, step_test
+
+
+policies_test = ["Random", "Degree Centrality", "Betweenness Centrality", "Approximate Betweenness"]
+
+# fields of the simulator form with their initial value in the layout
+form_defaults = dict(n_of_families = 150,
+                     number_of_steps = 150,
+                     n_initial_infected_nodes = 5,
+                     incubation_days = 5,
+                     infection_duration = 21,
+                     R_0 = 2.9,
+                     initial_day_restriction = 35,
+                     restriction_duration = 28,
+                     social_distance_strictness = 2,
+                     restriction_decreasing = [],
+                     n_test = 0,
+                     policy_test = "Random",
+                     contact_tracing_efficiency = 80,
+                     contact_tracing_duration = 14,
+                     dump_type = "light",
+                     n_seeds = 1)
+
+
+def check_parameters(n_of_families, use_steps, number_of_steps, incubation_days, infection_duration,
+    initial_day_restriction, restriction_duration, social_distance_strictness, n_initial_infected_nodes,
+    R_0, n_test, policy_test, contact_tracing_efficiency, contact_tracing_duration, dump_type):
+    """
+    Check the simulation parameters, with the same rules of ctns run_simulation
+
+    Raise
+    -----
+    ValueError
+        If any parameter is out of its valid range
+
+    """
+
+    if n_of_families < 10:
+        raise ValueError("Invalid number of families. Use at least 10 families")
+    if use_steps and number_of_steps < 0:
+        raise ValueError("Invalid number of steps")
+    if infection_duration < 0:
+        raise ValueError("Invalid infection duration")
+    if incubation_days < 0 or incubation_days >= infection_duration:
+        raise ValueError("Invalid incubation duration")
+    if initial_day_restriction < 0:
+        raise ValueError("Invalid initial day social distancing")
+    if social_distance_strictness < 0 or social_distance_strictness > 4:
+        raise ValueError("Invalid social distancing value")
+    if n_initial_infected_nodes < 0 or n_initial_infected_nodes > n_of_families:
+        raise ValueError("Invalid number of initial infected nodes")
+    if R_0 < 0:
+        raise ValueError("Invalid value of R0")
+    if n_test < 0:
+        raise ValueError("Invalid number of test per day")
+    if policy_test not in policies_test:
+        raise ValueError("Invalid test strategy")
+    if contact_tracing_efficiency < 0 or contact_tracing_efficiency > 1:
+        raise ValueError("Invalid contact tracing efficiency")
+    if contact_tracing_duration < 0:
+        raise ValueError("Invalid contact tracing duration")
+    if restriction_duration < 0:
+        raise ValueError("Invalid restriction duration")
+    if dump_type not in dump_types:
+        raise ValueError("Invalid dump type")
+
+
+def no_restriction_scenario(scenario):
+    """
+    Build the baseline of a scenario: the same epidemic without social distancing, tests and contact tracing.
+    The parameters that have no effect without interventions are set to fixed values, so that the baseline depends only on
+    n_of_families, number_of_steps, n_initial_infected_nodes, incubation_days, infection_duration, R_0, the seed and the dump type
+    and is shared (e.g. by the result cache) among all the scenarios that differ only in the intervention parameters
+
+    Parameters
+    ----------
+    scenario: dict
+        Keyword arguments of a simulate call
+
+    Return
+    ------
+    baseline: dict
+        Keyword arguments of the baseline simulate call
+
+    """
+
+    baseline = dict(scenario)
+    baseline.update(initial_day_restriction = 0,
+                    restriction_duration = 0,
+                    social_distance_strictness = 0,
+                    restriction_decreasing = False,
+                    n_test = 0,
+                    policy_test = "Random",
+                    contact_tracing_efficiency = 0,
+                    contact_tracing_duration = 0)
+    return baseline
+
+
+def extinct(net):
+    """
+    Check if the epidemic is over: no node is exposed or infected, so people status cannot change anymore
+
+    Parameters
+    ----------
+    net: ig.Graph()
+        The contact network of a day
+
+    Return
+    ------
+    extinct: bool
+        True if no node is exposed or infected
+
+    """
+
+    return not any(status == "E" or status == "I" for status in net.vs["agent_status"])
+
+
+def form_scenarios(form, path):
+    """
+    Build the simulations of a filled simulator form: the scenario with restriction and its baseline without restriction
+    (see no_restriction_scenario) for each seed of the ensemble. Each run is cached, so growing the ensemble only simulates the new seeds
+
+    Parameters
+    ----------
+    form: dict
+        Value of the fields of the simulator form, the missing ones take the value of form_defaults.
+        contact_tracing_efficiency is in percent, restriction_decreasing is [1] (or True) when checked
+
+    path: string
+        Dump path of the first scenario with restriction, the others are derived from it
+
+    Return
+    ------
+    scenarios: list of dict
+        Keyword arguments of simulate of each run, the scenario with restriction and its baseline seed after seed
+
+    paths: list of string
+        Dump path of the scenario with restriction of each seed
+
+    paths_no_rest: list of string
+        Dump path of the baseline of each seed
+
+    """
+
+    form = dict(form_defaults, **{name: value for name, value in form.items() if name in form_defaults})
+    path = str(path)
+    path_no_rest = path + "no_restr"
+
+    scenario = dict(use_steps = True,
+                    n_of_families = form["n_of_families"],
+                    number_of_steps = form["number_of_steps"],
+                    incubation_days = form["incubation_days"],
+                    infection_duration = form["infection_duration"],
+                    initial_day_restriction = form["initial_day_restriction"],
+                    restriction_duration = form["restriction_duration"],
+                    social_distance_strictness = form["social_distance_strictness"],
+                    restriction_decreasing = form["restriction_decreasing"] == [1] or form["restriction_decreasing"] is True,
+                    n_initial_infected_nodes = form["n_initial_infected_nodes"],
+                    R_0 = form["R_0"],
+                    n_test = form["n_test"],
+                    policy_test = form["policy_test"],
+                    contact_tracing_efficiency = form["contact_tracing_efficiency"] / 100,
+                    contact_tracing_duration = form["contact_tracing_duration"],
+                    path = path,
+                    use_random_seed = True,
+                    seed = 0,
+                    dump_type = form["dump_type"],
+                    stop_on_extinction = True,
+                    )
+
+    scenarios = list()
+    paths = list()
+    paths_no_rest = list()
+    for seed in range(form["n_seeds"] or 1):
+        scenario_seed = dict(scenario, seed = seed, path = path + ("_seed" + str(seed) if seed > 0 else ""))
+        scenario_seed_no_rest = no_restriction_scenario(scenario_seed)
+        scenario_seed_no_rest["path"] = path_no_rest + ("_seed" + str(seed) if seed > 0 else "")
+        scenarios += [scenario_seed, scenario_seed_no_rest]
+        paths.append(scenario_seed["path"])
+        paths_no_rest.append(scenario_seed_no_rest["path"])
+    return scenarios, paths, paths_no_rest
+
+
+def simulate(n_of_families = 500,
+    use_steps = True,
+    number_of_steps = 150,
+    incubation_days = 5,
+    infection_duration = 21,
+    initial_day_restriction = 50,
+    restriction_duration = 21,
+    social_distance_strictness = 2,
+    restriction_decreasing = True,
+    n_initial_infected_nodes = 10,
+    R_0 = 2.9,
+    n_test = 5,
+    policy_test = "Random",
+    contact_tracing_efficiency = 0.8,
+    contact_tracing_duration = 14,
+    use_random_seed = None,
+    seed = None,
+    dump_type = "full",
+    path = None,
+    stop_on_extinction = False,
+    on_step = None,
+    stats = None,
+    persist = "sync",
+    node_states = None,
+    on_persisted = None):
+    """
+    Execute the simulation, dump the resulting networks and return the daily series. Same as ctns run_simulation,
+    with the addition of a hook called at the end of each simulated day, of the early stop, of timing statistics
+    and of the results returned in memory, so that they are not read back from the dump
+
+    Parameters
+    ----------
+    n_of_families ... path:
+        See ctns run_simulation
+
+    stop_on_extinction: bool
+        With use_steps, stop simulating the contacts and the spreading once no node is exposed or infected (see
+        extinct): people status cannot change anymore, only the tests and the quarantines go on, on the contacts of
+        the last day. The random tests differ from a full run, since the random draws of the contacts are skipped
+
+    on_step: callable
+        Called as on_step(step_index, net) after each simulated day, where net is the contact network of that day.
+        Also called for the days filled after an early stop, with the network of the last simulated day
+
+    stats: dict
+        If given, the seconds spent in the "network", "simulate" and "write" stages are added under "seconds",
+        and "dump_bytes" and the "network_cache" result are set, e.g. to send them back from a worker process.
+        Else they are recorded in the metrics of this process, see src.metrics.
+        With persist "async" the write seconds and dump_bytes are complete only when on_persisted is called
+
+    persist: string
+        "sync" to write the dump before returning, "async" to write it in a background thread after returning
+        (see dumps.close_in_background), "none" to write no dump
+
+    node_states: dict
+        If given, filled with the agent_status (see aggregation.status_codes), test_result and quarantine
+        of each node on each day, as (days, nodes) int8 matrices
+
+    on_persisted: callable
+        Called as on_persisted(series) once the dump is written, in the background thread with persist "async"
+
+    Return
+    ------
+    series: dict
+        A numpy array with one value per day for each name in series_names, same as load_series of the dump
+
+    Raise
+    -----
+    ValueError
+        If any parameter is out of its valid range
+
+    """
+
+    # generate new edges
+    if use_random_seed:
+        np.random.seed(seed = seed)
+        random.seed(seed)
+    else:
+        np.random.seed(int(time.time()))
+        random.seed(time.time())
+
+    check_parameters(n_of_families, use_steps, number_of_steps, incubation_days, infection_duration,
+        initial_day_restriction, restriction_duration, social_distance_strictness, n_initial_infected_nodes,
+        R_0, n_test, policy_test, contact_tracing_efficiency, contact_tracing_duration, dump_type)
+    if persist not in ["sync", "async", "none"]:
+        raise ValueError("Invalid persist " + str(persist) + ", use sync, async or none")
+
+    if restriction_duration == 0:
+        restriction_decreasing = False
+        social_distance_strictness = 0
+    if social_distance_strictness == 0:
+        restriction_decreasing = False
+        restriction_duration = 0
+
+    config = locals()
+    del config["on_step"]
+    del config["stats"]
+    del config["persist"]
+    del config["node_states"]
+    del config["on_persisted"]
+
+    run_stats = dict() if stats is None else stats
+    seconds = run_stats.setdefault("seconds", dict())
+
+    # init network, generated once for each n_of_families and seed
+    with timer("network", seconds):
+        G, mean_degree = build_network(n_of_families, seed if use_random_seed else None, run_stats)
+    transmission_rate = R_0 / ((infection_duration - incubation_days) * mean_degree)
+    init_infection(G, n_initial_infected_nodes)
+
+    nets = deque(maxlen = contact_tracing_duration)
+    writer = open_dump(path, dump_type, config) if persist != "none" else None
+    daily = list()
+    columns = list()
+
+    sim_index = 0
+    while not use_steps or sim_index < number_of_steps:
+        with timer("simulate", seconds):
+            net = step(G, sim_index, incubation_days, infection_duration, transmission_rate,
+                             initial_day_restriction, restriction_duration, social_distance_strictness,
+                             restriction_decreasing, nets, n_test, policy_test, contact_tracing_efficiency)
+            nets.append(net.copy())
+        if writer is not None:
+            with timer("write", seconds):
+                writer.append(net)
+        daily.append(count_network(net))
+        if node_states is not None:
+            columns.append(node_columns(net))
+        if on_step is not None:
+            on_step(sim_index, net)
+        sim_index += 1
+
+        # without a fixed number of steps, go on untill the spreading is over
+        if (not use_steps or stop_on_extinction) and extinct(net):
+            break
+
+    # the epidemic is over before the last step: the people status cannot change anymore, but the quarantines go on
+    # counting down and the tests go on. Only the tests are simulated, on the contacts of the last day, since the new
+    # contacts could change nothing but the ranking of a centrality policy. Once nobody is in quarantine and no test
+    # is made, nothing changes anymore
+    while use_steps and sim_index < number_of_steps and (n_test > 0 or max(G.vs["quarantine"]) > 0):
+        with timer("simulate", seconds):
+            step_test(G, nets, incubation_days, n_test, policy_test, contact_tracing_efficiency)
+        if writer is not None:
+            with timer("write", seconds):
+                writer.append(net)
+        daily.append(count_network(net))
+        if node_states is not None:
+            columns.append(node_columns(net))
+        if on_step is not None:
+            on_step(sim_index, net)
+        sim_index += 1
+
+    if use_steps and sim_index < number_of_steps:
+        if writer is not None:
+            with timer("write", seconds):
+                writer.repeat(number_of_steps - sim_index)
+        daily.extend([daily[-1]] * (number_of_steps - sim_index))
+        columns.extend(columns[-1:] * (number_of_steps - sim_index))
+        if on_step is not None:
+            for step_index in range(sim_index, number_of_steps):
+                on_step(step_index, net)
+
+    series = {name: np.asarray([counts[name] for counts in daily], dtype = np.int64) for name in series_names}
+    if node_states is not None:
+        for name in ["agent_status", "test_result", "quarantine"]:
+            node_states[name] = np.stack([day[name] for day in columns])
+
+    def persisted():
+        run_stats["dump_bytes"] = os.path.getsize(dump_file(path, dump_type))
+        if stats is None:
+            record_stats(run_stats)
+        if on_persisted is not None:
+            on_persisted(series)
+
+    if persist == "sync":
+        with timer("write", seconds):
+            writer.close()
+        persisted()
+    elif persist == "async":
+        close_in_background(writer, persisted, seconds)
+    elif stats is None:
+        record_stats(run_stats)
+
+    return series
@@ -0,0 +1,173 @@
+import random
+
+from ctns.steps import step_edges, step_spread, compute_sd_reduction
+
+from src.centrality import centrality_policies, rank
+
+
+def test_node(node, incubation_days, found_positive):
+    """
+    Test a node, a positive node goes in quarantine
+
+    Parameters
+    ----------
+    node: ig.Vertex
+        The node to test
+
+    incubation_days: int
+        Average number of days where the patient is not infective
+
+    found_positive: set
+        Index of the nodes found positive, updated in place
+
+    Return
+    ------
+    None
+
+    """
+
+    if node["infected"]:
+        node["test_result"] = 1
+        node["quarantine"] = 14
+        node["test_validity"] = 14
+        found_positive.add(node.index)
+    else:
+        node["test_result"] = 0
+        node["test_validity"] = incubation_days
+
+
+def step_test(G, nets, incubation_days, n_new_test, policy_test, contact_tracing_efficiency):
+    """
+    Test some nodes of the network and put the in quarantine if needed. Same as ctns step_test, but the centrality
+    policies rank the nodes with src.centrality, that caches the betweenness of the network components
+
+    Parameters
+    ----------
+    G: ig.Graph()
+        The contact network
+
+    nets: list of ig.Graph()
+        History of the network
+
+    incubation_days: int
+        Average number of days where the patient is not infective
+
+    n_new_test: int
+        Number of new avaiable tests
+
+    policy_test: string
+        Test strategy, one of policies_test
+
+    contact_tracing_efficiency: float
+        The percentage of contacts successfully traced
+
+    Return
+    ------
+    None
+
+    """
+
+    # create pool of nodes to test
+    high_priority_test_pool = set()
+    low_priority_test_pool = set()
+    for node in G.vs:
+        # update quarantine
+        if node["quarantine"] > 0:
+            node["quarantine"] -= 1
+            # if node has been found positive and quarantine is over, re-test the node
+            if node["quarantine"] == 0 and node["test_result"] == 1:
+                high_priority_test_pool.add(node.index)
+        # update test validity
+        if node["test_validity"] > 0:
+            node["test_validity"] -= 1
+        # if node is not dead, if test validity is expired, if node is not a known recovered, add to low priority test pool
+        if node["agent_status"] != "D" and node["test_validity"] <= 0 \
+         and not (node["test_result"] == 0 and node["agent_status"] == "R"):
+            low_priority_test_pool.add(node.index)
+
+    low_priority_test_pool = low_priority_test_pool - high_priority_test_pool
+    found_positive = set()
+    for index in high_priority_test_pool:
+        test_node(G.vs[index], incubation_days, found_positive)
+
+    if n_new_test > 0:
+        if policy_test in centrality_policies:
+            to_test = rank(G, list(low_priority_test_pool), policy_test)[:n_new_test]
+        else:
+            low_priority_test_pool = [G.vs[i] for i in low_priority_test_pool]
+            to_test = [node.index for node in random.sample(low_priority_test_pool, min(len(low_priority_test_pool), n_new_test))]
+        for index in to_test:
+            test_node(G.vs[index], incubation_days, found_positive)
+
+    # to_quarantine will contain family contacts (quarantine 100%),
+    # possibly_quarantine will contain other contacts, quarantine influenced by contact tracing efficiency
+    if len(found_positive) > 0 and len(nets) > 0:
+        to_quarantine = set()
+        possibly_quarantine = set()
+        # trace contacts
+        for net in nets:
+            for edge in net.es:
+                if edge["category"] == "family_contacts" \
+                and (edge.source in found_positive or edge.target in found_positive):
+                    if edge.source in found_positive:
+                        to_quarantine.add(edge.target)
+                    else:
+                        to_quarantine.add(edge.source)
+                else:
+                    if edge.source in found_positive:
+                        possibly_quarantine.add(edge.target)
+                    if edge.target in found_positive:
+                        possibly_quarantine.add(edge.source)
+
+        # set diff to remove double contacts
+        possibly_quarantine = possibly_quarantine - to_quarantine
+        if len(possibly_quarantine) > int(len(possibly_quarantine) * contact_tracing_efficiency):
+            # random.sample on a set is the sample of its iteration order
+            possibly_quarantine = random.sample(tuple(possibly_quarantine), int(len(possibly_quarantine) * contact_tracing_efficiency))
+        else:
+            possibly_quarantine = list(possibly_quarantine)
+
+        # put them in quarantine
+        for index in list(to_quarantine) + possibly_quarantine:
+            G.vs[index]["quarantine"] = 14
+
+
+def step(G, step_index, incubation_days, infection_duration, transmission_rate,
+         initial_day_restriction, restriction_duration, social_distance_strictness,
+         restriction_decreasing, nets, n_test, policy_test, contact_tracing_efficiency):
+    """
+    Advance the simulation of one step. Same as ctns step, with step_test of this module
+
+    Parameters
+    ----------
+    G ... contact_tracing_efficiency:
+        See ctns step
+
+    Return
+    ------
+    G: ig.Graph()
+        The contact network
+
+    """
+
+    # generate new edges
+    if not restriction_duration:
+        if step_index >= initial_day_restriction:
+            step_edges(G, 1 - (25 * social_distance_strictness / 100))
+        else:
+            step_edges(G, 1)
+    else:
+        if step_index >= initial_day_restriction and step_index < initial_day_restriction + restriction_duration:
+            if restriction_decreasing:
+                social_distance_strictness = compute_sd_reduction(step_index, initial_day_restriction, restriction_duration, social_distance_strictness)
+            step_edges(G, 1 - (25 * social_distance_strictness / 100))
+        else:
+            step_edges(G, 1)
+
+    # spread infection
+    step_spread(G, incubation_days, infection_duration, transmission_rate)
+
+    # make some test on nodes
+    step_test(G, nets, incubation_days, n_test, policy_test, contact_tracing_efficiency)
+
+    return G
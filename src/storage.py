@@ -0,0 +1,236 @@
+import gzip, lzma, os, time
+from pathlib import Path
+
+try:
+    # standard library from python 3.14
+    from compression import zstd
+except ImportError:
+    try:
+        from backports import zstd
+    except ImportError:
+        zstd = None
+
+
+# codec of the pickle based dumps (full, light, stream). Columnar dumps are never compressed, they are memory-mapped.
+# Pickling the networks costs much more than compressing them, zstd is almost free and shrinks full dumps about 10 times
+dump_codec = os.environ.get("SIMULATOR_DUMP_CODEC", "zstd" if zstd is not None else "gzip")
+
+# compression level of each codec, see python -m benchmarks.dump_codecs for the trade-off between size and speed
+codec_levels = {"gzip": 3, "lzma": 1, "zstd": 3}
+
+# magic bytes at the beginning of a compressed file, files without magic are not compressed
+codec_magics = {"gzip": b"\x1f\x8b", "lzma": b"\xfd7zXZ\x00", "zstd": b"\x28\xb5\x2f\xfd"}
+
+# extension added after the one of the dump type, so that a .pickle file is always a plain pickle
+codec_extensions = {"none": "", "gzip": ".gz", "lzma": ".xz", "zstd": ".zst"}
+
+# byte budget of the results in simulator_results (cached results excluded, they have their own budget). 0 for no limit
+results_dir = Path("simulator_results")
+max_results_bytes = int(os.environ.get("SIMULATOR_RESULTS_BYTES", 2 * 1024 * 1024 * 1024))
+# results written or read more recently are never evicted, e.g. the ones of a job still running
+min_age = 300
+result_suffixes = [base + extension for base in [".pickle", ".stream"] for extension in codec_extensions.values()] + [".columnar"]
+
+
+def available_codecs():
+    """
+    Return the codecs that can be used in this installation: none, gzip, lzma and zstd (python 3.14 or backports.zstd)
+    """
+
+    return ["none", "gzip", "lzma"] + (["zstd"] if zstd is not None else [])
+
+
+def result_suffix(file):
+    """
+    Return the extension of a result file, including the codec extension if it is compressed (e.g. .pickle.zst)
+    """
+
+    file = Path(file)
+    if file.suffix and file.suffix in codec_extensions.values():
+        return Path(file.stem).suffix + file.suffix
+    return file.suffix
+
+
+def open_write(file, codec = None):
+    """
+    Open a file for writing through a codec. The compression is streamed, the data is compressed as it is written
+
+    Parameters
+    ----------
+    file: string
+        Path of the file
+
+    codec: string
+        One of available_codecs, default dump_codec
+
+    Return
+    ------
+    f: file object
+        Binary file object, closing it finishes the compressed file
+
+    Raise
+    -----
+    ValueError
+        If the codec is unknown or not available
+
+    """
+
+    codec = dump_codec if codec is None else codec
+    if codec not in available_codecs():
+        raise ValueError("Codec " + str(codec) + " is not available, use one of " + ", ".join(available_codecs()))
+    if codec == "gzip":
+        return gzip.open(file, "wb", compresslevel = codec_levels["gzip"])
+    if codec == "lzma":
+        return lzma.open(file, "wb", preset = codec_levels["lzma"])
+    if codec == "zstd":
+        return zstd.open(file, "wb", level = codec_levels["zstd"])
+    return open(file, "wb")
+
+
+def file_codec(file):
+    """
+    Detect the codec of a file from its first bytes
+
+    Parameters
+    ----------
+    file: string
+        Path of the file
+
+    Return
+    ------
+    codec: string
+        One of "none", "gzip", "lzma", "zstd"
+
+    """
+
+    with open(file, "rb") as f:
+        head = f.read(8)
+    for codec, magic in codec_magics.items():
+        if head.startswith(magic):
+            return codec
+    return "none"
+
+
+def open_read(file):
+    """
+    Open a file written by open_write with any codec, the data is decompressed as it is read
+
+    Parameters
+    ----------
+    file: string
+        Path of the file
+
+    Return
+    ------
+    f: file object
+        Binary file object
+
+    Raise
+    -----
+    ValueError
+        If the file is compressed with zstd and zstd is not available
+
+    """
+
+    codec = file_codec(file)
+    if codec == "gzip":
+        return gzip.open(file, "rb")
+    if codec == "lzma":
+        return lzma.open(file, "rb")
+    if codec == "zstd":
+        if zstd is None:
+            raise ValueError("File " + str(file) + " is compressed with zstd, install backports.zstd to read it")
+        return zstd.open(file, "rb")
+    return open(file, "rb")
+
+
+def evict_lru(files, max_bytes, max_entries = None, keep_after = None):
+    """
+    Remove the least recently used files (by modification time) until the others fit in max_bytes and max_entries
+
+    Parameters
+    ----------
+    files: iterable of Path
+        The candidate files
+
+    max_bytes: int
+        Byte budget of the files
+
+    max_entries: int
+        Maximum number of files, default no limit
+
+    keep_after: float
+        Files modified after this time are kept anyway, default none
+
+    Return
+    ------
+    removed: int
+        Number of removed files
+
+    """
+
+    entries = []
+    for entry in files:
+        try:
+            stat = entry.stat()
+        except FileNotFoundError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, entry))
+    entries.sort(reverse = True)
+
+    removed = 0
+    total_bytes = 0
+    for count, (mtime, size, entry) in enumerate(entries):
+        total_bytes += size
+        if keep_after is not None and mtime > keep_after:
+            continue
+        if (max_entries is not None and count >= max_entries) or total_bytes > max_bytes:
+            try:
+                entry.unlink()
+                removed += 1
+            except FileNotFoundError:
+                pass
+    return removed
+
+
+def touch(file):
+    """
+    Mark a result as recently used
+    """
+
+    try:
+        os.utime(file)
+    except FileNotFoundError:
+        pass
+
+
+def enforce_quota(directory = None, max_bytes = None, exclude = None):
+    """
+    Remove the least recently used results in simulator_results until they fit in the byte budget
+
+    Parameters
+    ----------
+    directory: string
+        Folder of the results, searched recursively, default results_dir
+
+    max_bytes: int
+        Byte budget, default max_results_bytes. 0 for no limit
+
+    exclude: list of Path
+        Folders not managed by the quota, e.g. the result cache
+
+    Return
+    ------
+    removed: int
+        Number of removed results
+
+    """
+
+    directory = Path(results_dir if directory is None else directory)
+    max_bytes = max_results_bytes if max_bytes is None else max_bytes
+    if max_bytes <= 0:
+        return 0
+    exclude = [Path(folder).resolve() for folder in exclude or []]
+    files = [file for file in directory.rglob("*") if result_suffix(file) in result_suffixes
+             and not any(folder in file.resolve().parents for folder in exclude)]
+    return evict_lru(files, max_bytes, keep_after = time.time() - min_age)
@@ -0,0 +1,212 @@
+import itertools, json
+from pathlib import Path
+
+import numpy as np
+
+from src.dumps import dump_file
+
+
+# parameters that can be swept, with the label used in the charts
+sweep_parameters = {'social_distance_strictness': 'Social distance strictness',
+                    'n_test': 'Daily number of test',
+                    'contact_tracing_efficiency': 'Contact tracing efficiency (%)',
+                    'R_0': 'R_0'}
+
+# summary metrics stored for each point of the grid
+sweep_metrics = {'total_infected': 'Total infected',
+                 'total_dead': 'Total dead',
+                 'peak_infected': 'Peak of infected',
+                 'peak_day': 'Day of the peak'}
+
+# bigger grids are rejected
+max_points = 500
+
+sweep_dir = Path("simulator_results/sweeps")
+
+
+def parse_values(text, cast = float):
+    """
+    Parse a comma separated list of values, e.g. "0, 1, 2"
+
+    Parameters
+    ----------
+    text: string
+        The values
+
+    cast: callable
+        Type of the values
+
+    Return
+    ------
+    values: list
+        The parsed values, in the given order and without duplicates
+
+    Raise
+    -----
+    ValueError
+        If a value cannot be parsed
+
+    """
+
+    values = list()
+    for token in str(text or "").split(","):
+        if token.strip() != "":
+            value = cast(token.strip())
+            if value not in values:
+                values.append(value)
+    return values
+
+
+def expand_grid(base, grid, directory):
+    """
+    Expand a parameter grid in the scenarios to simulate, one per point
+
+    Parameters
+    ----------
+    base: dict
+        Keyword arguments of simulate shared by all the points
+
+    grid: dict
+        Name of a swept parameter and list of its values
+
+    directory: string
+        Folder where the dump of each point is written
+
+    Return
+    ------
+    points: list of dict
+        The value of the swept parameters of each point
+
+    scenarios: list of dict
+        Keyword arguments of simulate of each point
+
+    """
+
+    names = list(grid.keys())
+    points = list()
+    scenarios = list()
+    for index, values in enumerate(itertools.product(*[grid[name] for name in names])):
+        point = dict(zip(names, values))
+        scenario = dict(base, **point)
+        if 'contact_tracing_efficiency' in point:
+            scenario['contact_tracing_efficiency'] = point['contact_tracing_efficiency'] / 100
+        scenario['dump_type'] = 'light'
+        scenario['stop_on_extinction'] = True
+        scenario['path'] = str(Path(directory) / ("point_" + str(index)))
+        points.append(point)
+        scenarios.append(scenario)
+    if len(points) > max_points:
+        raise ValueError("The grid has " + str(len(points)) + " points, the maximum is " + str(max_points))
+    return points, scenarios
+
+
+def summarize(series):
+    """
+    Compact summary of a simulation
+
+    Parameters
+    ----------
+    series: dict
+        Daily series of the simulation, see load_series
+
+    Return
+    ------
+    metrics: dict
+        The value of each one of sweep_metrics
+
+    """
+
+    infected = series['E'] + series['I']
+    return dict(total_infected = int(series['total'][-1] - series['S'][-1]),
+                total_dead = int(series['D'][-1]),
+                peak_infected = int(infected.max()),
+                peak_day = int(np.argmax(infected)) + 1)
+
+
+def collect(sweep_id, points, scenarios, series):
+    """
+    Summarize the simulated points of a sweep, delete their dumps and save the summaries
+    in simulator_results/sweeps/<sweep_id>.json
+
+    Parameters
+    ----------
+    sweep_id: string
+        Id of the sweep
+
+    points: list of dict
+        The value of the swept parameters of each point, see expand_grid
+
+    scenarios: list of dict
+        Keyword arguments of simulate of each point, see expand_grid
+
+    series: list of dict
+        Daily series of each point, as sent back by the simulations, see jobs.results
+
+    Return
+    ------
+    records: list of dict
+        For each point, the swept parameters and the summary metrics
+
+    """
+
+    records = list()
+    for point, scenario, point_series in zip(points, scenarios, series):
+        records.append(dict(point, **summarize(point_series)))
+        # the full result is still in the result cache, keep only the summary here.
+        # The dump may be gone already, e.g. collected before or evicted by the quota of simulator_results
+        Path(dump_file(scenario['path'], scenario['dump_type'])).unlink(missing_ok = True)
+    for directory in set(Path(scenario['path']).parent for scenario in scenarios):
+        try:
+            directory.rmdir()
+        except OSError:
+            pass
+
+    sweep_dir.mkdir(parents = True, exist_ok = True)
+    with open(sweep_dir / (sweep_id + ".json"), "w") as f:
+        json.dump(records, f)
+    return records
+
+
+def metric_grid(records, x, y, metric):
+    """
+    Reduce the records of a sweep to a 2D grid of a metric, averaging over the parameters not on the axes
+
+    Parameters
+    ----------
+    records: list of dict
+        Records returned by collect
+
+    x: string
+        Swept parameter on the x axis
+
+    y: string
+        Swept parameter on the y axis
+
+    metric: string
+        One of sweep_metrics
+
+    Return
+    ------
+    x_values: list
+        Sorted values of x
+
+    y_values: list
+        Sorted values of y
+
+    z: np.ndarray
+        (len(y_values), len(x_values)) mean value of the metric, nan where there are no points
+
+    """
+
+    x_values = sorted(set(record[x] for record in records))
+    y_values = sorted(set(record[y] for record in records))
+    total = np.zeros((len(y_values), len(x_values)))
+    count = np.zeros((len(y_values), len(x_values)))
+    for record in records:
+        row = y_values.index(record[y])
+        column = x_values.index(record[x])
+        total[row, column] += record[metric]
+        count[row, column] += 1
+    with np.errstate(invalid = 'ignore'):
+        z = total / count
+    return x_values, y_values, z
@@ -0,0 +1,57 @@
+import time
+
+from src import cache, catalog, jobs, metrics
+from src.simulation import form_scenarios
+
+
+def wait(condition, timeout = 120):
+    """
+    Poll until condition() returns a true value, and return it
+    """
+
+    start = time.time()
+    while time.time() - start < timeout:
+        value = condition()
+        if value:
+            return value
+        time.sleep(0.2)
+    raise TimeoutError("Condition not met in " + str(timeout) + " seconds")
+
+
+def dump_bytes():
+    jobs.drain_updates()
+    return sum(value for name, labels, value in metrics.dump_bytes.samples())
+
+
+def run_job(form, path, persist):
+    """
+    Submit the scenarios of a form, wait for the job and return its status and results
+    """
+
+    scenarios, paths, paths_no_rest = form_scenarios(form, path)
+    job_id = jobs.submit(scenarios, record = True, persist = persist)
+    wait(lambda: jobs.status(job_id)["state"] in ["done", "failed"])
+    job = jobs.status(job_id)
+    assert job["state"] == "done", job["error"]
+    results = jobs.results(job_id)
+    assert sorted(results) == sorted(paths + paths_no_rest)
+    return results
+
+
+def test_same_job_twice(tmp_path, monkeypatch):
+    # the worker processes are forked with the results, cache and catalog of the test
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(cache, "cache_dir", tmp_path / "cache")
+    monkeypatch.setattr(catalog, "catalog_file", tmp_path / "catalog.sqlite")
+    for persist, n_of_families in [("sync", 20), ("async", 21)]:
+        form = dict(n_of_families = n_of_families, number_of_steps = 15, n_seeds = 1)
+        written = dump_bytes()
+        # the second job is copied from the result cache
+        first = run_job(form, tmp_path / (persist + "_first"), persist)
+        second = run_job(form, tmp_path / (persist + "_second"), persist)
+        for path_first, path_second in zip(sorted(first), sorted(second)):
+            assert (first[path_first]["series"]["I"] == second[path_second]["series"]["I"]).all()
+        # the dumps written in background are recorded in the metrics too
+        wait(lambda: dump_bytes() > written)
+
+    wait(lambda: len(catalog.list_runs()) == 8)